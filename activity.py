@@ -0,0 +1,161 @@
+import os
+import logging
+import threading
+import collections
+from datetime import date, timedelta
+
+import db
+import db_async
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+# Як часто накопичена активність пишеться в БД (сек.)
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "30"))
+# Скільки користувачів тримати у пам'яті з відомими last_activity/стріком/username
+ACTIVITY_CACHE_SIZE = int(os.getenv("ACTIVITY_CACHE_SIZE", "50000"))
+
+
+class ActivityTracker:
+    """
+    Write-behind для username / last_activity / щоденного стріку.
+
+    touch() на кожне повідомлення лише оновлює словник у пам'яті; якщо відомо, що
+    користувач сьогодні вже активний і username не змінився — не робиться нічого.
+    Накопичене пишеться flush() одним пакетним UPDATE (db.flush_activity).
+    Якщо відомо, що цей дотик дасть нагороду за стрік, touch() повертає True —
+    тоді хендлер одразу робить flush_user(), щоб показати нагороду. Нагороди, нараховані
+    фоновим flush(), показуються при наступному повідомленні (pop_reward()).
+    """
+
+    def __init__(self, max_users=ACTIVITY_CACHE_SIZE):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._pending = {}                          # user_id -> [username | None, [дні]]
+        self._known = collections.OrderedDict()     # user_id -> [last_activity, streak_days, username]
+        self._rewards = {}                          # user_id -> (streak, reward) ще не показані
+
+    # -----------------------------
+    # Відомий стан
+    # -----------------------------
+    def _remember(self, user_id, last_activity=None, streak_days=None, username=None):
+        known = self._known.get(user_id)
+        if known is None:
+            known = self._known[user_id] = [None, None, None]
+            while len(self._known) > self.max_users:
+                self._known.popitem(last=False)
+        else:
+            self._known.move_to_end(user_id)
+        if last_activity is not None:
+            known[0], known[1] = last_activity, streak_days
+        if username is not None:
+            known[2] = username
+
+    def on_event(self, event, payload):
+        # Стрік оновлено напряму (record_answer) — наш дотик за цей день уже не змінить його
+        if event == "streak_changed" and payload.get("last_activity") is not None:
+            with self._lock:
+                self._remember(payload["user_id"], payload["last_activity"], payload["streak_days"])
+
+    # -----------------------------
+    # Дотики
+    # -----------------------------
+    def touch(self, user_id, username=None, today=None):
+        today = today or date.today()
+        with self._lock:
+            known = self._known.get(user_id)
+            need_day = known is None or known[0] != today
+            need_name = bool(username) and (known is None or known[2] != username)
+            if not need_day and not need_name:
+                return False
+
+            entry = self._pending.setdefault(user_id, [None, []])
+            if need_name:
+                entry[0] = username
+            if not need_day:
+                return False
+            if today not in entry[1]:
+                entry[1].append(today)
+            # Нагорода очікується, лише якщо точно відомо, що вчора стрік був активний
+            return (
+                known is not None and known[0] == today - timedelta(days=1)
+                and (known[1] or 0) + 1 in db.DAILY_STREAK_REWARDS
+            )
+
+    def _take(self, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                taken, self._pending = self._pending, {}
+            else:
+                taken = {uid: self._pending.pop(uid) for uid in user_ids if uid in self._pending}
+        return taken
+
+    def _restore(self, taken):
+        with self._lock:
+            for user_id, (username, days) in taken.items():
+                entry = self._pending.setdefault(user_id, [None, []])
+                entry[0] = entry[0] or username
+                entry[1] = sorted(set(days) | set(entry[1]))
+
+    def _write(self, taken):
+        """Синхронний запис: дні кожного користувача — по черзі, один UPDATE на «раунд»."""
+        results = {}
+        rounds = max((len(days) for _, days in taken.values()), default=0)
+        for i in range(max(rounds, 1)):
+            rows = []
+            for user_id, (username, days) in taken.items():
+                if i < len(days):
+                    rows.append((user_id, username if i == 0 else None, days[i]))
+                elif i == 0 and username:
+                    rows.append((user_id, username, None))   # лише зміна username
+            for user_id, last_activity, streak_days, reward in db.flush_activity(rows):
+                earlier = results.get(user_id, (None, None, 0))[2]
+                results[user_id] = (last_activity, streak_days, earlier + reward)
+        with self._lock:
+            for user_id, (last_activity, streak_days, reward) in results.items():
+                self._remember(user_id, last_activity, streak_days, taken[user_id][0])
+                if reward:
+                    self._rewards[user_id] = (streak_days, reward)
+        return results
+
+    async def flush(self):
+        taken = self._take()
+        if not taken:
+            return 0
+        try:
+            await db_async.run_sync(self._write, taken)
+        except Exception as e:
+            logger.error(f"Не вдалося записати активність {len(taken)} користувачів: {e}", exc_info=True)
+            self._restore(taken)
+            return 0
+        return len(taken)
+
+    async def flush_user(self, user_id):
+        """Пише активність одного користувача зараз (щоб одразу показати нагороду)."""
+        taken = self._take([user_id])
+        if taken:
+            try:
+                await db_async.run_sync(self._write, taken)
+            except Exception:
+                self._restore(taken)
+                raise
+
+    def pop_reward(self, user_id):
+        """(streak, reward) нагороди за стрік, ще не показаної користувачу, або (None, 0)."""
+        with self._lock:
+            return self._rewards.pop(user_id, (None, 0))
+
+    def stats(self):
+        with self._lock:
+            return {"pending": len(self._pending), "known": len(self._known), "unshown_rewards": len(self._rewards)}
+
+
+activity_tracker = ActivityTracker()
+db.subscribe(activity_tracker.on_event)
+
+
+async def flush_job(context):
+    await activity_tracker.flush()
@@ -0,0 +1,132 @@
+"""
+Табличний корпус відповідей для handlers/checking.py + швидкість перевірки.
+
+Кожен рядок CORPUS — (task_type, правильні відповіді, текст користувача, is_correct, match_correct).
+Скрипт проганяє корпус через check_answer, друкує розбіжності і для порівняння — що сказала б
+стара перевірка (set рядків). Потім міряє час однієї перевірки зі скомпільованим matcher.
+Код виходу 1 — якщо хоч один рядок корпусу не збігся.
+
+    python -m bench.answer_corpus
+    python -m bench.answer_corpus --iterations 200000
+"""
+import argparse
+import sys
+import time
+
+from handlers.checking import check_answer, matcher_for, cache_info
+
+CORPUS = [
+    # --- числа: дроби, десяткові, кома як десятковий роздільник ---
+    ("open", ["0.5"], "0.5", True, 0),
+    ("open", ["0.5"], "0,5", True, 0),
+    ("open", ["0.5"], "1/2", True, 0),
+    ("open", ["0.5"], ".5", True, 0),
+    ("open", ["1/2"], "0,50", True, 0),
+    ("open", ["1/2"], "2/4", True, 0),
+    ("open", ["0.5"], "0.6", False, 0),
+    ("open", ["-2"], " -2", True, 0),
+    ("open", ["-2"], "−2", True, 0),
+    ("open", ["-2"], "- 2", True, 0),
+    ("open", ["2"], "+2", True, 0),
+    ("open", ["2"], "2.0", True, 0),
+    ("open", ["10"], "1e1", False, 0),
+    ("open", ["-3/4"], "-0,75", True, 0),
+    # --- округлення: автор позначив відповідь «≈» або користувач округлив нескінченний дріб ---
+    ("open", ["1/3"], "0.33", True, 0),
+    ("open", ["1/3"], "0,333", True, 0),
+    ("open", ["1/3"], "0.3", False, 0),
+    ("open", ["1/3"], "0.34", False, 0),
+    ("open", ["≈0.33"], "1/3", True, 0),
+    ("open", ["≈0.33"], "0.33", True, 0),
+    ("open", ["0.33"], "1/3", False, 0),
+    ("open", ["≈1.41"], "1.414", True, 0),
+    ("open", ["≈1.41"], "1.42", False, 0),
+    ("open", ["1.41"], "1.414", False, 0),
+    ("open", ["0.25"], "0.3", False, 0),
+    ("open", ["0.25"], "0.254", False, 0),
+    ("open", ["2.50"], "2.504", False, 0),
+    ("open", ["1/4"], "0.25", True, 0),
+    ("open", ["1/4"], "0.26", False, 0),
+    # --- кілька відповідей, будь-який порядок ---
+    ("open", ["2", "-2"], "2, -2", True, 0),
+    ("open", ["2", "-2"], "-2; 2", True, 0),
+    ("open", ["2", "-2"], "2,-2", True, 0),
+    ("open", ["2", "-2"], "2", False, 0),
+    ("open", ["2", "-2"], "2, -2, 3", False, 0),
+    ("open", ["2", "-2"], "2, 2", False, 0),
+    ("open", ["0.5", "3"], "0,5; 3", True, 0),
+    ("open", ["0.5", "3"], "1/2, 3", True, 0),
+    ("open", ["2", "3"], "2,3", True, 0),
+    ("boss", ["12"], "12", True, 0),
+    # --- текст і варіанти тесту ---
+    ("single", ["Б"], "б", True, 0),
+    ("single", ["В"], "B", True, 0),
+    ("single", ["А"], "a", True, 0),
+    ("single", ["Г"], "В", False, 0),
+    ("single", ["x = 2"], "X=2", True, 0),
+    ("single", ["√2"], " √2 ", True, 0),
+    ("light", ["так"], "Так", True, 0),
+    (None, ["5"], "5", True, 0),
+    # --- відповідності: за позицією ---
+    ("match", ["Б", "А", "Г"], "Б, А, Г", True, 3),
+    ("match", ["Б", "А", "Г"], "БАГ", True, 3),
+    ("match", ["Б", "А", "Г"], "Б, Г, А", False, 1),
+    ("match", ["Б", "А", "Г"], "А, Б, Г", False, 1),
+    ("match", ["Б", "А", "Г"], "Б, А", False, 2),
+    ("match", ["Б", "А", "Г"], "Б, А, Г, Д", False, 3),
+    ("match", ["В", "А", "Г"], "b, a, г", True, 3),
+    # --- відповідності: пари з номерами, будь-який порядок ---
+    ("match", ["1-Б", "2-А", "3-Г"], "1-Б, 2-А, 3-Г", True, 3),
+    ("match", ["1-Б", "2-А", "3-Г"], "3Г, 1Б, 2А", True, 3),
+    ("match", ["1-Б", "2-А", "3-Г"], "1-Б, 2-Г, 3-А", False, 1),
+    ("match", ["1-Б", "2-А", "3-Г"], "1-Б", False, 1),
+    ("match", ["1-Б", "2-А", "3-Г"], "2:А", False, 1),
+    ("match", ["1-Б", "2-А", "3-Г"], "Б, А, Г", True, 3),
+]
+
+
+def _legacy(task_type, expected, text):
+    user_ans = [a.strip() for a in text.replace(';', ',').split(',') if a.strip()]
+    correct_ans = [str(a).strip() for a in expected]
+    if task_type == "match":
+        return len(set(user_ans) & set(correct_ans)) == len(correct_ans) and len(user_ans) == len(correct_ans)
+    return set(user_ans) == set(correct_ans)
+
+
+def _per_call_us(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50_000)
+    args = parser.parse_args()
+
+    failed = 0
+    legacy_wrong = 0
+    for n, (task_type, expected, text, is_correct, match_correct) in enumerate(CORPUS):
+        task = {"id": n, "task_type": task_type, "answer": expected}
+        result = check_answer(task, text)
+        if (result.is_correct, result.match_correct) != (is_correct, match_correct):
+            failed += 1
+            print(f"FAIL {task_type!s:<7} {expected!r:<22} {text!r:<18} "
+                  f"expected ({is_correct}, {match_correct}), got ({result.is_correct}, {result.match_correct})")
+        if _legacy(task_type, expected, text) != is_correct:
+            legacy_wrong += 1
+    print(f"Корпус: {len(CORPUS)} рядків, розбіжностей: {failed}; стара перевірка помилилась би в {legacy_wrong}.")
+
+    task = {"id": 1, "task_type": "open", "answer": ["2", "-2"]}
+    compiled = matcher_for(task)
+    print(f"check_answer, µs:            {_per_call_us(lambda: check_answer(task, '-2; 2'), args.iterations):.2f}")
+    print(f"matcher.check, µs:           {_per_call_us(lambda: compiled.check('-2; 2'), args.iterations):.2f}")
+    print(f"стара перевірка (set), µs:   {_per_call_us(lambda: _legacy('open', ['2', '-2'], '-2; 2'), args.iterations):.2f}")
+    print(f"кеш matcher-ів: {cache_info()}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
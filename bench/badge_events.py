@@ -0,0 +1,46 @@
+"""
+Перевірка, що бали в leaderboard збігаються з БД після бейджа з нагородою (потрібна робоча БД з PG_* змінних).
+
+add_score доводить тестового користувача до 100+ балів; BadgeEngine у обробнику події score_changed
+відкриває «Сотий крок» (+50), і unlock_badges сам генерує score_changed з новими балами.
+Leaderboard має отримати обидві події в порядку commit, тобто закінчити з балами з БД.
+Тестовий користувач створюється і видаляється скриптом. Код виходу 1 — якщо бали розійшлися.
+
+    python -m bench.badge_events
+"""
+import sys
+
+import db
+# Порядок підписки як у боті: BadgeEngine раніше за leaderboard
+from handlers.badges import badge_engine
+from leaderboard import leaderboard
+
+TEST_USER_ID = 9_000_000_000_002
+BONUS_BADGE = "Сотий крок"
+
+
+def main():
+    db.init_db()
+    with db.connect() as con:
+        cur = con.cursor()
+        cur.execute("DELETE FROM users WHERE id = %s", (TEST_USER_ID,))
+        cur.execute("INSERT INTO users (id, score) VALUES (%s, 0)", (TEST_USER_ID,))
+
+    try:
+        db.add_score(TEST_USER_ID, 110)
+        db_score = db.get_user_field(TEST_USER_ID, "score")
+        _rank, board_score, _total = leaderboard.rank(TEST_USER_ID)
+        unlocked = BONUS_BADGE in db.get_user_badges(TEST_USER_ID)
+        print(f"бейдж «{BONUS_BADGE}»: {'так' if unlocked else 'ні'}, бали в БД: {db_score}, у leaderboard: {board_score}")
+        failed = not unlocked or board_score != db_score
+    finally:
+        badge_engine.pop_unseen(TEST_USER_ID)
+        leaderboard.set_user(TEST_USER_ID, 0, None)
+        with db.connect() as con:
+            con.cursor().execute("DELETE FROM users WHERE id = %s", (TEST_USER_ID,))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Бенчмарк справжніх хендлерів на локальній БД із синтетичними даними.
+
+Хендлери (main_message_handler, handle_task_answer, show_progress, show_rating, show_badges,
+адмінські пагінатори задач і звернень) викликаються напряму з реальними об'єктами Update;
+Bot API обслуговує FakeTelegramRequest з bench/fake_telegram.py, який рахує вихідні виклики.
+Для кожного сценарію друкуються перцентилі латентності, кількість SQL-запитів
+(через metrics, тож METRICS не має бути 0) і викликів Bot API на один виклик хендлера.
+
+Дані — синтетичний набір з bench/datagen.py (handle_task_answer дописує в нього виконання).
+Запускати лише на окремій базі для бенчмарків (PG_* змінні).
+
+    python -m bench.datagen --profile medium
+    python -m bench.bench_handlers --iterations 300 --save results.json
+    python -m bench.bench_handlers --baseline results.json --max-regression 0.25
+
+Код виходу 1 — якщо хендлер впав або результат гірший за --baseline
+(p95 більший на --max-regression і щонайменше на 1 мс, або більше SQL-запитів на виклик).
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from telegram import Update
+from telegram.ext import Application, CallbackContext
+
+import db
+import db_async
+import leaderboard
+import metrics
+from bench.datagen import load_fixture
+from bench.fake_telegram import FakeTelegramRequest, FAKE_TOKEN
+from handlers.admin import handle_task_pagination_callback, handle_feedback_pagination_callback
+from handlers.badges import show_badges
+from handlers.progress import show_progress, show_rating
+from handlers.task import main_message_handler, handle_task_answer
+from handlers.utils import admin_ids
+
+# Різниця p95 менша за це — шум, а не регресія
+NOISE_FLOOR_MS = 1.0
+
+
+# -----------------------------
+# Апдейти
+# -----------------------------
+def _message(user_id, text, number):
+    return {
+        "update_id": number,
+        "message": {
+            "message_id": number, "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": text,
+        },
+    }
+
+
+def _callback(user_id, data, number):
+    return {
+        "update_id": number,
+        "callback_query": {
+            "id": str(number), "chat_instance": "bench", "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "message": {
+                "message_id": number, "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"}, "text": "…",
+            },
+        },
+    }
+
+
+class Scenario:
+    """Сценарій: prepare(rng, n) -> (сирий апдейт, user_data, хендлер); prepare виконується поза заміром."""
+
+    def __init__(self, name, prepare):
+        self.name = name
+        self.prepare = prepare
+
+
+def build_scenarios(fixture):
+    def menu(text, handler):
+        def prepare(rng, n):
+            return _message(fixture.random_user(rng), text, n), {}, handler
+        return prepare
+
+    async def answer(rng, n):
+        task = await db_async.get_task_by_id(rng.choice(fixture.task_ids))
+        correct = rng.random() < 0.6
+        text = ", ".join(str(a) for a in task["answer"]) if correct else "-1"
+        state = {"solving_state": {
+            "current_task": task, "current": 0, "total_tasks": 1, "completed_ids": set(),
+            "topic": task["topic"], "level": task["level"], "is_daily": False,
+        }}
+        return _message(fixture.random_user(rng), text, n), state, handle_task_answer
+
+    async def tasks_page(rng, n):
+        task = await db_async.get_task_by_id(rng.choice(fixture.task_ids))
+        state = {"admin_menu_state": {"topic": task["topic"], "is_daily": False}}
+        data = rng.choice((f"next_3_{task['id']}", f"prev_3_{task['id']}", "next_0"))
+        return _callback(admin_ids[n % len(admin_ids)], data, n), state, handle_task_pagination_callback
+
+    def feedback_page(rng, n):
+        state = {"feedback_state": {"step": "pagination", "page": 0}}
+        cursor = rng.choice(fixture.feedback_ids) if fixture.feedback_ids else 0
+        data = rng.choice((f"feedback_next_3_{cursor}", f"feedback_prev_3_{cursor}", "feedback_next_0"))
+        return _callback(admin_ids[n % len(admin_ids)], data, n), state, handle_feedback_pagination_callback
+
+    return [
+        Scenario("main_message_handler (меню)", menu("↩️ Меню", main_message_handler)),
+        Scenario("main_message_handler → прогрес", menu("📊 Мій прогрес", main_message_handler)),
+        Scenario("show_progress", menu("📊 Мій прогрес", show_progress)),
+        Scenario("show_rating", menu("🏆 Рейтинг", show_rating)),
+        Scenario("show_badges", menu("🛒 Бонуси / Бейджі", show_badges)),
+        Scenario("handle_task_answer", answer),
+        Scenario("admin: сторінка задач", tasks_page),
+        Scenario("admin: сторінка звернень", feedback_page),
+    ]
+
+
+# -----------------------------
+# Замір
+# -----------------------------
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_scenario(app, fake, scenario, iterations, warmup, concurrency, rng):
+    latencies, queries = [], []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    busy = set()
+    numbers = iter(range(1, 10 ** 9))
+
+    async def one(measure):
+        nonlocal errors
+        async with semaphore:
+            # user_data спільний для апдейтів одного користувача — одночасно лише один виклик на користувача
+            for _ in range(100):
+                prepared = scenario.prepare(rng, next(numbers))
+                if asyncio.iscoroutine(prepared):
+                    prepared = await prepared
+                raw, user_data, handler = prepared
+                update = Update.de_json(raw, app.bot)
+                user_id = update.effective_user.id
+                if user_id not in busy:
+                    break
+            busy.add(user_id)
+            context = CallbackContext.from_update(update, app)
+            context.user_data.clear()
+            context.user_data.update(user_data)
+
+            with metrics.collect() as stats:
+                started = time.perf_counter()
+                try:
+                    await handler(update, context)
+                except Exception as e:
+                    errors += 1
+                    print(f"  ! {scenario.name}: {type(e).__name__}: {e}")
+                finally:
+                    elapsed = time.perf_counter() - started
+                    busy.discard(user_id)
+            if measure:
+                latencies.append(elapsed * 1000)
+                queries.append(stats.queries)
+
+    await asyncio.gather(*(one(False) for _ in range(warmup)))
+    calls_before = sum(fake.calls.values())
+    started = time.perf_counter()
+    await asyncio.gather(*(one(True) for _ in range(iterations)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "runs": len(latencies),
+        "p50_ms": _percentile(latencies, 0.50),
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+        "queries": sum(queries) / len(queries) if queries else 0.0,
+        "queries_max": max(queries, default=0),
+        "api_calls": (sum(fake.calls.values()) - calls_before) / max(1, iterations),
+        "per_second": len(latencies) / wall if wall else 0.0,
+        "errors": errors,
+    }
+
+
+async def run_all(scenarios, args):
+    fake = FakeTelegramRequest(latency=args.latency_ms / 1000)
+    app = Application.builder().token(FAKE_TOKEN).request(fake).get_updates_request(FakeTelegramRequest()).build()
+    await app.initialize()
+    results = {}
+    try:
+        for scenario in scenarios:
+            if args.only and not any(s in scenario.name for s in args.only):
+                continue
+            rng = random.Random(f"{args.seed}:{scenario.name}")
+            results[scenario.name] = await run_scenario(
+                app, fake, scenario, args.iterations, args.warmup, args.concurrency, rng,
+            )
+            r = results[scenario.name]
+            print(f"{scenario.name:<34} {r['runs']:>5} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                  f"{r['max_ms']:>8.2f} {r['queries']:>6.1f} {r['queries_max']:>4} {r['api_calls']:>5.1f} "
+                  f"{r['per_second']:>7.0f} {r['errors']:>4}")
+    finally:
+        await app.shutdown()
+    return results
+
+
+def compare(results, baseline, max_regression):
+    """Рядки з регресіями відносно збереженого прогону."""
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        slower = r["p95_ms"] - base["p95_ms"]
+        if slower > NOISE_FLOOR_MS and r["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.2f} → {r['p95_ms']:.2f} мс")
+        if r["queries"] > base["queries"] + 0.5:
+            regressions.append(f"{name}: SQL на виклик {base['queries']:.1f} → {r['queries']:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200, help="замірів на сценарій")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1, help="одночасних викликів хендлера")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="штучна затримка кожного виклику Bot API")
+    parser.add_argument("--only", nargs="+", help="лише сценарії, в назві яких є ці підрядки")
+    parser.add_argument("--seed", type=int, default=42, help="вибір користувачів і задач у сценаріях")
+    parser.add_argument("--save", help="зберегти результати в JSON")
+    parser.add_argument("--baseline", help="порівняти з раніше збереженим JSON")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    db.init_db()
+    if not metrics.METRICS_ENABLED:
+        print("⚠️ METRICS=0: кількість SQL-запитів не рахується.")
+
+    db_async.configure()
+    leaderboard.rebuild_from_db()
+    fixture = load_fixture()
+    print(f"Дані: {fixture.users} користувачів, {len(fixture.task_ids)} задач, {len(fixture.feedback_ids)} звернень; "
+          f"concurrency={args.concurrency}\n")
+    print(f"{'сценарій':<34} {'runs':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'SQL':>6} {'max':>4} {'API':>5} {'/s':>7} {'err':>4}")
+    try:
+        results = asyncio.run(run_all(build_scenarios(fixture), args))
+    finally:
+        db_async.shutdown()
+
+    failed = any(r["errors"] for r in results.values())
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"РЕГРЕСІЯ {line}")
+        failed = failed or bool(regressions)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
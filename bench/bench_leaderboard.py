@@ -0,0 +1,64 @@
+"""
+Бенчмарк leaderboard у пам'яті (leaderboard.IndexableSkipList).
+
+Міряє top-10, ранг довільного користувача і оновлення балів для 10k .. 1M
+користувачів; поруч — «наївний» ранг через перебір усіх балів.
+
+    python -m bench.bench_leaderboard
+    python -m bench.bench_leaderboard --sizes 10000 100000
+"""
+import argparse
+import itertools
+import random
+import time
+
+from leaderboard import IndexableSkipList
+
+
+def _per_call_us(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'users':>10} {'top-10, µs':>11} {'rank, µs':>9} {'update, µs':>11} {'scan rank, µs':>14}")
+    for size in args.sizes:
+        scores = {uid: rng.randrange(1, 5_000) for uid in range(1, size + 1)}
+        board = IndexableSkipList(random.Random(args.seed))
+        for uid, score in scores.items():
+            board.insert((-score, uid))
+
+        top_us = _per_call_us(lambda: list(itertools.islice(board, 10)), args.iterations)
+
+        def rank():
+            score = scores[rng.randrange(1, size + 1)]
+            return board.count_less((-score, -1)) + 1
+        rank_us = _per_call_us(rank, args.iterations)
+
+        def update():
+            uid = rng.randrange(1, size + 1)
+            board.remove((-scores[uid], uid))
+            scores[uid] += rng.randrange(1, 20)
+            board.insert((-scores[uid], uid))
+        update_us = _per_call_us(update, args.iterations)
+
+        values = list(scores.values())
+        def scan_rank():
+            score = scores[rng.randrange(1, size + 1)]
+            return sum(1 for v in values if v > score) + 1
+        scan_us = _per_call_us(scan_rank, max(3, args.iterations // (size // 100)))
+
+        print(f"{size:>10} {top_us:11.2f} {rank_us:9.2f} {update_us:11.2f} {scan_us:14.1f}")
+
+
+if __name__ == "__main__":
+    main()
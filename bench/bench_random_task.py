@@ -0,0 +1,104 @@
+"""
+Бенчмарк вибору випадкової задачі (catalogue.pick_random_id).
+
+Показує, що затримка не залежить від розміру каталогу (1k .. 1M задач),
+на відміну від ORDER BY RANDOM(), який сортує всіх кандидатів.
+Для наочності поруч міряється «сортування всіх кандидатів» у Python.
+
+--db міряє весь db.get_random_task (кеш каталогу + виконані задачі з БД) на синтетичному
+наборі з bench/datagen.py — окремо для найактивніших і для випадкових користувачів,
+щоб було видно, що затримка не росте з історією користувача.
+
+    python -m bench.bench_random_task
+    python -m bench.bench_random_task --sizes 1000 1000000 --completed 5000
+    python -m bench.datagen --profile medium && python -m bench.bench_random_task --db
+"""
+import argparse
+import random
+import time
+from array import array
+
+from catalogue import pick_random_id
+
+
+def _per_call_us(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def bench_db(iterations, rng):
+    # БД і handlers — лише для --db, щоб базовий бенчмарк не потребував telegram/psycopg2
+    import db
+    from bench.datagen import load_fixture
+    from handlers.utils import LEVELS
+
+    fixture = load_fixture()
+    groups = {
+        "найактивніші": lambda: rng.choice(fixture.active_user_ids[:50]),
+        "випадкові": lambda: fixture.random_user(rng, active_share=0),
+    }
+    # Прогрів кешу каталогу, щоб міряти вибір, а не перше завантаження id
+    for topic in fixture.topics:
+        for level in LEVELS:
+            db.get_random_task(topic, level)
+
+    print(f"{'users':>14} {'completed avg':>14} {'p50, ms':>9} {'p95, ms':>9}")
+    for name, pick_user in groups.items():
+        user_ids = [pick_user() for _ in range(iterations)]
+        calls = [(rng.choice(fixture.topics), rng.choice(LEVELS), user_id) for user_id in user_ids]
+        timings = []
+        for topic, level, user_id in calls:
+            started = time.perf_counter()
+            db.get_random_task(topic, level, user_id=user_id)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        sample = set(user_ids[:50])
+        completed_avg = sum(db.count_user_tasks(user_id) for user_id in sample) / len(sample)
+        print(f"{name:>14} {completed_avg:14.0f} {_percentile(timings, 0.5):9.2f} {_percentile(timings, 0.95):9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--completed", type=int, default=200,
+                        help="скільки задач користувач уже виконав (виключаються з вибору)")
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--sort-limit", type=int, default=100_000,
+                        help="до якого розміру міряти базовий варіант із сортуванням")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", action="store_true", help="міряти db.get_random_task на синтетичних даних")
+    parser.add_argument("--db-iterations", type=int, default=500, help="викликів на групу користувачів")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.db:
+        bench_db(args.db_iterations, rng)
+        return
+    print(f"{'tasks':>10} {'pick_random_id, µs':>20} {'sort all, µs':>15}")
+    for size in args.sizes:
+        ids = array('q', range(1, size + 1))
+        # Виконані задачі користувача — однаковий розмір для будь-якого каталогу
+        completed = set(rng.sample(range(1, size + 1), min(size - 1, args.completed)))
+
+        pick_us = _per_call_us(lambda: pick_random_id(ids, completed, rng), args.iterations)
+
+        sort_us = None
+        if size <= args.sort_limit:
+            def sort_all():
+                remaining = [i for i in ids if i not in completed]
+                remaining.sort(key=lambda _: rng.random())
+                return remaining[0]
+            sort_us = _per_call_us(sort_all, max(3, args.iterations // size))
+
+        sort_col = f"{sort_us:15.1f}" if sort_us is not None else f"{'—':>15}"
+        print(f"{size:>10} {pick_us:20.2f} {sort_col}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Час холодного старту бота.
+
+Кожен замір — окремий процес python, як після рестарту контейнера. Фази:
+  import  — import bot (хендлери, telegram, db — без з'єднань з БД);
+  build   — build_application() з фейковим Bot API (bench/fake_telegram.py);
+  startup — app.initialize() + post_init: пул з'єднань і перевірка схеми
+            (рейтинг будується вже після старту, фоновим job);
+  process — увесь процес разом із запуском інтерпретатора.
+Для startup рахується кількість SQL-запитів (METRICS не має бути 0). Також перевіряється,
+що рідкісні модулі (адмінка, експорт, імпорт задач, розсилки) не імпортуються під час старту.
+
+    python -m bench.bench_startup --runs 10
+    python -m bench.bench_startup --import-only --top-imports 15     # без БД
+    python -m bench.bench_startup --save startup.json
+    python -m bench.bench_startup --baseline startup.json --max-regression 0.25
+
+Код виходу 1 — якщо процес старту впав, під час старту імпортовано лінивий модуль
+або медіана фази гірша за --baseline на --max-regression і щонайменше на 5 мс.
+"""
+# Лише стандартна бібліотека на рівні модуля: дочірній процес імпортує цей файл до заміру
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Мають імпортуватись лише при першому використанні
+LAZY_MODULES = ("handlers.admin", "export", "task_import", "broadcast")
+PHASES = ("import", "build", "startup", "process")
+# Різниця медіан менша за це — шум, а не регресія
+NOISE_FLOOR_MS = 5.0
+
+
+# -----------------------------
+# Дочірній процес
+# -----------------------------
+async def _startup(bot, phases):
+    import metrics
+    from telegram.ext import Application
+    from bench.fake_telegram import FakeTelegramRequest, FAKE_TOKEN
+
+    started = time.perf_counter()
+    builder = Application.builder().token(FAKE_TOKEN).request(FakeTelegramRequest()).get_updates_request(FakeTelegramRequest())
+    app = bot.build_application(builder)
+    phases["build"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with metrics.collect() as stats:
+        await app.initialize()
+        await app.post_init(app)
+    phases["startup"] = time.perf_counter() - started
+
+    await app.shutdown()
+    await app.post_shutdown(app)
+    return stats.queries
+
+
+def child(import_only):
+    started = time.perf_counter()
+    import bot
+    phases = {"import": time.perf_counter() - started}
+    result = {"phases": phases}
+    if not import_only:
+        result["queries"] = asyncio.run(_startup(bot, phases))
+    result["eager"] = [m for m in LAZY_MODULES if m in sys.modules]
+    print(json.dumps(result))
+
+
+# -----------------------------
+# Заміри
+# -----------------------------
+def run_once(import_only):
+    """Один холодний старт у новому процесі; None, якщо процес впав."""
+    cmd = [sys.executable, "-m", "bench.bench_startup", "--child"] + (["--import-only"] if import_only else [])
+    started = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        print(f"  ! процес старту завершився з кодом {proc.returncode}:\n{proc.stderr[-2000:]}")
+        return None
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["phases"]["process"] = elapsed
+    return result
+
+
+def top_imports(limit):
+    """Найповільніші модулі за -X importtime (власний час без вкладених імпортів), у мс."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import bot"],
+                          cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(self_us) / 1000, int(cumulative_us) / 1000, name.strip()))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def summarize(results):
+    summary = {}
+    for phase in PHASES:
+        values = sorted(r["phases"][phase] * 1000 for r in results if phase in r["phases"])
+        if values:
+            summary[phase] = {"median_ms": statistics.median(values), "max_ms": values[-1]}
+    queries = [r["queries"] for r in results if "queries" in r]
+    if queries:
+        summary["queries"] = max(queries)
+    return summary
+
+
+def compare(summary, baseline, max_regression):
+    """Рядки з регресіями відносно збереженого прогону."""
+    regressions = []
+    for phase in PHASES:
+        r, base = summary.get(phase), baseline.get(phase)
+        if not r or not base:
+            continue
+        slower = r["median_ms"] - base["median_ms"]
+        if slower > NOISE_FLOOR_MS and r["median_ms"] > base["median_ms"] * (1 + max_regression):
+            regressions.append(f"{phase}: медіана {base['median_ms']:.1f} → {r['median_ms']:.1f} мс")
+    if summary.get("queries", 0) > baseline.get("queries", float("inf")):
+        regressions.append(f"startup: SQL-запитів {baseline['queries']} → {summary['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="холодних стартів (кожен — новий процес)")
+    parser.add_argument("--import-only", action="store_true", help="лише import bot, без БД")
+    parser.add_argument("--top-imports", type=int, default=0, help="показати N найповільніших модулів (-X importtime)")
+    parser.add_argument("--save", help="зберегти результати в JSON")
+    parser.add_argument("--baseline", help="порівняти з раніше збереженим JSON")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.import_only)
+        return
+
+    # Перший запуск прогріває кеш байткоду і файлової системи — не рахується
+    results = [run_once(args.import_only) for _ in range(args.runs + 1)][1:]
+    failed = any(r is None for r in results)
+    results = [r for r in results if r is not None]
+
+    summary = summarize(results)
+    print(f"{'фаза':<10} {'медіана ms':>11} {'max ms':>9}")
+    for phase in PHASES:
+        if phase in summary:
+            print(f"{phase:<10} {summary[phase]['median_ms']:>11.1f} {summary[phase]['max_ms']:>9.1f}")
+    if "queries" in summary:
+        print(f"SQL-запитів під час startup: {summary['queries']}")
+
+    eager = sorted({m for r in results for m in r["eager"]})
+    if eager:
+        print(f"НЕ ЛІНИВО імпортовано під час старту: {', '.join(eager)}")
+        failed = True
+
+    if args.top_imports:
+        print(f"\n{'self ms':>8} {'cumul ms':>9}  модуль")
+        for self_ms, cumulative_ms, name in top_imports(args.top_imports):
+            print(f"{self_ms:>8.1f} {cumulative_ms:>9.1f}  {name}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(summary, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"РЕГРЕСІЯ {line}")
+        failed = failed or bool(regressions)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+Детермінований генератор синтетичних даних за схемою init_db (для бенчмарків і планів запитів).
+
+Задачі розподілені по CATEGORIES / LEVELS / типах з TYPE_BUTTONS (частина — щоденні),
+активність користувачів скошена (розподіл Парето: мало дуже активних, багато майже неактивних),
+виконання йдуть тема за темою від легкого рівня, бейджі видаються за умовами BADGES_LIST,
+стріки в темах і звернення узгоджені з полями users. Рядки генеруються в Python і одразу
+йдуть у Postgres через COPY (без проміжних файлів і без списку всіх рядків у пам'яті).
+Однакові профіль і --seed дають ті самі дані, тож bench_handlers і query_plans бачать один набір.
+
+Синтетичні дані — користувачі з id понад BENCH_USER_BASE і теми з префіксом BENCH_TOPIC_PREFIX;
+--drop видаляє лише їх. Запускати на окремій базі для бенчмарків (PG_* змінні).
+
+    python -m bench.datagen --profile medium
+    python -m bench.datagen --profile large            # 10M completed_tasks
+    python -m bench.datagen --users 200000 --completions 3000000 --seed 7
+    python -m bench.datagen --drop
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import db
+from handlers.utils import CATEGORIES, LEVELS, TYPE_BUTTONS
+
+BENCH_USER_BASE = 8_000_000_000_000
+BENCH_TOPIC_PREFIX = "Bench "
+DAILY_CATEGORY = "Щоденні"
+
+PROFILES = {
+    "small":  {"users": 10_000,  "tasks": 2_000,  "topics": 20, "completions": 300_000,    "feedback": 2_000},
+    "medium": {"users": 100_000, "tasks": 20_000, "topics": 40, "completions": 5_000_000,  "feedback": 20_000},
+    "large":  {"users": 500_000, "tasks": 40_000, "topics": 60, "completions": 10_000_000, "feedback": 100_000},
+}
+
+# Частка щоденних задач у каталозі
+DAILY_SHARE = 0.05
+LEVEL_WEIGHTS = (0.45, 0.35, 0.20)
+# Відносна частота типів задач; тип з TYPE_BUTTONS без окремої частоти отримує DEFAULT_TYPE_WEIGHT
+TYPE_SHARES = {"single": 0.35, "match": 0.15, "open": 0.35, "boss": 0.05, "light": 0.10}
+DEFAULT_TYPE_WEIGHT = 0.10
+TYPE_WEIGHTS = {task_type: TYPE_SHARES.get(task_type, DEFAULT_TYPE_WEIGHT) for task_type in TYPE_BUTTONS.values()}
+# Показник Парето для кількості виконаних задач (≈80/20)
+ACTIVITY_ALPHA = 1.16
+# Частка тих, хто запустив бота, але не розв'язав жодної задачі
+INACTIVE_SHARE = 0.3
+CITIES = ("Київ", "Львів", "Харків", "Одеса", "Дніпро", "Вінниця", "Запоріжжя", None, None, None)
+# Дані з кожної таблиці йдуть у базу пачками по стільки рядків (одна транзакція на пачку)
+COPY_CHUNK_ROWS = 1_000_000
+
+_FILLER = ("Знайдіть значення виразу при заданих умовах та запишіть відповідь у зошит. " * 8)
+
+
+# -----------------------------
+# COPY
+# -----------------------------
+def _copy_text(value):
+    """Значення у текстовому форматі COPY."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    value = str(value)
+    if "\\" in value or "\t" in value or "\n" in value or "\r" in value:
+        value = value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return value
+
+
+class CopyStream:
+    """
+    Файлоподібний об'єкт для cursor.copy_expert: рядки генеруються лише тоді, коли Postgres їх читає.
+    Елемент lines — один або кілька готових рядків COPY (кожен закінчується на \\n).
+    """
+
+    def __init__(self, lines, limit=None):
+        self._lines = lines
+        self._left = limit
+        self._buffer = bytearray()
+        self.rows = 0
+        self.exhausted = False
+
+    def _fill(self, size):
+        batch, pending = [], 0
+        while len(self._buffer) + pending < size:
+            if self._left is not None and self.rows >= self._left:
+                break
+            line = next(self._lines, None)
+            if line is None:
+                self.exhausted = True
+                break
+            batch.append(line)
+            pending += len(line)
+            self.rows += line.count("\n")
+        if batch:
+            self._buffer += "".join(batch).encode("utf-8")
+
+    def read(self, size=-1):
+        self._fill(size if size and size > 0 else 1 << 20)
+        chunk = bytes(self._buffer[:size]) if size and size > 0 else bytes(self._buffer)
+        del self._buffer[:len(chunk)]
+        return chunk
+
+
+def copy_rows(table, columns, lines, chunk_rows=COPY_CHUNK_ROWS):
+    """COPY рядків (уже у форматі COPY) пачками по chunk_rows; повертає кількість рядків."""
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    lines = iter(lines)
+    total = 0
+    started = time.perf_counter()
+    while True:
+        stream = CopyStream(lines, limit=chunk_rows)
+        with db.connect() as con:
+            cur = con.cursor()
+            cur.execute("SET LOCAL synchronous_commit = off")
+            cur.copy_expert(sql, stream, size=1 << 16)
+        total += stream.rows
+        elapsed = time.perf_counter() - started
+        print(f"  {table}: {total} рядків, {elapsed:.1f} с ({total / elapsed if elapsed else 0:,.0f}/с)")
+        if stream.exhausted:
+            return total
+
+
+# -----------------------------
+# Генерація
+# -----------------------------
+def topic_name(n):
+    return f"{BENCH_TOPIC_PREFIX}{CATEGORIES[n % len(CATEGORIES)]} {n + 1:02d}"
+
+
+def _answer(rng, task_type):
+    if task_type == "single":
+        return [rng.choice("АБВГД")]
+    if task_type == "match":
+        letters = rng.sample("АБВГД", 4)
+        return [f"{i}-{letter}" for i, letter in enumerate(letters[:3], start=1)]
+    if task_type == "light":
+        return ["так"]
+    if rng.random() < 0.2:
+        return [str(rng.randrange(-20, 20)), str(rng.randrange(-20, 20))]
+    return [str(rng.randrange(-50, 200)) if rng.random() < 0.7 else f"{rng.randrange(1, 9)}/{rng.randrange(2, 12)}"]
+
+
+def task_plan(rng, tasks, topics):
+    """Задачі в порядку вставки: (category, topic, level, task_type, question, answer, explanation, photo, is_daily)."""
+    types, type_weights = list(TYPE_WEIGHTS), list(TYPE_WEIGHTS.values())
+    daily = int(tasks * DAILY_SHARE)
+    for n in range(tasks):
+        is_daily = n < daily
+        topic = n % topics
+        task_type = rng.choices(types, type_weights)[0]
+        question = f"Синтетична задача {n + 1}. " + _FILLER[:rng.randrange(40, 480)]
+        yield (
+            DAILY_CATEGORY if is_daily else CATEGORIES[topic % len(CATEGORIES)],
+            topic_name(topic),
+            rng.choices(LEVELS, LEVEL_WEIGHTS)[0],
+            task_type,
+            question,
+            json.dumps(_answer(rng, task_type), ensure_ascii=False),
+            "Пояснення: " + _FILLER[:rng.randrange(0, 300)],
+            f"AgACAgIAAxkBAAIBench{n:07d}" if rng.random() < 0.1 else None,
+            is_daily,
+        )
+
+
+class UserPlan:
+    """Що зробив один користувач: пари (тема, скільки задач із неї) і похідні поля users."""
+    __slots__ = ("takes", "done", "score", "days_ago", "streak_days", "feedbacks")
+
+
+def user_plans(rng, users, completions, topic_sizes):
+    """Скошений розподіл виконань між користувачами; сума ≈ completions."""
+    weights = [0.0 if rng.random() < INACTIVE_SHARE else rng.paretovariate(ACTIVITY_ALPHA) for _ in range(users)]
+    scale = completions / sum(weights)
+    cap = sum(topic_sizes)
+    topics = len(topic_sizes)
+    plans = []
+    for w in weights:
+        plan = UserPlan()
+        left = min(cap, int(w * scale + rng.random()))
+        plan.takes = []
+        # Тема за темою з випадкової; з кожної — від легких задач, не обов'язково до кінця
+        everything = left >= cap
+        start = rng.randrange(topics)
+        for i in range(topics):
+            if not left:
+                break
+            topic = (start + i) % topics
+            size = topic_sizes[topic]
+            if not size:
+                continue
+            full = everything or rng.random() < 0.5
+            take = min(left, size if full else max(1, int(size * rng.uniform(0.3, 1.0))))
+            plan.takes.append((topic, take))
+            left -= take
+        plan.done = sum(take for _, take in plan.takes)
+        plan.score = int(plan.done * rng.uniform(1.0, 3.0))
+        # Що більше виконано, то свіжіша остання активність
+        plan.days_ago = min(365, int(rng.expovariate(1.0) * 60 / (1 + math.log1p(plan.done))))
+        plan.streak_days = min(60, int(rng.expovariate(1 / 5))) if plan.days_ago <= 1 and plan.done else 0
+        plan.feedbacks = 0
+        plans.append(plan)
+    return plans
+
+
+def feedback_plan(rng, users, feedback):
+    """Автори звернень (частіше активні) і вік звернення в хвилинах — від найстаріших, як id у SERIAL."""
+    authors = [int(users * rng.random() ** 3) for _ in range(feedback)]
+    ages = sorted((rng.randrange(180 * 24 * 60) for _ in range(feedback)), reverse=True)
+    return list(zip(authors, ages))
+
+
+def user_lines(rng, plans, topics_total, regular_tasks):
+    today = date.today()
+    for n, plan in enumerate(plans):
+        uid = BENCH_USER_BASE + 1 + n
+        last_activity = today - timedelta(days=plan.days_ago) if plan.done or rng.random() < 0.5 else None
+        row = (
+            uid,
+            f"user{n + 1}" if rng.random() < 0.8 else None,
+            f"Учень {n + 1}" if plan.done and rng.random() < 0.7 else None,
+            plan.score,
+            topic_name(plan.takes[-1][0]) if plan.takes else None,
+            last_activity if last_activity and rng.random() < 0.3 else None,
+            plan.feedbacks,
+            1 if plan.done >= regular_tasks else 0,
+            topics_total,
+            len(plan.takes),
+            last_activity,
+            plan.streak_days,
+            rng.choice(CITIES),
+            f"+380{rng.randrange(10**8, 10**9)}" if rng.random() < 0.1 else None,
+        )
+        yield "\t".join(map(_copy_text, row)) + "\n"
+
+
+def completion_lines(plans, topic_task_ids):
+    for n, plan in enumerate(plans):
+        if not plan.takes:
+            continue
+        uid = BENCH_USER_BASE + 1 + n
+        yield "".join(
+            f"{uid}\t{task_id}\n"
+            for topic, take in plan.takes
+            for task_id in topic_task_ids[topic][:take]
+        )
+
+
+def badge_lines(plans, topics_total, regular_tasks):
+    # Не на рівні модуля: handlers.badges підписує BadgeEngine на події db, а query_plans
+    # імпортує datagen і виконує запити, події яких не мають нічого записувати насправді
+    from handlers.badges import BADGES_LIST
+    for n, plan in enumerate(plans):
+        user = SimpleNamespace(
+            score=plan.score, feedbacks=plan.feedbacks, streak_days=plan.streak_days,
+            topics_total=topics_total, topics_completed=len(plan.takes),
+            all_tasks_completed=1 if plan.done >= regular_tasks else 0,
+        )
+        uid = BENCH_USER_BASE + 1 + n
+        for name, _emoji, _description, condition, *_ in BADGES_LIST:
+            if condition(user):
+                yield f"{uid}\t{_copy_text(name)}\n"
+
+
+def streak_lines(rng, plans, awards):
+    """Стріки в темах, де користувач щось виконував; awards — список для user_topic_streak_awards."""
+    for n, plan in enumerate(plans):
+        uid = BENCH_USER_BASE + 1 + n
+        for topic, take in plan.takes:
+            streak = min(take, int(rng.expovariate(1 / 3)))
+            name = _copy_text(topic_name(topic))
+            yield f"{uid}\t{name}\t{streak}\n"
+            for milestone in db.TOPIC_STREAK_MILESTONES:
+                if streak >= milestone:
+                    awards.append(f"{uid}\t{name}\t{milestone}\n")
+
+
+def feedback_lines(feedbacks):
+    now = datetime.now(timezone.utc)
+    for author, age in feedbacks:
+        uid = BENCH_USER_BASE + 1 + author
+        timestamp = (now - timedelta(minutes=age)).isoformat()
+        yield f"{uid}\tuser{author + 1}\tЗвернення від користувача {author + 1}: " + _FILLER[:age % 200] + f"\t{timestamp}\n"
+
+
+def generate(users, tasks, topics, completions, feedback, seed=42):
+    if exists():
+        raise SystemExit("Синтетичні дані вже є — спершу --drop.")
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    copy_rows("tasks", ("category", "topic", "level", "task_type", "question", "answer", "explanation", "photo", "is_daily"),
+              ("\t".join(map(_copy_text, row)) + "\n" for row in task_plan(rng, tasks, topics)))
+    # Id задач — з бази (SERIAL); у межах теми від легкого рівня до важкого
+    with db.connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("""
+            SELECT topic, id FROM tasks
+            WHERE topic LIKE %s || '%%' AND NOT is_daily
+            ORDER BY topic, array_position(%s::text[], level), id
+        """, (BENCH_TOPIC_PREFIX, LEVELS))
+        by_topic = {}
+        for topic, task_id in cur:
+            by_topic.setdefault(topic, []).append(task_id)
+    topic_task_ids = [by_topic.get(topic_name(n), []) for n in range(topics)]
+    regular_tasks = sum(map(len, topic_task_ids))
+    topics_total = sum(1 for ids in topic_task_ids if ids)
+
+    plans = user_plans(rng, users, completions, [len(ids) for ids in topic_task_ids])
+    feedbacks = feedback_plan(rng, users, feedback)
+    for author, _ in feedbacks:
+        plans[author].feedbacks += 1
+
+    copy_rows("users", ("id", "username", "display_name", "score", "topic", "last_daily", "feedbacks",
+                        "all_tasks_completed", "topics_total", "topics_completed", "last_activity",
+                        "streak_days", "city", "phone_number"),
+              user_lines(rng, plans, topics_total, regular_tasks))
+    copy_rows("completed_tasks", ("user_id", "task_id"), completion_lines(plans, topic_task_ids))
+    copy_rows("badges", ("user_id", "badge"), badge_lines(plans, topics_total, regular_tasks))
+    awards = []
+    copy_rows("user_topic_streaks", ("user_id", "topic", "streak"), streak_lines(rng, plans, awards))
+    copy_rows("user_topic_streak_awards", ("user_id", "topic", "milestone"), awards)
+    copy_rows("feedback", ("user_id", "username", "message", "timestamp"), feedback_lines(feedbacks))
+
+    finish()
+    print(f"Готово за {time.perf_counter() - started:.1f} с.")
+
+
+def finish():
+    """Лічильники прогресу, версія каталогу (інші процеси скинуть кеш) і статистика планувальника."""
+    db.rebuild_progress_counters()
+    with db.connect() as con:
+        cur = con.cursor()
+        cur.execute("UPDATE catalogue_version SET version = version + 1 WHERE id = 1")
+        cur.execute("ANALYZE users, tasks, completed_tasks, badges, user_topic_streaks, "
+                    "user_topic_streak_awards, feedback, task_level_totals, user_level_progress")
+
+
+def exists():
+    with db.connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("SELECT EXISTS (SELECT 1 FROM users WHERE id > %s)", (BENCH_USER_BASE,))
+        return cur.fetchone()[0]
+
+
+def drop():
+    with db.connect() as con:
+        cur = con.cursor()
+        cur.execute("DELETE FROM feedback WHERE user_id > %s", (BENCH_USER_BASE,))
+        # completed_tasks, badges, стріки і лічильники — ON DELETE CASCADE
+        cur.execute("DELETE FROM users WHERE id > %s", (BENCH_USER_BASE,))
+        cur.execute("DELETE FROM tasks WHERE topic LIKE %s || '%%'", (BENCH_TOPIC_PREFIX,))
+    finish()
+    print("Синтетичні дані видалено.")
+
+
+# -----------------------------
+# Спільний набір для bench/
+# -----------------------------
+class Fixture:
+    """Що є в синтетичних даних — параметри для сценаріїв bench_handlers і запитів query_plans."""
+
+    def __init__(self, users, task_ids, daily_task_ids, topics, feedback_ids, active_user_ids):
+        self.users = users
+        self.task_ids = task_ids
+        self.daily_task_ids = daily_task_ids
+        self.topics = topics
+        self.feedback_ids = feedback_ids
+        self.active_user_ids = active_user_ids
+
+    def random_user(self, rng, active_share=0.8):
+        """Трафік здебільшого від активних користувачів, решта — будь-хто."""
+        if self.active_user_ids and rng.random() < active_share:
+            return rng.choice(self.active_user_ids)
+        return BENCH_USER_BASE + 1 + rng.randrange(self.users)
+
+
+def load_fixture(active=1000):
+    with db.connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("SELECT count(*) FROM users WHERE id > %s", (BENCH_USER_BASE,))
+        users = cur.fetchone()[0]
+        cur.execute("SELECT id, is_daily FROM tasks WHERE topic LIKE %s || '%%' ORDER BY id", (BENCH_TOPIC_PREFIX,))
+        rows = cur.fetchall()
+        cur.execute("SELECT DISTINCT topic FROM tasks WHERE topic LIKE %s || '%%' ORDER BY topic", (BENCH_TOPIC_PREFIX,))
+        topics = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT id FROM feedback WHERE user_id > %s ORDER BY id", (BENCH_USER_BASE,))
+        feedback_ids = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT id FROM users WHERE id > %s ORDER BY score DESC, id LIMIT %s", (BENCH_USER_BASE, active))
+        active_user_ids = [r[0] for r in cur.fetchall()]
+    task_ids = [task_id for task_id, is_daily in rows if not is_daily]
+    if not users or not task_ids:
+        raise SystemExit("Синтетичних даних немає — спершу python -m bench.datagen.")
+    return Fixture(users, task_ids, [task_id for task_id, is_daily in rows if is_daily],
+                   topics, feedback_ids, active_user_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="medium")
+    for name in PROFILES["medium"]:
+        parser.add_argument(f"--{name}", type=int, help="замість значення з профілю")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="видалити синтетичні дані")
+    args = parser.parse_args()
+
+    db.init_db()
+    if args.drop:
+        drop()
+        return
+    params = dict(PROFILES[args.profile])
+    params.update({k: getattr(args, k) for k in params if getattr(args, k) is not None})
+    if params["topics"] < 1 or params["tasks"] < params["topics"]:
+        print("Потрібна хоча б одна тема і щонайменше одна задача на тему.")
+        sys.exit(1)
+    print(f"Генерація: {params}, seed={args.seed}")
+    generate(seed=args.seed, **params)
+
+
+if __name__ == "__main__":
+    main()
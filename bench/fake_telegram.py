@@ -0,0 +1,171 @@
+"""
+Локальний «фейковий Telegram» для заміру пропускної здатності бота.
+
+Бот працює зі справжніми хендлерами й справжньою БД, але всі виклики Bot API
+обслуговує FakeTelegramRequest (з опційною штучною мережевою затримкою).
+Апдейти беруться із запису (JSONL, див. RECORD_UPDATES у bot.py) або генеруються.
+Для кожного значення --concurrency рахується кількість апдейтів за секунду
+та перевіряється, що апдейти одного користувача оброблені по черзі.
+
+    DB_ASYNC=1 python -m bench.fake_telegram --users 50 --per-user 10 --concurrency 1 16 64
+    python -m bench.fake_telegram --updates recorded.jsonl --latency-ms 50
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import time
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+FAKE_TOKEN = "123456:FAKE-TOKEN"
+
+SYNTHETIC_TEXTS = ("📊 Мій прогрес", "🏆 Рейтинг", "🔁 Щоденна задача", "↩️ Меню")
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Відповідає на виклики Bot API локально, без мережі; рахує виклики за методами."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params):
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text") or "",
+        }
+
+    def _result(self, endpoint, params):
+        if endpoint == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot",
+                    "can_join_groups": False, "can_read_all_group_messages": False,
+                    "supports_inline_queries": False}
+        if endpoint.startswith(("send", "forward", "copy")) or endpoint.startswith("edit"):
+            return self._message(params)
+        if endpoint == "getUpdates":
+            return []
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data is not None else {}
+        body = {"ok": True, "result": self._result(endpoint, params)}
+        return 200, json.dumps(body).encode()
+
+
+def synthetic_updates(users, per_user, first_user_id=10_000_000):
+    """Перемішані апдейти: кожен користувач по черзі натискає кнопки меню."""
+    updates = []
+    update_id = itertools.count(1)
+    for step in range(per_user):
+        for n in range(users):
+            uid = first_user_id + n
+            number = next(update_id)
+            updates.append({
+                "update_id": number,
+                "message": {
+                    "message_id": number,
+                    "date": int(time.time()),
+                    "chat": {"id": uid, "type": "private"},
+                    "from": {"id": uid, "is_bot": False, "first_name": f"bench{n}"},
+                    "text": SYNTHETIC_TEXTS[step % len(SYNTHETIC_TEXTS)],
+                },
+            })
+    return updates
+
+
+def load_updates(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def replay(raw_updates, concurrency, latency):
+    from bot import build_application
+
+    fake = FakeTelegramRequest(latency=latency)
+    builder = Application.builder().token(FAKE_TOKEN).request(fake).get_updates_request(FakeTelegramRequest())
+    app = build_application(builder, concurrency=concurrency)
+    await app.initialize()
+
+    updates = [Update.de_json(data, app.bot) for data in raw_updates]
+    finished = collections.defaultdict(list)   # user_id -> update_id у порядку завершення
+    failed = 0
+
+    async def handle(update):
+        nonlocal failed
+        try:
+            await app.process_update(update)
+        except Exception:
+            failed += 1
+        user = update.effective_user
+        if user is not None:
+            finished[user.id].append(update.update_id)
+
+    processor = app.update_processor
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(processor.process_update(u, handle(u)) for u in updates))
+        elapsed = time.perf_counter() - started
+    finally:
+        await app.shutdown()
+
+    out_of_order = sum(1 for ids in finished.values() if ids != sorted(ids))
+    return {
+        "updates": len(updates),
+        "seconds": elapsed,
+        "updates_per_second": len(updates) / elapsed if elapsed else float("inf"),
+        "api_calls": sum(fake.calls.values()),
+        "failed": failed,
+        "users_out_of_order": out_of_order,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", help="JSONL із записаними апдейтами (за замовчуванням — синтетичні)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--per-user", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64],
+                        help="1 — послідовна обробка (як run_polling за замовчуванням)")
+    parser.add_argument("--latency-ms", type=float, default=20.0,
+                        help="штучна затримка кожного виклику Bot API")
+    args = parser.parse_args()
+
+    import db
+    import db_async
+    db.init_db()
+    db_async.configure()
+
+    raw = load_updates(args.updates) if args.updates else synthetic_updates(args.users, args.per_user)
+    print(f"{'concurrency':>11} {'updates':>8} {'seconds':>8} {'upd/s':>8} {'api calls':>10} {'failed':>7} {'out of order':>13}")
+    for concurrency in args.concurrency:
+        r = asyncio.run(replay(raw, concurrency, args.latency_ms / 1000))
+        print(f"{concurrency:>11} {r['updates']:>8} {r['seconds']:>8.2f} {r['updates_per_second']:>8.1f} "
+              f"{r['api_calls']:>10} {r['failed']:>7} {r['users_out_of_order']:>13}")
+    db_async.shutdown()
+
+
+if __name__ == "__main__":
+    main()
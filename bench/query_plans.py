@@ -0,0 +1,390 @@
+"""
+Перевірка планів усіх SQL-запитів db.py на синтетичному наборі (bench/datagen.py).
+
+Кожна «проба» викликає функції db.py з параметрами з набору всередині unit_of_work():
+db.capture_statements() збирає запити разом з підставленими параметрами, кожен проганяється
+через EXPLAIN (ANALYZE, BUFFERS) у тій самій транзакції (під SAVEPOINT), а в кінці все
+відкочується — база не змінюється. Позначаються Seq Scan і Sort від --rows рядків
+(Sort на диск — завжди). Проби з full_scan=True (експорт, повна перебудова лічильників)
+читають усю таблицю за задумом: їхні знахідки друкуються, але не рахуються помилкою.
+
+Перелік місць з execute/execute_values у db.py будується з AST, тож запит без проби
+видно одразу («не покрито»). Базовий файл зберігає форму плану (вузли, таблиці, індекси)
+і знахідки кожного запиту; з --baseline нові знахідки — регресія, зміна форми — попередження.
+
+    python -m bench.query_plans
+    python -m bench.query_plans --save-baseline bench/query_plans.json
+    python -m bench.query_plans --baseline bench/query_plans.json --rows 5000 --show-plans
+
+Потрібні інструментовані з'єднання (METRICS не 0). Код виходу 1 — якщо є неочікувані знахідки
+(або нові відносно --baseline), проба впала, чи з --strict лишились непокриті запити.
+"""
+import argparse
+import ast
+import csv
+import difflib
+import io
+import json
+import random
+import re
+import sys
+from datetime import date, timedelta
+
+import db
+import metrics
+from bench.datagen import load_fixture
+
+DEFAULT_ROW_THRESHOLD = 10_000
+# Виклики, що виконують SQL (execute_values теж, сторінками)
+_EXECUTE_CALLS = {"execute", "executemany", "execute_values"}
+# DDL не має плану
+_SKIP_FUNCTIONS = {"init_db"}
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+_DECLARE = re.compile(r"^\s*DECLARE\s+\S+\s+.*?\bCURSOR\b.*?\bFOR\s+", re.IGNORECASE | re.DOTALL)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+# -----------------------------
+# Перелік запитів у db.py
+# -----------------------------
+def inventory(path=db.__file__):
+    """{функція: [(перший рядок, останній рядок) кожного виклику execute]} у порядку в коді."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    sites = {}
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef) or node.name in _SKIP_FUNCTIONS:
+            continue
+        calls = [
+            (call.lineno, call.end_lineno) for call in ast.walk(node)
+            if isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)
+            and call.func.attr in _EXECUTE_CALLS
+        ]
+        if calls:
+            sites[node.name] = sorted(calls)
+    return sites
+
+
+def site_key(sites, function, line):
+    """'функція#N' — N-й виклик execute у функції; стабільніше за номер рядка."""
+    calls = sites.get(function, [])
+    for n, (start, end) in enumerate(calls, start=1):
+        if start <= line <= end:
+            return f"{function}#{n}"
+    before = [n for n, (start, _) in enumerate(calls, start=1) if start <= line]
+    return f"{function}#{before[-1]}" if before else f"{function}@{line}"
+
+
+# -----------------------------
+# Проби
+# -----------------------------
+class Probe:
+    def __init__(self, name, run, full_scan=False):
+        self.name = name
+        self.run = run
+        self.full_scan = full_scan
+
+
+class ProbeData:
+    """Параметри проб з синтетичного набору: активний і випадковий користувач, задача, тема, звернення."""
+
+    def __init__(self, fixture, rng):
+        self.fixture = fixture
+        self.user = fixture.active_user_ids[0]
+        self.other = fixture.random_user(rng, active_share=0)
+        self.users = fixture.active_user_ids[:100]
+        self.task = db.get_task_by_id(fixture.task_ids[len(fixture.task_ids) // 2])
+        self.topic, self.level = self.task["topic"], self.task["level"]
+        self.category = self.task["category"]
+        self.feedback_id = fixture.feedback_ids[len(fixture.feedback_ids) // 2] if fixture.feedback_ids else None
+
+
+def _import_file(d):
+    rows = [
+        (1, d.category, d.topic, d.level, d.task["task_type"], d.task["question"],
+         json.dumps(d.task["answer"], ensure_ascii=False), "Оновлене пояснення", "", "false"),
+        (2, d.category, d.topic, d.level, "open", "Нова задача з перевірки планів", '["42"]', "", "", "false"),
+    ]
+    text = io.StringIO()
+    csv.writer(text).writerows(rows)
+    return io.BytesIO(text.getvalue().encode("utf-8"))
+
+
+def _broadcast(d):
+    campaign_id = db.create_broadcast_campaign("query-plans-probe", "Перевірка планів", d.users)
+    db.get_broadcast_campaign(campaign_id)
+    db.get_unfinished_broadcasts()
+    db.set_broadcast_status(campaign_id, "running")
+    db.get_pending_deliveries(campaign_id, after_user_id=d.users[0])
+    db.record_broadcast_results(campaign_id, [(d.users[0], "sent", 1, None)])
+    db.get_broadcast_stats(campaign_id)
+
+
+def _topic_streaks(d):
+    db.get_topic_streak(d.user, d.topic)
+    db.set_topic_streak(d.user, d.topic, 4)
+    db.inc_topic_streak(d.user, d.topic)
+    db.has_topic_streak_award(d.user, d.topic, 5)
+    db.award_topic_streak_milestone(d.user, d.topic, 5)
+    db.mark_topic_streak_award(d.user, d.topic, 10)
+    db.reset_topic_streak(d.user, d.topic)
+    db.apply_topic_streak_answers([(d.user, d.topic, True), (d.other, d.topic, False)])
+
+
+def build_probes(d):
+    today = date.today()
+    task_id = d.task["id"]
+    return [
+        Probe("users", lambda: (
+            db.get_user(d.user), db.create_or_get_user(d.other), db.update_user(d.user, "city", "Київ"),
+            db.add_score(d.user, 1), db.get_user_field(d.user, "score"),
+            db.get_user_snapshot(d.user), db.get_user_snapshots(d.users),
+        )),
+        Probe("catalogue", lambda: (
+            db.get_task_level_totals(), db.get_all_topics(), db.get_all_topics(is_daily=True),
+            db.get_all_topics_by_category(d.category), db.get_available_levels_for_topic(d.topic),
+            db.get_all_tasks_by_topic(d.topic), db.get_task_by_id(task_id),
+        )),
+        Probe("random_task", lambda: (
+            db.get_random_task(d.topic, d.level, user_id=d.user), db.get_random_task(is_daily=True),
+        )),
+        Probe("tasks_page", lambda: (
+            db.get_tasks_page(d.topic), db.get_tasks_page(d.topic, after_id=task_id),
+            db.get_tasks_page(d.topic, before_id=task_id),
+        )),
+        Probe("task_edit", lambda: (
+            db.update_task_field(task_id, "question", d.task["question"] + " (ред.)"), db.delete_task(task_id),
+        )),
+        Probe("add_task", lambda: db.add_task({
+            "category": d.category, "topic": d.topic, "level": d.level, "task_type": "open",
+            "question": "Задача з перевірки планів", "answer": ["1"],
+        })),
+        Probe("import_tasks", lambda: db.import_tasks(_import_file(d))),
+        Probe("progress", lambda: (
+            db.all_tasks_completed(d.user, d.topic, d.level), db.get_user_completed_count(d.user, d.topic, d.level),
+            db.get_completed_task_ids(d.user), db.get_completed_task_ids(d.user, d.topic, d.level),
+            db.count_user_tasks(d.user), db.get_user_level_done(d.user), db.get_progress_aggregates(d.user),
+            db.refresh_progress_flags(d.user),
+        )),
+        Probe("answer", lambda: (
+            db.mark_task_completed(d.other, task_id, is_daily=False),
+            db.record_answer(d.user, d.task, is_correct=True, points=2, topic=d.topic),
+        )),
+        Probe("rating", lambda: (db.get_top_users(10), db.get_user_rank(d.other))),
+        Probe("ranked_users", db.get_ranked_users, full_scan=True),
+        Probe("badges", lambda: (db.unlock_badges(d.user, [("Фідбекер", 5)]), db.get_user_badges(d.user))),
+        Probe("feedback", lambda: (
+            db.add_feedback(d.user, "bench", "Перевірка планів"), db.get_feedback_page(),
+            db.get_feedback_page(after_id=d.feedback_id), db.get_feedback_page(before_id=d.feedback_id),
+        )),
+        Probe("all_feedback", db.get_all_feedback, full_scan=True),
+        Probe("activity", lambda: (
+            db.update_streak_and_reward(d.user),
+            db.flush_activity([(d.other, "bench", today), (d.users[1], None, today)]),
+        )),
+        Probe("topic_streaks", lambda: _topic_streaks(d)),
+        Probe("reengagement", lambda: (db.get_users_for_reengagement(3), db.get_users_for_reengagement(7))),
+        Probe("export", lambda: (
+            db.get_all_users_for_export(),
+            list(db.iter_users_for_export(active_since=today - timedelta(days=30), min_score=10)),
+        ), full_scan=True),
+        Probe("rebuild_counters", db.rebuild_progress_counters, full_scan=True),
+        Probe("conversation_state", lambda: (
+            db.load_conversation_state(d.user),
+            db.save_conversation_states([(d.user, '{"bench": true}')], deleted_ids=[d.other]),
+        )),
+        Probe("broadcast", lambda: _broadcast(d)),
+    ]
+
+
+# -----------------------------
+# EXPLAIN
+# -----------------------------
+def _nodes(node, depth=0):
+    yield node, depth
+    for child in node.get("Plans", ()):
+        yield from _nodes(child, depth + 1)
+
+
+def plan_shape(plan):
+    lines = []
+    for node, depth in _nodes(plan):
+        line = "  " * depth + node["Node Type"]
+        if node.get("Relation Name"):
+            line += f" on {node['Relation Name']}"
+        if node.get("Index Name"):
+            line += f" using {node['Index Name']}"
+        lines.append(line)
+    return lines
+
+
+def plan_findings(plan, row_threshold):
+    """[(підпис для порівняння з базою, опис)]: великі Seq Scan і Sort."""
+    findings = []
+    for node, _ in _nodes(plan):
+        loops = node.get("Actual Loops", 1) or 1
+        if node["Node Type"] == "Seq Scan":
+            rows = (node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)) * loops
+            if rows >= row_threshold:
+                findings.append((f"Seq Scan {node['Relation Name']}",
+                                 f"Seq Scan on {node['Relation Name']}: прочитано {rows:,} рядків"))
+        elif node["Node Type"] in ("Sort", "Incremental Sort"):
+            rows = node.get("Actual Rows", 0) * loops
+            on_disk = node.get("Sort Space Type") == "Disk"
+            if rows >= row_threshold or on_disk:
+                keys = ", ".join(node.get("Sort Key", ()))
+                findings.append((f"Sort {keys}",
+                                 f"Sort ({keys}): {rows:,} рядків, {node.get('Sort Method', '?')}"
+                                 f"{', на диску' if on_disk else ''}"))
+    return findings
+
+
+def explain(con, query):
+    """План JSON для одного запиту; ефекти EXPLAIN ANALYZE відкочуються до SAVEPOINT."""
+    cur = con.cursor()
+    cur.execute("SAVEPOINT query_plan")
+    try:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query)
+        result = cur.fetchone()[0]
+    except Exception:
+        cur.execute("ROLLBACK TO SAVEPOINT query_plan")
+        raise
+    cur.execute("ROLLBACK TO SAVEPOINT query_plan")
+    return result[0] if isinstance(result, list) else json.loads(result)[0]
+
+
+def _explainable(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8")
+    query = _DECLARE.sub("", query, count=1)
+    return query if query.lstrip().split(None, 1)[0].upper() in _EXPLAINABLE else None
+
+
+def run_probes(probes, sites, row_threshold):
+    """{ключ: результат} для кожного різного запиту; помилки проб — окремим списком."""
+    results, errors, seen = {}, [], set()
+    variants = {}
+    for probe in probes:
+        db.invalidate_catalogue()   # інакше запити з кешу каталогу не виконаються
+        try:
+            with db.unit_of_work() as con:
+                try:
+                    with db.capture_statements() as log:
+                        probe.run()
+                    for function, line, query in log:
+                        query = _explainable(query)
+                        if query is None:
+                            continue
+                        key = site_key(sites, function, line)
+                        # Той самий запит з іншими значеннями — не новий; інший текст на тому ж місці — варіант
+                        normalized = _LITERALS.sub("?", query)
+                        if (key, normalized) in seen:
+                            continue
+                        seen.add((key, normalized))
+                        variants[key] = variants.get(key, 0) + 1
+                        if variants[key] > 1:
+                            key = f"{key}/{variants[key]}"
+                        plan = explain(con, query)
+                        top = plan["Plan"]
+                        results[key] = {
+                            "probe": probe.name,
+                            "full_scan": probe.full_scan,
+                            "sql": " ".join(query.split())[:300],
+                            "ms": plan.get("Execution Time", 0.0),
+                            "shared_hit": top.get("Shared Hit Blocks", 0),
+                            "shared_read": top.get("Shared Read Blocks", 0),
+                            "plan": plan_shape(top),
+                            "findings": plan_findings(top, row_threshold),
+                        }
+                finally:
+                    con.rollback()
+        except Exception as e:
+            errors.append(f"{probe.name}: {type(e).__name__}: {e}")
+    return results, errors
+
+
+# -----------------------------
+# Звіт і база
+# -----------------------------
+def compare(results, baseline):
+    """(регресії, попередження) відносно збереженої бази."""
+    regressions, warnings = [], []
+    for key, r in results.items():
+        base = baseline.get(key)
+        if base is None:
+            if r["findings"] and not r["full_scan"]:
+                regressions.extend(f"{key}: {text} (нового запиту немає в базі)" for _, text in r["findings"])
+            continue
+        known = {signature for signature, _ in base["findings"]}
+        if not r["full_scan"]:
+            regressions.extend(f"{key}: {text}" for signature, text in r["findings"] if signature not in known)
+        if r["plan"] != base["plan"]:
+            diff = "\n".join(difflib.unified_diff(base["plan"], r["plan"], "база", "зараз", lineterm="", n=1))
+            warnings.append(f"{key}: план змінився\n{diff}")
+    return regressions, warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROW_THRESHOLD,
+                        help="Seq Scan / Sort від стількох рядків — знахідка")
+    parser.add_argument("--only", nargs="+", help="лише проби з цими назвами")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--show-plans", action="store_true")
+    parser.add_argument("--save-baseline", help="зберегти плани і знахідки в JSON")
+    parser.add_argument("--baseline", help="порівняти з раніше збереженим JSON")
+    parser.add_argument("--strict", action="store_true", help="непокриті запити db.py — помилка")
+    args = parser.parse_args()
+
+    if not metrics.METRICS_ENABLED:
+        print("METRICS=0: з'єднання не інструментовані, запити не збираються.")
+        sys.exit(1)
+    db.init_db()
+    fixture = load_fixture()
+    sites = inventory()
+    probes = build_probes(ProbeData(fixture, random.Random(args.seed)))
+    if args.only:
+        probes = [p for p in probes if p.name in args.only]
+    results, errors = run_probes(probes, sites, args.rows)
+
+    unexpected = 0
+    print(f"{'запит':<38} {'проба':<18} {'ms':>9} {'hit':>8} {'read':>7}  знахідки")
+    for key, r in sorted(results.items()):
+        findings = "; ".join(text for _, text in r["findings"])
+        if r["findings"] and r["full_scan"]:
+            findings = f"(очікувано) {findings}"
+        elif r["findings"]:
+            unexpected += 1
+        print(f"{key:<38} {r['probe']:<18} {r['ms']:>9.2f} {r['shared_hit']:>8} {r['shared_read']:>7}  {findings}")
+        if args.show_plans:
+            print("\n".join("    " + line for line in r["plan"]))
+
+    covered = {key.split("/")[0] for key in results}
+    missing = [f"{function}#{n} (db.py:{start})" for function, calls in sites.items()
+               for n, (start, _) in enumerate(calls, start=1) if f"{function}#{n}" not in covered]
+    if missing:
+        print(f"\nНе покрито пробами ({len(missing)}): " + ", ".join(missing))
+    for line in errors:
+        print(f"ПОМИЛКА {line}")
+
+    failed = bool(errors) or (args.strict and bool(missing))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions, warnings = compare(results, json.load(f)["statements"])
+        for line in warnings:
+            print(f"\nУВАГА {line}")
+        for line in regressions:
+            print(f"РЕГРЕСІЯ {line}")
+        failed = failed or bool(regressions)
+    else:
+        failed = failed or bool(unexpected)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"rows": args.rows, "statements": results}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"\nБазу збережено: {args.save_baseline} ({len(results)} запитів)")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
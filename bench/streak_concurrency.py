@@ -0,0 +1,110 @@
+"""
+Перевірка стріків у темах під паралельним навантаженням (потрібна робоча БД з PG_* змінних).
+
+Кілька потоків одночасно інкрементують стрік одного користувача в одній темі:
+- атомарний db.inc_topic_streak (один upsert) — жодного втраченого інкременту;
+- для порівняння стара схема «get_topic_streak, потім set_topic_streak» — губить оновлення;
+- db.apply_topic_streak_answers пакетами паралельно з одиночними інкрементами.
+Також перевіряється, що award_topic_streak_milestone повертає True рівно один раз.
+Тестовий користувач створюється і видаляється скриптом. Код виходу 1 — якщо атомарні варіанти щось загубили.
+
+    python -m bench.streak_concurrency --threads 16 --per-thread 200
+"""
+import argparse
+import sys
+import threading
+import time
+
+import db
+
+TEST_USER_ID = 9_000_000_000_001
+TEST_TOPIC = "__streak_concurrency__"
+
+
+def _run_threads(threads, fn):
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        barrier.wait()
+        fn()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started
+
+
+def _legacy_inc(user_id, topic):
+    # Так працював inc_topic_streak раніше: читання і запис у різних транзакціях
+    db.set_topic_streak(user_id, topic, db.get_topic_streak(user_id, topic) + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--per-thread", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=50, help="відповідей в одному пакеті apply_topic_streak_answers")
+    args = parser.parse_args()
+
+    db.init_db()
+    expected = args.threads * args.per_thread
+    failed = False
+    with db.connect() as con:
+        con.cursor().execute("INSERT INTO users (id) VALUES (%s) ON CONFLICT DO NOTHING", (TEST_USER_ID,))
+
+    try:
+        print(f"{'variant':<28} {'expected':>9} {'got':>7} {'lost':>6} {'seconds':>8}")
+
+        def report(name, got, elapsed, must_match):
+            nonlocal failed
+            lost = expected - got
+            print(f"{name:<28} {expected:>9} {got:>7} {lost:>6} {elapsed:>8.2f}")
+            if must_match and lost:
+                failed = True
+
+        db.set_topic_streak(TEST_USER_ID, TEST_TOPIC, 0)
+        elapsed = _run_threads(args.threads, lambda: [_legacy_inc(TEST_USER_ID, TEST_TOPIC) for _ in range(args.per_thread)])
+        report("get + set (legacy)", db.get_topic_streak(TEST_USER_ID, TEST_TOPIC), elapsed, must_match=False)
+
+        db.set_topic_streak(TEST_USER_ID, TEST_TOPIC, 0)
+        elapsed = _run_threads(args.threads, lambda: [db.inc_topic_streak(TEST_USER_ID, TEST_TOPIC) for _ in range(args.per_thread)])
+        report("inc_topic_streak", db.get_topic_streak(TEST_USER_ID, TEST_TOPIC), elapsed, must_match=True)
+
+        # Половина потоків — пакети, половина — одиночні інкременти
+        db.set_topic_streak(TEST_USER_ID, TEST_TOPIC, 0)
+        counter = iter(range(args.threads))
+        lock = threading.Lock()
+
+        def mixed():
+            with lock:
+                n = next(counter)
+            if n % 2:
+                for _ in range(args.per_thread):
+                    db.inc_topic_streak(TEST_USER_ID, TEST_TOPIC)
+                return
+            left = args.per_thread
+            while left:
+                size = min(args.batch, left)
+                db.apply_topic_streak_answers([(TEST_USER_ID, TEST_TOPIC, True)] * size, award_bonus=False)
+                left -= size
+
+        elapsed = _run_threads(args.threads, mixed)
+        report("batched + inc (mixed)", db.get_topic_streak(TEST_USER_ID, TEST_TOPIC), elapsed, must_match=True)
+
+        results = []
+        _run_threads(args.threads, lambda: results.append(db.award_topic_streak_milestone(TEST_USER_ID, TEST_TOPIC, 5)))
+        awarded = sum(results)
+        print(f"award_topic_streak_milestone: True у {awarded} з {len(results)} викликів (очікується 1)")
+        failed = failed or awarded != 1
+    finally:
+        with db.connect() as con:
+            con.cursor().execute("DELETE FROM users WHERE id = %s", (TEST_USER_ID,))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
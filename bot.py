@@ -1,24 +1,67 @@
 import os
+import json
+import logging
 import datetime
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes
+import functools
+import importlib
+from telegram import Update
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes, TypeHandler
+from telegram.request import HTTPXRequest
 # from dotenv import load_dotenv
 
 # load_dotenv()
 
 from handlers.start import start_handler
-from handlers.admin import (
-    admin_message_handler,
-    addtask_handler,
-    handle_task_pagination_callback,
-    handle_feedback_pagination_callback,
-    handle_admin_photo,
-    notify_admin_promotion,
-)
 from handlers.task import main_message_handler, handle_contact
-from db import init_db, get_users_for_reengagement 
+from db_async import get_users_for_reengagement
+import db
+import db_async
+from persistence import PostgresPersistence, USE_PG_PERSISTENCE
+from update_processor import PerUserUpdateProcessor
+from instrumented_request import InstrumentedRequest
+import leaderboard
+import activity
+import metrics
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
 
 TOKEN = os.getenv("TELEGRAM_TOKEN")
 
+# UPDATE_CONCURRENCY=N (>1) — обробляти до N апдейтів одночасно (порядок у межах користувача зберігається)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "1"))
+
+# WEBHOOK_URL=https://host — приймати апдейти через webhook замість polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# Розмір пулу HTTP-з'єднань до Bot API (як у ApplicationBuilder за замовчуванням)
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "256"))
+
+# RECORD_UPDATES=path.jsonl — дописувати кожен вхідний апдейт у файл (для bench/fake_telegram.py)
+RECORD_UPDATES = os.getenv("RECORD_UPDATES")
+
+def lazy_handler(module, name):
+    """
+    Хендлер з модуля, що імпортується лише при першому виклику.
+    Адмінка (разом з експортом та імпортом задач) потрібна рідко, тож не сповільнює старт.
+    """
+    async def handler(update, context):
+        return await getattr(importlib.import_module(module), name)(update, context)
+    handler.__name__ = name
+    return handler
+
+
+admin_message_handler = lazy_handler("handlers.admin", "admin_message_handler")
+
+
+@metrics.timed
 async def router(update, context):
     text = update.message.text
     if text == "🔐 Адмінка" or context.user_data.get('admin_menu_state'):
@@ -27,56 +70,110 @@ async def router(update, context):
         await main_message_handler(update, context)
 
 
+REENGAGE_TEXT_3 = (
+    "👋 Привіт! Помітили, що ти давно не заходив.\n\n"
+    "Твої математичні навички вже сумують! 🧠 Задачі самі себе не вирішать.\n\n"
+    "Натисни /start, щоб повернутись у меню, або, "
+    "якщо щось не так чи бракує тем, напиши нам через '❓ Допомога / Зв’язок'."
+)
+
+REENGAGE_TEXT_7 = (
+    "😥 Ми сумуємо без тебе... Можливо, щось не так?\n\n"
+    "Ми активно додаємо нові задачі та теми. "
+    "Дай нам знати, чого тобі не вистачає для підготовки до НМТ!"
+)
+
+
 async def check_inactive_users(context: ContextTypes.DEFAULT_TYPE):
-    print(f"[{datetime.datetime.now()}] Job 'check_inactive_users': Запущено перевірку...")
-    
-    # --- Повідомлення через 3 дні ---
-    try:
-        # Шукаємо тих, хто був активний рівно 3 дні тому
-        inactive_users = get_users_for_reengagement(days_ago=3)
-        print(f"  > Знайдено {len(inactive_users)} користувачів (неактивні 3 дні).")
-        
-        message_text = (
-            "👋 Привіт! Помітили, що ти давно не заходив.\n\n"
-            "Твої математичні навички вже сумують! 🧠 Задачі самі себе не вирішать.\n\n"
-            "Натисни /start, щоб повернутись у меню, або, "
-            "якщо щось не так чи бракує тем, напиши нам через '❓ Допомога / Зв’язок'."
-        )
-            
-        for (user_id,) in inactive_users:
-            try:
-                await context.bot.send_message(chat_id=user_id, text=message_text)
-                print(f"    > Надіслано нагадування юзеру {user_id}")
-            except Exception as e:
-
-                print(f"    > ПОМИЛКА відправки юзеру {user_id}: {e}")
-
-        inactive_users_7 = get_users_for_reengagement(days_ago=7)
-        print(f"  > Знайдено {len(inactive_users_7)} користувачів (неактивні 7 днів).")
-        
-        message_text_7 = (
-            "😥 Ми сумуємо без тебе... Можливо, щось не так?\n\n"
-            "Ми активно додаємо нові задачі та теми. "
-            "Дай нам знати, чого тобі не вистачає для підготовки до НМТ!"
-        )
+    logger.info("Job 'check_inactive_users': запущено перевірку...")
+    from broadcast import get_broadcaster
+    broadcaster = get_broadcaster(context.bot)
+    today = datetime.date.today().isoformat()
+
+    for days_ago, message_text in ((3, REENGAGE_TEXT_3), (7, REENGAGE_TEXT_7)):
+        try:
+            # Шукаємо тих, хто був активний рівно days_ago днів тому
+            inactive_users = await get_users_for_reengagement(days_ago=days_ago)
+            logger.info(f"Знайдено {len(inactive_users)} користувачів (неактивні {days_ago} дн.).")
+            # key з датою: повторний запуск того ж дня продовжує ту саму кампанію
+            await broadcaster.start_campaign(
+                f"reengage-{days_ago}d-{today}", message_text, [uid for (uid,) in inactive_users]
+            )
+        except Exception as e:
+            logger.error(f"Збій у розсилці для неактивних {days_ago} дн.: {e}", exc_info=True)
+
+    logger.info("Job 'check_inactive_users': завершено.")
 
-        for (user_id,) in inactive_users_7:
-            try:
-                await context.bot.send_message(chat_id=user_id, text=message_text_7)
-                print(f"    > Надіслано 7-денне нагадування юзеру {user_id}")
-            except Exception as e:
-                print(f"    > ПОМИЛКА відправки 7-денного юзеру {user_id}: {e}")
 
-                
+async def resume_broadcasts(context: ContextTypes.DEFAULT_TYPE):
+    from broadcast import get_broadcaster
+    try:
+        await get_broadcaster(context.bot).resume_unfinished()
     except Exception as e:
-        print(f"[ПОМИЛКА] Збій у завданні check_inactive_users: {e}")
-    
-    print(f"[{datetime.datetime.now()}] Job 'check_inactive_users': Завершено.")
+        logger.error(f"Не вдалося продовжити розсилки: {e}", exc_info=True)
+
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    with open(RECORD_UPDATES, "a", encoding="utf-8") as f:
+        f.write(json.dumps(update.to_dict(), ensure_ascii=False) + "\n")
+
+
+async def on_startup(app: Application):
+    # Пул з'єднань і перевірка схеми — тут, а не при імпорті модулів:
+    # на актуальній схемі це одне з'єднання і один SELECT версії
+    db.init_pool()
+    db.init_db()
+
+
+async def on_shutdown(app: Application):
+    # Дописати накопичену активність до зупинки пулу потоків БД
+    await activity.activity_tracker.flush()
+    db_async.shutdown()
+
+
+def register_handlers(app: Application):
+    if RECORD_UPDATES:
+        app.add_handler(TypeHandler(Update, record_update), group=-1)
+    admin = functools.partial(lazy_handler, "handlers.admin")
+    app.add_handler(CommandHandler("start", start_handler))
+    app.add_handler(CommandHandler("promote", admin("notify_admin_promotion")))
+    app.add_handler(CommandHandler("export", admin("export_command")))
+    app.add_handler(CommandHandler("stats", admin("stats_command")))
+    app.add_handler(MessageHandler(filters.PHOTO, admin("handle_admin_photo")))
+    app.add_handler(MessageHandler(filters.CONTACT, handle_contact))
+    app.add_handler(MessageHandler(filters.Document.ALL, admin("handle_import_document")))
+    app.add_handler(CallbackQueryHandler(admin("handle_feedback_pagination_callback"), pattern="^feedback_"))
+    app.add_handler(CallbackQueryHandler(admin("handle_import_callback"), pattern="^import_"))
+    app.add_handler(CallbackQueryHandler(admin("handle_task_pagination_callback")))
+    app.add_handler(CommandHandler("addtask", admin("addtask_handler")))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, router))
+
+
+def build_application(builder=None, concurrency=UPDATE_CONCURRENCY):
+    """Збирає Application з усіма хендлерами. bench/ передає сюди свій builder (фейковий Telegram)."""
+    if builder is None:
+        # Час кожного виклику Bot API — у metrics (bot_telegram_api_seconds)
+        builder = (
+            Application.builder().token(TOKEN)
+            .request(InstrumentedRequest(HTTPXRequest(connection_pool_size=TELEGRAM_POOL_SIZE)))
+            .get_updates_request(InstrumentedRequest(HTTPXRequest()))
+        )
+    builder = builder.post_init(on_startup).post_shutdown(on_shutdown)
+    if USE_PG_PERSISTENCE:
+        # Стан діалогів переживає рестарт і спільний для кількох реплік
+        builder = builder.persistence(PostgresPersistence())
+    if concurrency > 1:
+        # Різні користувачі обробляються паралельно, апдейти одного — по черзі
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(concurrency))
+    app = builder.build()
+    register_handlers(app)
+    return app
 
 
 def main():
-    init_db()
-    app = Application.builder().token(TOKEN).build()
+    db_async.configure()
+    metrics.start_http_server()
+    app = build_application()
     
     job_queue = app.job_queue
     
@@ -89,18 +186,39 @@ def main():
     )
     
     print(f"Завдання 'check_inactive_users' заплановано на {run_time} UTC щодня.")
+
+    # Перша перебудова рейтингу — одразу після старту, у фоні (rebuild_job працює в окремому потоці);
+    # поки вона триває, get_top_users/get_user_rank читають з БД (leaderboard.ready = False)
+    job_queue.run_repeating(
+        leaderboard.rebuild_job,
+        interval=leaderboard.LEADERBOARD_REBUILD_INTERVAL,
+        first=0,
+        name="leaderboard_rebuild"
+    )
+
+    job_queue.run_repeating(
+        activity.flush_job,
+        interval=activity.ACTIVITY_FLUSH_INTERVAL,
+        first=activity.ACTIVITY_FLUSH_INTERVAL,
+        name="activity_flush"
+    )
+
+    # Кампанії, перервані рестартом, дорозсилаються одразу після старту
+    job_queue.run_once(resume_broadcasts, when=5, name="resume_broadcasts")
+    print(f"Паралельна обробка апдейтів: {UPDATE_CONCURRENCY}.")
     
-    app.add_handler(CommandHandler("start", start_handler))
-    app.add_handler(CommandHandler("promote", notify_admin_promotion))
-    app.add_handler(MessageHandler(filters.PHOTO, handle_admin_photo))
-    app.add_handler(MessageHandler(filters.CONTACT, handle_contact))
-    app.add_handler(CallbackQueryHandler(handle_feedback_pagination_callback, pattern="^feedback_"))
-    app.add_handler(CallbackQueryHandler(handle_task_pagination_callback))
-    app.add_handler(CommandHandler("addtask", addtask_handler))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, router))
-    
-    print("Бот запущено...")
-    app.run_polling()
+    if WEBHOOK_URL:
+        print(f"Бот запущено (webhook, порт {WEBHOOK_PORT})...")
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        print("Бот запущено...")
+        app.run_polling()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,253 @@
+import os
+import time
+import asyncio
+import logging
+import datetime
+
+from telegram.error import RetryAfter, Forbidden, BadRequest, TimedOut, NetworkError
+
+from db_async import (
+    create_broadcast_campaign,
+    get_broadcast_campaign,
+    get_unfinished_broadcasts,
+    set_broadcast_status,
+    get_pending_deliveries,
+    record_broadcast_results,
+    get_broadcast_stats,
+)
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+# Bot API: ~30 повідомлень/с на бота і ~1/с в один чат. Беремо із запасом.
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1.0"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_BATCH = int(os.getenv("BROADCAST_BATCH", "500"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+# Результати пишуться в БД кожні N доставок або раз на інтервал (сек.): після збою
+# повторно надсилаються лише доставки з останньої незаписаної порції
+BROADCAST_FLUSH_SIZE = int(os.getenv("BROADCAST_FLUSH_SIZE", "50"))
+BROADCAST_FLUSH_INTERVAL = float(os.getenv("BROADCAST_FLUSH_INTERVAL", "1.0"))
+
+
+# -----------------------------
+# Обмеження швидкості
+# -----------------------------
+class TokenBucket:
+    """
+    Класичний token bucket: `rate` токенів за секунду, не більше `capacity` у запасі.
+    pause() зупиняє видачу на вказаний час (відповідь 429 retry_after від Telegram).
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+class PerChatLimiter:
+    """Не частіше одного повідомлення в чат за `interval` секунд."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next_allowed = {}
+
+    async def acquire(self, chat_id):
+        now = time.monotonic()
+        if len(self._next_allowed) > 10_000:
+            self._next_allowed = {c: t for c, t in self._next_allowed.items() if t > now}
+        allowed = self._next_allowed.get(chat_id, 0.0)
+        self._next_allowed[chat_id] = max(now, allowed) + self.interval
+        if allowed > now:
+            await asyncio.sleep(allowed - now)
+
+
+def _retry_after_seconds(error):
+    delay = error.retry_after
+    if isinstance(delay, datetime.timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+# -----------------------------
+# Розсилка
+# -----------------------------
+class Broadcaster:
+    """
+    Надсилає кампанії з broadcast_campaigns/broadcast_deliveries.
+
+    Отримувачі читаються порціями по `batch_size`, надсилаються з обмеженням
+    `concurrency` одночасних запитів і спільним TokenBucket; результати пишуться
+    в БД кожні `flush_size` доставок або `flush_interval` секунд, тож після рестарту
+    run() продовжує з невідправлених і повторює щонайбільше останню незаписану порцію.
+    """
+
+    def __init__(self, bot, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY,
+                 batch_size=BROADCAST_BATCH, max_attempts=BROADCAST_MAX_ATTEMPTS,
+                 per_chat_interval=BROADCAST_PER_CHAT_INTERVAL,
+                 flush_size=BROADCAST_FLUSH_SIZE, flush_interval=BROADCAST_FLUSH_INTERVAL):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.per_chat = PerChatLimiter(per_chat_interval)
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.retry_after_total = 0
+        self._running = set()
+
+    async def _deliver(self, user_id, text):
+        """
+        Повертає (user_id, status, sends, error). Спроби (max_attempts) витрачають лише
+        TimedOut/NetworkError; після RetryAfter запит повторюється, коли мине пауза.
+        """
+        error = None
+        attempts = sends = 0
+        while attempts < self.max_attempts:
+            await self.bucket.acquire()
+            await self.per_chat.acquire(user_id)
+            sends += 1
+            try:
+                await self.bot.send_message(chat_id=user_id, text=text)
+                return user_id, "sent", sends, None
+            except RetryAfter as e:
+                # Ліміт перевищено для всього бота — зупиняємо всіх, а не лише цей запит
+                delay = _retry_after_seconds(e)
+                self.retry_after_total += 1
+                logger.warning(f"Розсилка: RetryAfter {delay:.0f} с, пауза.")
+                self.bucket.pause(delay)
+            except Forbidden as e:
+                return user_id, "blocked", sends, str(e)
+            except BadRequest as e:
+                return user_id, "failed", sends, str(e)
+            except (TimedOut, NetworkError) as e:
+                attempts += 1
+                error = str(e)
+                if attempts < self.max_attempts:
+                    await asyncio.sleep(min(2 ** attempts, 30))
+            except Exception as e:
+                logger.error(f"Розсилка: неочікувана помилка для {user_id}: {e}", exc_info=True)
+                return user_id, "failed", sends, str(e)
+        return user_id, "failed", sends, error
+
+    async def run(self, campaign_id):
+        if campaign_id in self._running:
+            return None
+        self._running.add(campaign_id)
+        try:
+            return await self._run(campaign_id)
+        finally:
+            self._running.discard(campaign_id)
+
+    async def _run(self, campaign_id):
+        campaign = await get_broadcast_campaign(campaign_id)
+        if campaign is None:
+            logger.error(f"Розсилка #{campaign_id} не знайдена.")
+            return None
+        if campaign["status"] == "done":
+            return await get_broadcast_stats(campaign_id)
+
+        text = campaign["message"]
+        await set_broadcast_status(campaign_id, "running")
+        logger.info(f"Розсилка #{campaign_id} ({campaign['key']}): старт.")
+
+        started = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        unsaved = []
+
+        async def flush():
+            if not unsaved:
+                return
+            results = unsaved[:]
+            unsaved.clear()
+            try:
+                await record_broadcast_results(campaign_id, results)
+            except Exception:
+                unsaved.extend(results)   # запишуться наступним flush
+                raise
+
+        async def flush_periodically():
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                try:
+                    await flush()
+                except Exception as e:
+                    logger.error(f"Розсилка #{campaign_id}: не вдалося записати результати: {e}", exc_info=True)
+
+        async def bounded(user_id):
+            async with semaphore:
+                unsaved.append(await self._deliver(user_id, text))
+            if len(unsaved) >= self.flush_size:
+                await flush()
+
+        flusher = asyncio.create_task(flush_periodically())
+        try:
+            after = None
+            while True:
+                user_ids = await get_pending_deliveries(campaign_id, after_user_id=after, limit=self.batch_size)
+                if not user_ids:
+                    break
+                await asyncio.gather(*(bounded(uid) for uid in user_ids))
+                after = user_ids[-1]
+        finally:
+            flusher.cancel()
+            await flush()
+
+        await set_broadcast_status(campaign_id, "done")
+        stats = await get_broadcast_stats(campaign_id)
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Розсилка #{campaign_id} завершена за {elapsed:.1f} с: надіслано {stats['sent']}, "
+            f"заблокували бота {stats['blocked']}, помилок {stats['failed']} "
+            f"(RetryAfter: {self.retry_after_total})."
+        )
+        return stats
+
+    async def start_campaign(self, key, message, user_ids):
+        """Створює (або знаходить незавершену з тим самим key) кампанію і виконує її."""
+        campaign_id = await create_broadcast_campaign(key, message, list(user_ids))
+        return await self.run(campaign_id)
+
+    async def resume_unfinished(self):
+        for campaign_id in await get_unfinished_broadcasts():
+            logger.info(f"Розсилка #{campaign_id}: продовжуємо після рестарту.")
+            await self.run(campaign_id)
+
+
+_broadcaster = None
+
+def get_broadcaster(bot):
+    """Один Broadcaster на процес: усі кампанії ділять спільний ліміт швидкості."""
+    global _broadcaster
+    if _broadcaster is None or _broadcaster.bot is not bot:
+        _broadcaster = Broadcaster(bot)
+    return _broadcaster
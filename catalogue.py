@@ -0,0 +1,102 @@
+import time
+import random
+import threading
+import logging
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+
+class CatalogueCache:
+    """
+    Кеш каталогу задач у пам'яті процесу (теми, рівні, задачі).
+
+    Значення завантажуються ліниво через loader і живуть до invalidate().
+    Між процесами кеш узгоджується через лічильник версії в БД: не частіше ніж
+    раз на `check_interval` секунд читається поточна версія, і якщо її змінив
+    інший процес (add_task/update_task_field/delete_task) — кеш очищується.
+    """
+
+    def __init__(self, fetch_version, check_interval=5.0):
+        self._fetch_version = fetch_version
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._data = {}
+        self._version = None
+        self._checked_at = 0.0
+        # Збільшується при кожному очищенні; не даємо завантаженню,
+        # що почалося до invalidate(), записати застарілі дані
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def _maybe_check_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            version = self._fetch_version()
+        except Exception as e:
+            logger.warning(f"Не вдалося перевірити версію каталогу: {e}")
+            return
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    logger.info(f"Каталог змінився (версія {self._version} -> {version}), кеш очищено.")
+                self._data.clear()
+                self._generation += 1
+                self._version = version
+
+    def get(self, key, loader):
+        self._maybe_check_version()
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            if generation == self._generation:
+                self._data[key] = value
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+            # Наступний get() одразу перечитає версію з БД
+            self._checked_at = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {"keys": len(self._data), "hits": self.hits, "misses": self.misses, "version": self._version}
+
+
+def pick_random_id(candidate_ids, excluded=(), rng=random, probes=8):
+    """
+    Рівномірно обирає id з candidate_ids, якого немає в excluded, без сортування.
+
+    Спочатку кілька випадкових спроб (O(1), поки виключених небагато),
+    і лише якщо всі влучили у виключені — один лінійний прохід по решті.
+    Повертає None, якщо обирати нема з чого.
+    """
+    n = len(candidate_ids)
+    if n == 0:
+        return None
+    for _ in range(probes):
+        candidate = candidate_ids[rng.randrange(n)]
+        if candidate not in excluded:
+            return candidate
+    remaining = [i for i in candidate_ids if i not in excluded]
+    return rng.choice(remaining) if remaining else None
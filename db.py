@@ -1,11 +1,21 @@
 import os
+import sys
+import time
 import psycopg2
 import json
+from array import array
 from datetime import date, timedelta
-from psycopg2 import pool, InterfaceError, extras # ✅ ДОДАНО extras
+from psycopg2 import InterfaceError, extras # ✅ ДОДАНО extras
 import contextlib
+import collections
+import contextvars
+import threading
 import logging
 
+from pg_pool import BoundedConnectionPool
+from catalogue import CatalogueCache, pick_random_id
+import metrics
+
 # --- Налаштування логера ---
 logger = logging.getLogger(__name__)
 if not logger.hasHandlers():
@@ -23,178 +33,283 @@ except Exception as e:
 # -----------------------------
 # Connection Pool (з налаштуваннями для AWS)
 # -----------------------------
-try:
-    db_pool = psycopg2.pool.SimpleConnectionPool(
-        minconn=1,
-        maxconn=10,
-        dbname=os.getenv("PG_DBNAME"),
-        user=os.getenv("PG_USER"),
-        password=os.getenv("PG_PASSWORD"),
-        host=os.getenv("PG_HOST"),
-        port=os.getenv("PG_PORT"),
-        sslmode="require",
-        # --- KEEPALIVES (Щоб AWS не розривав з'єднання) ---
-        keepalives=1,
-        keepalives_idle=30,
-        keepalives_interval=10,
-        keepalives_count=5
-        # --------------------------------------------------
-    )
-    logger.info("✅ Пул з'єднань з PostgreSQL успішно створено.")
-except Exception as e:
-    logger.error(f"❌ ПОМИЛКА: Не вдалося створити пул з'єднань: {e}", exc_info=True)
-    db_pool = None
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Після скількох секунд простою з'єднання перевіряється через SELECT 1
+DB_POOL_IDLE_CHECK = float(os.getenv("DB_POOL_IDLE_CHECK", "30"))
 
 # -----------------------------
-# Оновлена функція connect()
+# Інструментовані з'єднання (metrics.observe_query на кожен execute)
 # -----------------------------
+# Список для capture_statements(): (функція db.py, рядок, запит з підставленими параметрами)
+_statement_log = contextvars.ContextVar("db_statement_log", default=None)
+
 @contextlib.contextmanager
-def connect():
-    if db_pool is None:
-        logger.critical("Пул з'єднань не ініціалізовано!")
-        raise Exception("Пул з'єднань не ініціалізовано!")
+def capture_statements():
+    """
+    Збирає всі запити, виконані в цьому контексті (для bench/query_plans.py).
+    Працює лише з інструментованими з'єднаннями, тобто коли METRICS != 0.
+    """
+    log = []
+    token = _statement_log.set(log)
+    try:
+        yield log
+    finally:
+        _statement_log.reset(token)
+
+def _log_statement(query):
+    log = _statement_log.get()
+    if log is None:
+        return
+    # Найближчий кадр з db.py (execute_values викликає execute вже з psycopg2.extras)
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename != __file__:
+        frame = frame.f_back
+    if frame is not None:
+        log.append((frame.f_code.co_name, frame.f_lineno, query))
+
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        finally:
+            metrics.observe_query(query, time.perf_counter() - started)
+        _log_statement(self.query)
+        return result
 
-    con = None
-    retries = 3 # Кількість повторних спроб
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metrics.observe_query(query, time.perf_counter() - started)
 
-    while retries >= 0:
-        need_retry = False
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
         try:
-            con = db_pool.getconn()
-            # --- ПЕРЕВІРКА З'ЄДНАННЯ ---
-            con.cursor().execute("SELECT 1")
-            
-            yield con 
-            con.commit()
-            break 
+            return super().copy_expert(sql, file, size)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - started)
+
+
+_timed_cursor_classes = {}
+
+def _timed_cursor_class(base):
+    cls = _timed_cursor_classes.get(base)
+    if cls is None:
+        cls = _timed_cursor_classes[base] = type(f"Timed{base.__name__}", (_TimedCursorMixin, base), {})
+    return cls
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Кожен курсор (і DictCursor, і named) — підклас з таймером; сам psycopg2 не змінюється."""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _timed_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+
+# Пул створюється при першому зверненні (або явно через init_pool() у post_init бота),
+# а не під час імпорту: імпорт db.py не відкриває з'єднань
+db_pool = None
+_pool_lock = threading.Lock()
+
+def init_pool():
+    """Створює пул з'єднань, якщо його ще немає; повертає пул. Помилка з'єднання пробрасується."""
+    global db_pool
+    if db_pool is not None:
+        return db_pool
+    with _pool_lock:
+        if db_pool is None:
+            try:
+                db_pool = BoundedConnectionPool(
+                    minconn=DB_POOL_MIN,
+                    maxconn=DB_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                    idle_check_after=DB_POOL_IDLE_CHECK,
+                    dbname=os.getenv("PG_DBNAME"),
+                    user=os.getenv("PG_USER"),
+                    password=os.getenv("PG_PASSWORD"),
+                    host=os.getenv("PG_HOST"),
+                    port=os.getenv("PG_PORT"),
+                    sslmode="require",
+                    connection_factory=InstrumentedConnection if metrics.METRICS_ENABLED else None,
+                    # --- KEEPALIVES (Щоб AWS не розривав з'єднання) ---
+                    keepalives=1,
+                    keepalives_idle=30,
+                    keepalives_interval=10,
+                    keepalives_count=5
+                    # --------------------------------------------------
+                )
+            except Exception as e:
+                logger.error(f"❌ ПОМИЛКА: Не вдалося створити пул з'єднань: {e}", exc_info=True)
+                raise
+            logger.info("✅ Пул з'єднань з PostgreSQL успішно створено.")
+    return db_pool
 
-        except (psycopg2.OperationalError, InterfaceError) as e:
-            logger.warning(f"Проблема зі з'єднанням БД ({type(e).__name__}): {e}. Спроба {3-retries}/3...")
-            if con:
-                try:
-                    db_pool.putconn(con, close=True)
-                    logger.info("Погане з'єднання повернуто в пул для закриття.")
-                except InterfaceError:
-                    pass
-                except Exception as put_err:
-                    logger.error(f"Помилка при поверненні поганого з'єднання: {put_err}")
-                con = None
-
-            retries -= 1
-            if retries < 0:
-                logger.error("Не вдалося отримати живе з'єднання з БД після повторних спроб.")
-                raise ConnectionError("Не вдалося отримати живе з'єднання з БД.") from e
-            need_retry = True
-
-        except Exception as e_other:
-            logger.error(f"Інша помилка при роботі з БД: {e_other}", exc_info=True)
-            if con:
+def pool_stats():
+    """Метрики пулу: очікування, кількість видач, відкриті/вільні/зламані з'єднання."""
+    return db_pool.stats() if db_pool else {}
+
+for _key in ("open", "idle", "in_use", "timeouts_total", "broken_total"):
+    metrics.register_gauge(f"bot_db_pool_{_key}", f"Connection pool: {_key}", lambda key=_key: pool_stats().get(key, 0))
+
+# З'єднання активної unit_of_work(); всі connect() всередині неї повертають саме його
+_uow_con = contextvars.ContextVar("db_uow_con", default=None)
+# Події поточної транзакції; розсилаються підписникам лише після commit
+_tx_events = contextvars.ContextVar("db_tx_events", default=None)
+# Черга подій активної розсилки _dispatch() (None — розсилка зараз не йде)
+_dispatch_queue = contextvars.ContextVar("db_dispatch_queue", default=None)
+
+
+# -----------------------------
+# Domain events (після commit)
+# -----------------------------
+_listeners = []
+
+def subscribe(listener):
+    """
+    listener(event, payload) викликається після commit транзакції, що згенерувала подію
+    (у потоці, де виконувався запит). Події відкоченої транзакції не надходять.
+    Події, згенеровані самим обробником, надходять після того, як поточну подію
+    отримали всі підписники.
+
+    Події та payload:
+      "score_changed", "name_changed" — user_id, score, display_name;
+      "task_completed" — user_id, task_id, topic, level (None для щоденних),
+                         + all_tasks_completed, topics_total, topics_completed, якщо прапорці оновились;
+      "badge_unlocked" — user_id, badge;
+      "streak_changed" — user_id, streak_days, last_activity;
+      "feedback_added" — user_id, feedbacks.
+    """
+    _listeners.append(listener)
+
+def _emit(event, **payload):
+    pending = _tx_events.get()
+    if pending is None:
+        _dispatch([(event, payload)])
+    else:
+        pending.append((event, payload))
+
+def _dispatch(events):
+    # Події, що з'явилися під час розсилки (обробник сам пише в БД, напр. бейдж з нагородою),
+    # ставляться в чергу і йдуть після того, як поточну подію отримали всі підписники, —
+    # інакше наступні підписники отримали б новіші бали раніше за старіші.
+    queue = _dispatch_queue.get()
+    if queue is not None:
+        queue.extend(events)
+        return
+    queue = collections.deque(events)
+    token = _dispatch_queue.set(queue)
+    try:
+        while queue:
+            event, payload = queue.popleft()
+            for listener in _listeners:
                 try:
-                    con.rollback()
-                except Exception:
-                    pass
-            raise
+                    listener(event, payload)
+                except Exception as e:
+                    logger.error(f"Помилка обробника події {event}: {e}", exc_info=True)
+    finally:
+        _dispatch_queue.reset(token)
+
+# -----------------------------
+# Оновлена функція connect()
+# -----------------------------
+@contextlib.contextmanager
+def connect(readonly=False):
+    """
+    Видає з'єднання з пулу. Звичайний режим — одна транзакція з commit у кінці.
+    readonly=True — autocommit без BEGIN/COMMIT, для функцій, що лише читають
+    (і для migrations/, що керує транзакціями сам).
+    Усередині unit_of_work() повертає її з'єднання без окремого commit.
+    """
+    uow_con = _uow_con.get()
+    if uow_con is not None:
+        yield uow_con
+        return
+
+    pool = db_pool or init_pool()
+    started = time.perf_counter()
+    con = pool.getconn()
+    metrics.db_pool_wait_seconds.observe(time.perf_counter() - started)
+    broken = False
+    events_token = None if readonly else _tx_events.set([])
+    committed_events = None
+    try:
+        if readonly:
+            con.autocommit = True
+        yield con
+        if not readonly:
+            con.commit()
+            committed_events = _tx_events.get()
+
+    except (psycopg2.OperationalError, InterfaceError) as e:
+        logger.warning(f"Проблема зі з'єднанням БД ({type(e).__name__}): {e}. З'єднання буде закрито.")
+        broken = True
+        raise
+
+    except Exception as e_other:
+        logger.error(f"Інша помилка при роботі з БД: {e_other}", exc_info=True)
+        try:
+            con.rollback()
+        except Exception:
+            broken = True
+        raise
+
+    finally:
+        if readonly and not broken:
+            try:
+                con.autocommit = False
+            except Exception:
+                broken = True
+        if events_token is not None:
+            _tx_events.reset(events_token)
+        try:
+            pool.putconn(con, close=broken)
+        except Exception as final_put_err:
+            logger.error(f"Помилка при поверненні з'єднання в пул: {final_put_err}")
+
+    if committed_events:
+        _dispatch(committed_events)
 
+
+@contextlib.contextmanager
+def unit_of_work():
+    """
+    Одна транзакція на одному з'єднанні для кількох функцій db.py:
+
+        with unit_of_work():
+            add_score(...)
+            mark_task_completed(...)
+
+    Commit виконується один раз при виході, при помилці — rollback усього блоку.
+    Вкладені unit_of_work() приєднуються до зовнішньої.
+    """
+    if _uow_con.get() is not None:
+        yield _uow_con.get()
+        return
+    with connect() as con:
+        token = _uow_con.set(con)
+        try:
+            yield con
         finally:
-            if not need_retry and con:
-                try:
-                    db_pool.putconn(con)
-                    con = None
-                except Exception as final_put_err:
-                    logger.error(f"Помилка при поверненні з'єднання в пул: {final_put_err}")
+            _uow_con.reset(token)
 
 
 # -----------------------------
 # Schema init
 # -----------------------------
 def init_db():
-    with connect() as con:
-        cur = con.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id BIGINT PRIMARY KEY,
-                username TEXT,
-                display_name TEXT,
-                score INTEGER DEFAULT 0,
-                topic TEXT,
-                last_daily DATE,
-                feedbacks INTEGER DEFAULT 0,
-                all_tasks_completed INTEGER DEFAULT 0,
-                topics_total INTEGER DEFAULT 0,
-                topics_completed INTEGER DEFAULT 0,
-                last_activity DATE,
-                streak_days INTEGER DEFAULT 0,
-                city TEXT,
-                phone_number TEXT
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS tasks (
-                id SERIAL PRIMARY KEY,
-                category TEXT,
-                topic TEXT NOT NULL,
-                level TEXT NOT NULL,
-                task_type TEXT,
-                question TEXT NOT NULL,
-                answer JSONB NOT NULL,
-                explanation TEXT,
-                photo TEXT,
-                is_daily BOOLEAN DEFAULT FALSE
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS completed_tasks (
-                user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                task_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
-                PRIMARY KEY (user_id, task_id)
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS feedback (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT REFERENCES users(id) ON DELETE SET NULL,
-                username TEXT,
-                message TEXT,
-                timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS badges (
-                user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                badge TEXT NOT NULL,
-                PRIMARY KEY (user_id, badge)
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_topic_streaks (
-                user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                topic   TEXT    NOT NULL,
-                streak  INTEGER NOT NULL DEFAULT 0,
-                PRIMARY KEY (user_id, topic)
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_topic_streak_awards (
-                user_id   BIGINT  NOT NULL,
-                topic     TEXT    NOT NULL,
-                milestone INTEGER NOT NULL,
-                PRIMARY KEY (user_id, topic, milestone),
-                FOREIGN KEY (user_id, topic) REFERENCES user_topic_streaks(user_id, topic) ON DELETE CASCADE
-            )
-        """)
-
-        # Indexes
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_topic_daily ON tasks (topic, is_daily)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_topic_level ON tasks (topic, level)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_category ON tasks (category)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_feedback_user_time ON feedback (user_id, timestamp DESC)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_completed_task ON completed_tasks (task_id)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_is_daily ON tasks (is_daily)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_streak_awards_user_topic ON user_topic_streak_awards (user_id, topic)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_answer_gin ON tasks USING GIN (answer)")
-
-        con.commit()
-    logger.info("✅ Схема бази даних ініціалізована.")
+    """
+    Доводить схему до останньої версії (migrations/); якщо вона вже актуальна —
+    це один SELECT версії. Повертає версію схеми.
+    """
+    import migrations   # migrations імпортує db, тож не на рівні модуля
+    return migrations.migrate()
 
 
 # -----------------------------
@@ -208,7 +323,7 @@ _ALLOWED_USER_FIELDS = {
 }
 
 def get_user(user_id):
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute("SELECT * FROM users WHERE id = %s", (user_id,))
         return cur.fetchone()
@@ -228,29 +343,74 @@ def update_user(user_id, field, value):
             logger.error(f"Спроба оновити недопустиме поле '{field}' для user {user_id}")
             raise ValueError(f"Недопустиме поле для оновлення: {field}")
             
-        con.cursor().execute(
-            f"UPDATE users SET {field} = %s WHERE id = %s",
+        cur = con.cursor()
+        cur.execute(
+            f"UPDATE users SET {field} = %s WHERE id = %s RETURNING score, display_name",
             (value, user_id),
         )
+        row = cur.fetchone()
+        if row and field in ("score", "display_name"):
+            _emit("score_changed" if field == "score" else "name_changed",
+                  user_id=user_id, score=row[0], display_name=row[1])
 
 def add_score(user_id, delta):
     with connect() as con:
-        con.cursor().execute(
-            "UPDATE users SET score = score + %s WHERE id = %s",
+        cur = con.cursor()
+        cur.execute(
+            "UPDATE users SET score = score + %s WHERE id = %s RETURNING score, display_name",
             (delta, user_id),
         )
+        row = cur.fetchone()
+        if row:
+            _emit("score_changed", user_id=user_id, score=row[0], display_name=row[1])
 
 def get_user_field(user_id, field):
     if field not in _ALLOWED_USER_FIELDS and field != "id":
          logger.error(f"Спроба отримати недопустиме поле '{field}' для user {user_id}")
          raise ValueError(f"Недопустиме поле для отримання: {field}")
              
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute(f"SELECT {field} FROM users WHERE id = %s", (user_id,))
         row = cur.fetchone()
         return row[0] if row else None
 
+_USER_COLUMNS = (
+    "id", "username", "display_name", "score", "topic", "last_daily",
+    "feedbacks", "all_tasks_completed", "topics_total", "topics_completed",
+    "last_activity", "streak_days", "city", "phone_number",
+)
+
+class UserSnapshot:
+    """Увесь рядок users за один запит; читається хендлерами замість get_user_field."""
+    __slots__ = _USER_COLUMNS
+
+    def __init__(self, row):
+        for field, value in zip(_USER_COLUMNS, row):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        return f"UserSnapshot(id={self.id}, score={self.score}, streak_days={self.streak_days})"
+
+_USER_SNAPSHOT_SQL = "SELECT " + ", ".join(_USER_COLUMNS) + " FROM users"
+
+def get_user_snapshot(user_id):
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute(_USER_SNAPSHOT_SQL + " WHERE id = %s", (user_id,))
+        row = cur.fetchone()
+        return UserSnapshot(row) if row else None
+
+def get_user_snapshots(user_ids):
+    """Кілька користувачів одним запитом: {id: UserSnapshot}."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute(_USER_SNAPSHOT_SQL + " WHERE id = ANY(%s)", (user_ids,))
+        return {row[0]: UserSnapshot(row) for row in cur.fetchall()}
+
 def get_level_by_score(score):
     if score is None: score = 0
     if score < 30: return "Новачок"
@@ -265,32 +425,81 @@ _ALLOWED_TASK_FIELDS = {
     "answer", "explanation", "photo", "is_daily"
 }
 
-def get_random_task(topic=None, level=None, user_id=None, is_daily=None):
-    with connect() as con:
-        # ✅ extras.DictCursor
-        cur = con.cursor(cursor_factory=extras.DictCursor)
-        query = "SELECT * FROM tasks WHERE 1=1"
+# -----------------------------
+# Catalogue cache
+# -----------------------------
+CATALOGUE_VERSION_CHECK = float(os.getenv("CATALOGUE_VERSION_CHECK", "5"))
+
+def _fetch_catalogue_version():
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("SELECT version FROM catalogue_version WHERE id = 1")
+        row = cur.fetchone()
+        return row[0] if row else 0
+
+_catalogue = CatalogueCache(_fetch_catalogue_version, check_interval=CATALOGUE_VERSION_CHECK)
+
+def _bump_catalogue_version(cur):
+    cur.execute("UPDATE catalogue_version SET version = version + 1 WHERE id = 1")
+
+def catalogue_version():
+    """Версія каталогу, з якою узгоджений поточний вміст кешу."""
+    return _catalogue.version
+
+def _load_task_level_totals():
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("""
+            SELECT topic, level, total
+            FROM task_level_totals
+            WHERE total > 0 AND topic != '' AND level != ''
+        """)
+        return {(t, l): n for (t, l, n) in cur.fetchall()}
+
+def get_task_level_totals():
+    """{(topic, level): кількість звичайних задач} — кешується до зміни каталогу."""
+    return dict(_catalogue.get(("level_totals",), _load_task_level_totals))
+
+def catalogue_stats():
+    return _catalogue.stats()
+
+def invalidate_catalogue():
+    _catalogue.invalidate()
+
+
+def _load_task_ids(topic, level, is_daily):
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        query = "SELECT id FROM tasks WHERE 1=1"
         params = {}
         if topic:
             query += " AND topic = %(topic)s"; params['topic'] = topic
         if level:
             query += " AND level = %(level)s"; params['level'] = level
         if is_daily is not None:
-            query += " AND is_daily = %(is_daily)s"; params['is_daily'] = bool(is_daily) 
-        if user_id:
-            if user_id is not None:
-                query += " AND id NOT IN (SELECT task_id FROM completed_tasks WHERE user_id = %(user_id)s)"
-                params['user_id'] = user_id
-
-        query += " ORDER BY RANDOM() LIMIT 1"
-        cur.execute(query, params)
-        row = cur.fetchone()
-        
-        if row:
-            # Конвертуємо в dict, extras.DictCursor полегшує це
-            return dict(row)
-            
-    return None
+            query += " AND is_daily = %(is_daily)s"; params['is_daily'] = is_daily
+        cur.execute(query + " ORDER BY id", params)
+        # array('q') — 8 байт на id замість ~36 для list[int]
+        return array('q', (row[0] for row in cur))
+
+def get_random_task(topic=None, level=None, user_id=None, is_daily=None):
+    """
+    Випадкова задача за фільтром, без ORDER BY RANDOM().
+    Масив id кандидатів береться з кешу каталогу, вибір — pick_random_id.
+    """
+    is_daily = None if is_daily is None else bool(is_daily)
+    candidate_ids = _catalogue.get(
+        ("task_ids", topic or None, level or None, is_daily),
+        lambda: _load_task_ids(topic, level, is_daily),
+    )
+    # Лише виконані задачі з того ж фільтра, а не вся історія користувача
+    excluded = _load_completed_task_ids(user_id, topic or None, level or None, is_daily) if user_id else ()
+
+    task_id = pick_random_id(candidate_ids, excluded)
+    if task_id is None:
+        return None
+    # Задача могла зникнути між оновленнями кешу — тоді просто None, як і раніше
+    return get_task_by_id(task_id)
 
 def add_task(data):
     # extras.register_json() дозволяє передавати list/dict напряму
@@ -318,9 +527,85 @@ def add_task(data):
             INSERT INTO tasks (category, topic, level, task_type, question, answer, explanation, photo, is_daily)
             VALUES (%(category)s, %(topic)s, %(level)s, %(task_type)s, %(question)s, %(answer)s, %(explanation)s, %(photo)s, %(is_daily)s)
         """, params)
-
-def get_all_tasks_by_topic(topic, is_daily=False):
+        if not params['is_daily']:
+            _shift_level_total(cur, params['topic'], params['level'], +1)
+        _bump_catalogue_version(cur)
+    _catalogue.invalidate()
+
+# Стовпці файлу для COPY у import_tasks (CSV без заголовка, answer — JSON-масив)
+TASK_IMPORT_COLUMNS = (
+    "line", "category", "topic", "level", "task_type", "question", "answer", "explanation", "photo", "is_daily",
+)
+# Порівнюються при злитті; ключ задачі — (topic, level, is_daily, question)
+_TASK_IMPORT_FIELDS = ("category", "task_type", "answer", "explanation", "photo")
+
+def import_tasks(copy_file, dry_run=False):
+    """
+    Масовий імпорт задач однією транзакцією.
+    copy_file — CSV у порядку TASK_IMPORT_COLUMNS; вантажиться через COPY у тимчасову таблицю,
+    потім злиття з tasks: нові вставляються, наявні (той самий topic, level, is_daily, question)
+    оновлюються лише якщо щось змінилось. dry_run — усе те саме, але з rollback.
+    Повертає {"inserted", "updated", "unchanged", "by_level": {(topic, level, is_daily): нових}}.
+    """
+    fields = ", ".join(_TASK_IMPORT_FIELDS)
+    new_values = ", ".join(f"i.{f}" for f in _TASK_IMPORT_FIELDS)
+    old_values = ", ".join(f"t.{f}" for f in _TASK_IMPORT_FIELDS)
     with connect() as con:
+        cur = con.cursor()
+        cur.execute("""
+            CREATE TEMP TABLE task_import (
+                line INTEGER, category TEXT, topic TEXT NOT NULL, level TEXT NOT NULL, task_type TEXT,
+                question TEXT NOT NULL, answer JSONB NOT NULL, explanation TEXT, photo TEXT,
+                is_daily BOOLEAN NOT NULL, task_id INTEGER
+            ) ON COMMIT DROP
+        """)
+        cur.copy_expert(
+            f"COPY task_import ({', '.join(TASK_IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", copy_file,
+        )
+        cur.execute("""
+            UPDATE task_import i SET task_id = t.id
+            FROM (
+                SELECT DISTINCT ON (topic, level, is_daily, question) id, topic, level, is_daily, question
+                FROM tasks ORDER BY topic, level, is_daily, question, id
+            ) t
+            WHERE t.topic = i.topic AND t.level = i.level AND t.is_daily = i.is_daily AND t.question = i.question
+        """)
+        cur.execute(f"""
+            UPDATE tasks t SET ({fields}) = ({new_values})
+            FROM task_import i
+            WHERE t.id = i.task_id AND ({old_values}) IS DISTINCT FROM ({new_values})
+        """)
+        updated = cur.rowcount
+        cur.execute("SELECT COUNT(*) FROM task_import WHERE task_id IS NOT NULL")
+        unchanged = cur.fetchone()[0] - updated
+        cur.execute(f"""
+            WITH ins AS (
+                INSERT INTO tasks (topic, level, is_daily, question, {fields})
+                SELECT topic, level, is_daily, question, {fields}
+                FROM task_import WHERE task_id IS NULL ORDER BY line
+                RETURNING topic, level, is_daily
+            )
+            SELECT topic, level, is_daily, COUNT(*) FROM ins GROUP BY topic, level, is_daily
+        """)
+        by_level = {(topic, level, is_daily): n for topic, level, is_daily, n in cur.fetchall()}
+        report = {
+            "inserted": sum(by_level.values()), "updated": updated, "unchanged": unchanged, "by_level": by_level,
+        }
+        if dry_run:
+            con.rollback()
+            return report
+        for (topic, level, is_daily), n in by_level.items():
+            if not is_daily:
+                _shift_level_total(cur, topic, level, n)
+        if by_level or updated:
+            _bump_catalogue_version(cur)
+    if by_level or updated:
+        _catalogue.invalidate()
+    logger.info(f"Імпорт задач: +{report['inserted']}, оновлено {updated}, без змін {unchanged}.")
+    return report
+
+def _load_tasks_by_topic(topic, is_daily):
+    with connect(readonly=True) as con:
         # ✅ extras.DictCursor
         cur = con.cursor(cursor_factory=extras.DictCursor)
         cur.execute("""
@@ -331,31 +616,99 @@ def get_all_tasks_by_topic(topic, is_daily=False):
         rows = cur.fetchall()
         return [dict(row) for row in rows]
 
+def get_all_tasks_by_topic(topic, is_daily=False):
+    is_daily = bool(is_daily)
+    tasks = _catalogue.get(("tasks_by_topic", topic, is_daily), lambda: _load_tasks_by_topic(topic, is_daily))
+    return [dict(t) for t in tasks]
+
+def _keyset_page(cur, sql, params, after_id, before_id, limit, descending=False):
+    """
+    Одна keyset-сторінка: limit + 1 рядок (зайвий — лише ознака наступної сторінки).
+    sql — SELECT ... WHERE ... без ORDER BY.
+    after_id — сторінка після цього id (вперед), before_id — перед ним (назад), без обох — перша.
+    Повертає (rows, has_prev, has_next); рядки завжди у порядку показу.
+    """
+    ascending = not descending
+    if before_id is not None:
+        # Назад: читаємо у зворотному порядку від курсора і перевертаємо
+        op, ascending, cursor_id = (">" if descending else "<"), descending, before_id
+    elif after_id is not None:
+        op, cursor_id = ("<" if descending else ">"), after_id
+    else:
+        op, cursor_id = None, None
+
+    params = tuple(params)
+    if op:
+        sql += f" AND id {op} %s"
+        params += (cursor_id,)
+    cur.execute(f"{sql} ORDER BY id {'ASC' if ascending else 'DESC'} LIMIT %s", params + (limit + 1,))
+    rows = cur.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before_id is not None:
+        rows.reverse()
+        return rows, more, True
+    return rows, after_id is not None, more
+
+def get_tasks_page(topic, is_daily=False, after_id=None, before_id=None, limit=5):
+    """
+    Сторінка задач теми за id (keyset): (tasks, has_prev, has_next, total).
+    Читається рівно limit + 1 рядок; total — точна кількість, кешується до зміни каталогу.
+    """
+    is_daily = bool(is_daily)
+    with connect(readonly=True) as con:
+        cur = con.cursor(cursor_factory=extras.DictCursor)
+        rows, has_prev, has_next = _keyset_page(
+            cur, "SELECT * FROM tasks WHERE topic = %s AND is_daily = %s", (topic, is_daily),
+            after_id, before_id, limit,
+        )
+        tasks = [dict(row) for row in rows]
+    total = _catalogue.get(("topic_count", topic, is_daily), lambda: _count_tasks_by_topic(topic, is_daily))
+    return tasks, has_prev, has_next, total
+
+def _count_tasks_by_topic(topic, is_daily):
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("SELECT COUNT(*) FROM tasks WHERE topic = %s AND is_daily = %s", (topic, is_daily))
+        return cur.fetchone()[0]
+
 def all_tasks_completed(user_id, topic, level):
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
-        cur.execute("SELECT id FROM tasks WHERE topic=%s AND level=%s AND is_daily=FALSE", (topic, level)) 
-        all_ids = set(r[0] for r in cur.fetchall())
-        if not all_ids: return False
         cur.execute("""
-            SELECT task_id
-            FROM completed_tasks ct JOIN tasks t ON ct.task_id = t.id
-            WHERE ct.user_id=%s AND t.topic=%s AND t.level=%s AND t.is_daily=FALSE
+            SELECT t.total, COALESCE(p.done, 0)
+            FROM task_level_totals t
+            LEFT JOIN user_level_progress p
+                   ON p.user_id = %s AND p.topic = t.topic AND p.level = t.level
+            WHERE t.topic = %s AND t.level = %s
         """, (user_id, topic, level))
-        done_ids = set(r[0] for r in cur.fetchall())
-        return all_ids == done_ids
+        row = cur.fetchone()
+        return bool(row and row[0] > 0 and row[1] >= row[0])
 
-def get_task_by_id(task_id):
-    with connect() as con:
+def _load_task_by_id(task_id):
+    with connect(readonly=True) as con:
         # ✅ extras.DictCursor
         cur = con.cursor(cursor_factory=extras.DictCursor)
         cur.execute("SELECT * FROM tasks WHERE id = %s", (task_id,))
         row = cur.fetchone()
         return dict(row) if row else None
 
+def get_task_by_id(task_id):
+    task = _catalogue.get(("task", task_id), lambda: _load_task_by_id(task_id))
+    return dict(task) if task else None
+
 def delete_task(task_id):
     with connect() as con:
-        con.cursor().execute("DELETE FROM tasks WHERE id = %s", (task_id,))
+        cur = con.cursor()
+        cur.execute("SELECT topic, level, is_daily FROM tasks WHERE id = %s FOR UPDATE", (task_id,))
+        row = cur.fetchone()
+        if row and not row[2]:
+            _shift_task_counters(cur, task_id, row[0], row[1], -1)
+        cur.execute("DELETE FROM tasks WHERE id = %s", (task_id,))
+        _bump_catalogue_version(cur)
+    _catalogue.invalidate()
+
+_COUNTER_TASK_FIELDS = {"topic", "level", "is_daily"}
 
 def update_task_field(task_id, field, value):
     if field not in _ALLOWED_TASK_FIELDS:
@@ -366,13 +719,27 @@ def update_task_field(task_id, field, value):
         value = bool(value)
 
     with connect() as con:
-        con.cursor().execute(
-            f"UPDATE tasks SET {field} = %s WHERE id = %s",
+        cur = con.cursor()
+        old = None
+        if field in _COUNTER_TASK_FIELDS:
+            cur.execute("SELECT topic, level, is_daily FROM tasks WHERE id = %s FOR UPDATE", (task_id,))
+            old = cur.fetchone()
+        cur.execute(
+            f"UPDATE tasks SET {field} = %s WHERE id = %s RETURNING topic, level, is_daily",
             (value, task_id),
         )
-
-def get_all_topics(is_daily=False):
-    with connect() as con:
+        new = cur.fetchone()
+        # Задача переїхала в інший (topic, level) або змінила is_daily — переносимо лічильники
+        if old and new and old != new:
+            if not old[2]:
+                _shift_task_counters(cur, task_id, old[0], old[1], -1)
+            if not new[2]:
+                _shift_task_counters(cur, task_id, new[0], new[1], +1)
+        _bump_catalogue_version(cur)
+    _catalogue.invalidate()
+
+def _load_all_topics(is_daily):
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute(
             "SELECT DISTINCT topic FROM tasks WHERE is_daily=%s AND topic IS NOT NULL AND topic != ''",
@@ -383,11 +750,15 @@ def get_all_topics(is_daily=False):
         clean_topics = sorted([t for t in topics if t not in forbidden and len(t) > 1])
         return clean_topics
 
+def get_all_topics(is_daily=False):
+    is_daily = bool(is_daily)
+    return list(_catalogue.get(("topics", is_daily), lambda: _load_all_topics(is_daily)))
+
 # -----------------------------
 # Feedback / rating / badges
 # -----------------------------
 def get_all_feedback():
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute("""
             SELECT id, user_id, username, message, timestamp
@@ -398,25 +769,61 @@ def get_all_feedback():
                 for id, uid, uname, msg, ts in cur.fetchall()]
 
 
+# Скільки рядків у feedback, після якого total береться з оцінки планувальника, а не COUNT(*)
+FEEDBACK_EXACT_COUNT_LIMIT = int(os.getenv("FEEDBACK_EXACT_COUNT_LIMIT", "10000"))
+
+def _count_feedback(cur):
+    """(total, exact): точний COUNT(*) для невеликої таблиці, інакше pg_class.reltuples."""
+    cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'feedback'::regclass")
+    row = cur.fetchone()
+    estimate = row[0] if row else -1
+    # -1 (таблицю ще не аналізували) теж веде до точного підрахунку
+    if estimate > FEEDBACK_EXACT_COUNT_LIMIT:
+        return estimate, False
+    cur.execute("SELECT COUNT(*) FROM feedback")
+    return cur.fetchone()[0], True
+
+def get_feedback_page(after_id=None, before_id=None, limit=5):
+    """
+    Сторінка звернень, новіші першими (id DESC, keyset): (feedbacks, has_prev, has_next, total, exact).
+    Рядки — (id, user_id, username, message, date); форматуються лише дати цієї сторінки.
+    """
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        rows, has_prev, has_next = _keyset_page(
+            cur, "SELECT id, user_id, username, message, timestamp FROM feedback WHERE TRUE", (),
+            after_id, before_id, limit, descending=True,
+        )
+        total, exact = _count_feedback(cur)
+    feedbacks = [(id, uid, uname, msg, ts.strftime('%Y-%m-%d %H:%M:%S') if ts else None)
+                 for id, uid, uname, msg, ts in rows]
+    return feedbacks, has_prev, has_next, total, exact
+
 def get_user_completed_count(user_id, topic, level):
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute("""
-            SELECT COUNT(ct.task_id)
-            FROM completed_tasks ct JOIN tasks t ON ct.task_id = t.id
-            WHERE ct.user_id = %s AND t.topic=%s AND t.level=%s AND t.is_daily=FALSE
+            SELECT done FROM user_level_progress
+            WHERE user_id = %s AND topic = %s AND level = %s
         """, (user_id, topic, level))
         result = cur.fetchone()
         return result[0] if result else 0
 
 def get_top_users(limit=10):
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
-        cur.execute("SELECT id, score FROM users WHERE score > 0 ORDER BY score DESC LIMIT %s", (limit,))
+        cur.execute("SELECT id, score, display_name FROM users WHERE score > 0 ORDER BY score DESC LIMIT %s", (limit,))
+        return cur.fetchall()
+
+def get_ranked_users():
+    """Усі користувачі з балами — для побудови leaderboard у пам'яті."""
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("SELECT id, score, display_name FROM users WHERE score > 0 ORDER BY score DESC, id")
         return cur.fetchall()
 
 def get_user_rank(user_id):
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute("""
             WITH ranked_users AS (
@@ -437,42 +844,52 @@ def get_user_rank(user_id):
         else:
             return None, my_score, total_ranked_users
 
-def unlock_badge(user_id, badge, reward=0):
+def unlock_badges(user_id, badges):
+    """
+    badges: [(badge, reward)]. Відкриває всі одним INSERT ... ON CONFLICT DO NOTHING RETURNING
+    і нараховує суму нагород лише за справді нові. Повертає список нових бейджів.
+    """
+    rewards = dict(badges)
+    if not rewards:
+        return []
     with connect() as con:
         cur = con.cursor()
-        cur.execute(
-            "SELECT 1 FROM badges WHERE user_id=%s AND badge=%s",
-            (user_id, badge),
-        )
-        exists = cur.fetchone()
-        if not exists:
-            cur.execute("""
-                INSERT INTO badges (user_id, badge)
-                VALUES (%s, %s) ON CONFLICT DO NOTHING
-            """, (user_id, badge))
-            was_inserted = cur.rowcount > 0
-            if was_inserted and reward:
-                cur.execute(
-                    "UPDATE users SET score = score + %s WHERE id = %s",
-                    (reward, user_id),
-                )
-            return was_inserted
-    return False
+        cur.execute("""
+            INSERT INTO badges (user_id, badge)
+            SELECT %s, b FROM unnest(%s::text[]) AS b
+            ON CONFLICT DO NOTHING
+            RETURNING badge
+        """, (user_id, list(rewards)))
+        unlocked = [row[0] for row in cur.fetchall()]
+        for badge in unlocked:
+            _emit("badge_unlocked", user_id=user_id, badge=badge)
+
+        total_reward = sum(rewards[b] or 0 for b in unlocked)
+        if total_reward:
+            cur.execute(
+                "UPDATE users SET score = score + %s WHERE id = %s RETURNING score, display_name",
+                (total_reward, user_id),
+            )
+            row = cur.fetchone()
+            if row:
+                _emit("score_changed", user_id=user_id, score=row[0], display_name=row[1])
+        return unlocked
+
+def unlock_badge(user_id, badge, reward=0):
+    return bool(unlock_badges(user_id, [(badge, reward)]))
 
 def get_user_badges(user_id):
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute("SELECT badge FROM badges WHERE user_id = %s", (user_id,))
         return [row[0] for row in cur.fetchall()]
 
 def count_user_tasks(user_id):
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
-        cur.execute("""
-            SELECT COUNT(ct.task_id) 
-            FROM completed_tasks ct JOIN tasks t ON ct.task_id = t.id
-            WHERE ct.user_id = %s AND t.is_daily=FALSE
-            """, (user_id,)
+        cur.execute(
+            "SELECT COALESCE(SUM(done), 0) FROM user_level_progress WHERE user_id = %s",
+            (user_id,)
         )
         result = cur.fetchone()
         return result[0] if result else 0
@@ -484,65 +901,84 @@ def add_feedback(user_id, username, message):
             INSERT INTO feedback (user_id, username, message)
             VALUES (%s, %s, %s)
         """, (user_id, username, message))
-        cur.execute("UPDATE users SET feedbacks = feedbacks + 1 WHERE id = %s", (user_id,))
+        cur.execute("UPDATE users SET feedbacks = feedbacks + 1 WHERE id = %s RETURNING feedbacks", (user_id,))
+        row = cur.fetchone()
+        if row:
+            _emit("feedback_added", user_id=user_id, feedbacks=row[0])
 
 # -----------------------------
 # Progress flags / aggregates
 # -----------------------------
-def update_all_tasks_completed_flag(user_id):
+def _shift_level_total(cur, topic, level, delta):
+    cur.execute("""
+        INSERT INTO task_level_totals (topic, level, total) VALUES (%s, %s, %s)
+        ON CONFLICT (topic, level) DO UPDATE SET total = task_level_totals.total + EXCLUDED.total
+    """, (topic, level, delta))
+
+def _shift_task_counters(cur, task_id, topic, level, delta):
+    """Додає/знімає задачу з лічильників каталогу та всіх, хто її вже виконав."""
+    _shift_level_total(cur, topic, level, delta)
+    cur.execute("""
+        INSERT INTO user_level_progress (user_id, topic, level, done)
+        SELECT user_id, %s, %s, %s FROM completed_tasks WHERE task_id = %s
+        ON CONFLICT (user_id, topic, level) DO UPDATE SET done = user_level_progress.done + EXCLUDED.done
+    """, (topic, level, delta, task_id))
+
+def _rebuild_progress_counters(cur):
+    logger.info("Перебудова лічильників прогресу...")
+    cur.execute("DELETE FROM task_level_totals")
+    cur.execute("DELETE FROM user_level_progress")
+    cur.execute("""
+        INSERT INTO task_level_totals (topic, level, total)
+        SELECT topic, level, COUNT(*) FROM tasks WHERE is_daily = FALSE GROUP BY topic, level
+    """)
+    cur.execute("""
+        INSERT INTO user_level_progress (user_id, topic, level, done)
+        SELECT c.user_id, t.topic, t.level, COUNT(*)
+        FROM completed_tasks c JOIN tasks t ON t.id = c.task_id
+        WHERE t.is_daily = FALSE
+        GROUP BY c.user_id, t.topic, t.level
+    """)
+
+def rebuild_progress_counters():
     with connect() as con:
-        cur = con.cursor()
-        cur.execute("SELECT COUNT(*) FROM tasks WHERE is_daily=FALSE")
-        total_tasks = cur.fetchone()[0]
-        
-        cur.execute("""
-             SELECT COUNT(ct.task_id) 
-             FROM completed_tasks ct JOIN tasks t ON ct.task_id = t.id
-             WHERE ct.user_id = %s AND t.is_daily=FALSE
-             """, (user_id,))
-        completed = cur.fetchone()[0]
-        
-        completed_flag = 1 if total_tasks > 0 and completed >= total_tasks else 0
-        cur.execute(
-            "UPDATE users SET all_tasks_completed = %s WHERE id = %s",
-            (completed_flag, user_id),
+        _rebuild_progress_counters(con.cursor())
+
+def _refresh_progress_flags(cur, user_id):
+    # Читає лише рядки лічильників (кількість пар тема/рівень), а не tasks/completed_tasks
+    cur.execute("""
+        WITH t AS (
+            SELECT COALESCE(SUM(total), 0) AS total_tasks,
+                   COUNT(DISTINCT topic) FILTER (WHERE total > 0 AND topic != '') AS topics_total
+            FROM task_level_totals
+        ), u AS (
+            SELECT COALESCE(SUM(p.done), 0) AS done_tasks,
+                   COUNT(DISTINCT p.topic) FILTER (WHERE p.done > 0 AND p.topic != '') AS topics_done
+            FROM user_level_progress p
+            JOIN task_level_totals tt ON tt.topic = p.topic AND tt.level = p.level AND tt.total > 0
+            WHERE p.user_id = %s
         )
-
-def update_topics_progress(user_id):
+        UPDATE users SET
+            all_tasks_completed = CASE WHEN t.total_tasks > 0 AND u.done_tasks >= t.total_tasks THEN 1 ELSE 0 END,
+            topics_total = t.topics_total,
+            topics_completed = u.topics_done
+        FROM t, u
+        WHERE users.id = %s
+        RETURNING users.all_tasks_completed, users.topics_total, users.topics_completed
+    """, (user_id, user_id))
+    return cur.fetchone()
+
+def refresh_progress_flags(user_id):
     with connect() as con:
-        cur = con.cursor()
-        cur.execute("SELECT DISTINCT topic FROM tasks WHERE is_daily=FALSE")
-        all_topics = {row[0] for row in cur.fetchall() if row[0]}
-        topics_total = len(all_topics)
-
-        cur.execute("""
-            SELECT t.topic
-            FROM completed_tasks c
-            JOIN tasks t ON c.task_id = t.id
-            WHERE c.user_id = %s AND t.is_daily = FALSE
-            GROUP BY t.topic
-            HAVING COUNT(DISTINCT t.id) = (SELECT COUNT(*) FROM tasks t2 WHERE t2.topic = t.topic AND t2.is_daily = FALSE)
-        """, (user_id,))
-        
-        cur.execute("""
-             SELECT DISTINCT t.topic
-             FROM completed_tasks c
-             JOIN tasks t ON c.task_id = t.id
-             WHERE c.user_id = %s AND t.is_daily = FALSE AND t.topic IS NOT NULL
-         """, (user_id,))
-        completed_topics = {row[0] for row in cur.fetchall() if row[0]}
-        actual_completed_topics = completed_topics.intersection(all_topics)
-        topics_completed = len(actual_completed_topics)
+        return _refresh_progress_flags(con.cursor(), user_id)
 
-
-        cur.execute("""
-            UPDATE users SET topics_total = %s, topics_completed = %s
-            WHERE id = %s
-        """, (topics_total, topics_completed, user_id))
+# Старі назви: обидва прапорці тепер рахуються одним запитом із лічильників
+update_all_tasks_completed_flag = refresh_progress_flags
+update_topics_progress = refresh_progress_flags
 
 
-def mark_task_completed(user_id, task_id):
-    was_inserted = False
+def mark_task_completed(user_id, task_id, is_daily=None):
+    """is_daily можна передати, якщо задача вже завантажена — тоді без зайвого get_task_by_id."""
     with connect() as con:
         cur = con.cursor()
         cur.execute("""
@@ -551,27 +987,38 @@ def mark_task_completed(user_id, task_id):
             ON CONFLICT DO NOTHING
         """, (user_id, task_id))
         was_inserted = cur.rowcount > 0
+        topic = level = flags = None
 
-    if was_inserted:
-        try:
-            task_info = get_task_by_id(task_id)
-            if task_info and not task_info.get('is_daily'):
-                 update_all_tasks_completed_flag(user_id)
-                 update_topics_progress(user_id)
-        except Exception as e:
-             logger.error(f"Помилка при оновленні агрегатів для user {user_id} після task {task_id}: {e}")
+        if was_inserted and is_daily is not True:
+            cur.execute("""
+                INSERT INTO user_level_progress (user_id, topic, level, done)
+                SELECT %s, topic, level, 1 FROM tasks WHERE id = %s AND is_daily = FALSE
+                ON CONFLICT (user_id, topic, level) DO UPDATE SET done = user_level_progress.done + 1
+                RETURNING topic, level
+            """, (user_id, task_id))
+            row = cur.fetchone()
+            if row:
+                topic, level = row
+                flags = _refresh_progress_flags(cur, user_id)
+
+        if was_inserted:
+            # topic/level = None для щоденних задач (вони не входять у прогрес по темах)
+            payload = dict(user_id=user_id, task_id=task_id, topic=topic, level=level)
+            if flags:
+                payload.update(zip(("all_tasks_completed", "topics_total", "topics_completed"), flags))
+            _emit("task_completed", **payload)
 
     return was_inserted
 
 def get_available_levels_for_topic(topic, exclude_level=None):
-    tasks = get_all_tasks_by_topic(topic, is_daily=False)
+    tasks = _catalogue.get(("tasks_by_topic", topic, False), lambda: _load_tasks_by_topic(topic, False))
     available = {t['level'] for t in tasks if t.get('level')}
     if exclude_level:
         available.discard(exclude_level)
     return sorted(list(available))
 
-def get_all_topics_by_category(category, is_daily=False):
-    with connect() as con:
+def _load_topics_by_category(category, is_daily):
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute("""
             SELECT DISTINCT topic FROM tasks
@@ -579,8 +1026,14 @@ def get_all_topics_by_category(category, is_daily=False):
         """, (category, is_daily))
         return [row[0] for row in cur.fetchall()]
 
-def get_completed_task_ids(user_id, topic=None, level=None):
-    with connect() as con:
+def get_all_topics_by_category(category, is_daily=False):
+    is_daily = bool(is_daily)
+    # Копія: хендлери сортують і доповнюють список на місці
+    return list(_catalogue.get(("topics_by_category", category, is_daily),
+                               lambda: _load_topics_by_category(category, is_daily)))
+
+def _load_completed_task_ids(user_id, topic, level, is_daily):
+    with connect(readonly=True) as con:
         cur = con.cursor()
         query = "SELECT c.task_id FROM completed_tasks c JOIN tasks t ON t.id = c.task_id WHERE c.user_id = %s"
         params = [user_id]
@@ -591,15 +1044,23 @@ def get_completed_task_ids(user_id, topic=None, level=None):
         if level:
             query += " AND t.level = %s"
             params.append(level)
-        if topic or level: 
-           query += " AND t.is_daily = FALSE"
+        if is_daily is not None:
+            query += " AND t.is_daily = %s"
+            params.append(is_daily)
             
         cur.execute(query, tuple(params))
         return {row[0] for row in cur.fetchall()}
 
+def get_completed_task_ids(user_id, topic=None, level=None):
+    # З фільтром за темою/рівнем — лише звичайні (не щоденні) задачі
+    return _load_completed_task_ids(user_id, topic, level, False if (topic or level) else None)
+
 # -----------------------------
 # Streaks (days) and per-topic
 # -----------------------------
+# Нагорода (бали) за щоденний стрік певної довжини
+DAILY_STREAK_REWARDS = {3: 5, 7: 10, 14: 20, 30: 50}
+
 def update_streak_and_reward(user_id):
     today = date.today()
     new_streak = 0
@@ -625,21 +1086,75 @@ def update_streak_and_reward(user_id):
             "UPDATE users SET last_activity=%s, streak_days=%s WHERE id=%s",
             (today, new_streak, user_id),
         )
+        _emit("streak_changed", user_id=user_id, streak_days=new_streak, last_activity=today)
 
-        reward_map = {3: 5, 7: 10, 14: 20, 30: 50}
-        if new_streak in reward_map: 
-            reward = reward_map[new_streak]
+        if new_streak in DAILY_STREAK_REWARDS: 
+            reward = DAILY_STREAK_REWARDS[new_streak]
             if reward > 0:
                 cur.execute(
-                    "UPDATE users SET score = score + %s WHERE id=%s",
+                    "UPDATE users SET score = score + %s WHERE id=%s RETURNING score, display_name",
                     (reward, user_id),
                 )
+                new_score, display_name = cur.fetchone()
+                _emit("score_changed", user_id=user_id, score=new_score, display_name=display_name)
                 logger.info(f"User {user_id} досяг стріку {new_streak} днів! Нараховано +{reward} балів.")
 
     return new_streak, reward
 
-def get_topic_streak(user_id: int, topic: str) -> int:
+def flush_activity(rows):
+    """
+    Пакетний запис активності з activity.py одним UPDATE ... FROM (VALUES ...).
+
+    rows: [(user_id, username або None, day або None)] — не більше одного рядка на користувача;
+    day=None — лише оновити username.
+    Для кожного рядка виконується та сама логіка, що й в update_streak_and_reward
+    (стрік +1 / скидання до 1, нагорода за рубіж); якщо last_activity вже дорівнює day —
+    стрік не змінюється, тож повторний дотик не рахується двічі.
+    Повертає [(user_id, last_activity, streak_days, нагорода)].
+    """
+    if not rows:
+        return []
+    rewards_sql = ", ".join(f"({streak}, {reward})" for streak, reward in DAILY_STREAK_REWARDS.items())
     with connect() as con:
+        cur = con.cursor()
+        result = extras.execute_values(cur, f"""
+            WITH v (id, username, day) AS (VALUES %s),
+            calc AS (
+                SELECT u.id, v.username, v.day,
+                       CASE WHEN v.day IS NULL OR u.last_activity >= v.day THEN NULL
+                            WHEN u.last_activity = v.day - 1 THEN COALESCE(u.streak_days, 0) + 1
+                            ELSE 1 END AS new_streak
+                  FROM users u JOIN v ON v.id = u.id
+                 ORDER BY u.id
+                   FOR UPDATE OF u
+            )
+            UPDATE users AS u SET
+                username      = COALESCE(c.username, u.username),
+                last_activity = CASE WHEN c.new_streak IS NULL THEN u.last_activity ELSE c.day END,
+                streak_days   = COALESCE(c.new_streak, u.streak_days),
+                score         = u.score + COALESCE(r.reward, 0)
+              FROM calc c
+              LEFT JOIN (VALUES {rewards_sql}) AS r (streak, reward) ON r.streak = c.new_streak
+             WHERE u.id = c.id
+         RETURNING u.id, u.last_activity, u.streak_days, COALESCE(r.reward, 0), c.new_streak IS NOT NULL,
+                   u.score, u.display_name
+        """, sorted(rows), template="(%s::bigint, %s::text, %s::date)", page_size=len(rows), fetch=True)
+
+        out = []
+        for user_id, last_activity, streak_days, reward, streak_changed, score, display_name in result:
+            if streak_changed:
+                _emit("streak_changed", user_id=user_id, streak_days=streak_days, last_activity=last_activity)
+            if reward:
+                _emit("score_changed", user_id=user_id, score=score, display_name=display_name)
+                logger.info(f"User {user_id} досяг стріку {streak_days} днів! Нараховано +{reward} балів.")
+            out.append((user_id, last_activity, streak_days, reward))
+        return out
+
+# Рубежі стріку в темі, за які нараховується бонус (= довжина стріку)
+TOPIC_STREAK_MILESTONES = (5, 10, 15, 20)
+
+def get_topic_streak(user_id: int, topic: str) -> int:
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute("""
             SELECT streak FROM user_topic_streaks
@@ -658,16 +1173,30 @@ def set_topic_streak(user_id: int, topic: str, value: int):
         """, (user_id, topic, value))
 
 def inc_topic_streak(user_id: int, topic: str) -> int:
-    current = get_topic_streak(user_id, topic)
-    new_val = current + 1
-    set_topic_streak(user_id, topic, new_val)
-    return new_val
+    """Атомарний +1 одним upsert: паралельні відповіді не гублять інкременти."""
+    with connect() as con:
+        cur = con.cursor()
+        cur.execute("""
+            INSERT INTO user_topic_streaks (user_id, topic, streak)
+            VALUES (%s, %s, 1)
+            ON CONFLICT (user_id, topic) DO UPDATE SET streak = user_topic_streaks.streak + 1
+            RETURNING streak
+        """, (user_id, topic))
+        return cur.fetchone()[0]
 
 def reset_topic_streak(user_id: int, topic: str):
-    set_topic_streak(user_id, topic, 0)
+    with connect() as con:
+        cur = con.cursor()
+        # Рядок з уже нульовим стріком не переписуємо
+        cur.execute("""
+            INSERT INTO user_topic_streaks (user_id, topic, streak)
+            VALUES (%s, %s, 0)
+            ON CONFLICT (user_id, topic) DO UPDATE SET streak = 0
+            WHERE user_topic_streaks.streak <> 0
+        """, (user_id, topic))
 
 def has_topic_streak_award(user_id: int, topic: str, milestone: int) -> bool:
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute("""
             SELECT 1 FROM user_topic_streak_awards
@@ -675,51 +1204,104 @@ def has_topic_streak_award(user_id: int, topic: str, milestone: int) -> bool:
         """, (user_id, topic, milestone))
         return bool(cur.fetchone())
 
-def mark_topic_streak_award(user_id: int, topic: str, milestone: int):
+def award_topic_streak_milestone(user_id: int, topic: str, milestone: int) -> bool:
+    """Фіксує рубіж одним INSERT ... RETURNING; True — лише для того виклику, що записав його першим."""
     with connect() as con:
         cur = con.cursor()
         cur.execute("""
             INSERT INTO user_topic_streak_awards (user_id, topic, milestone)
             VALUES (%s, %s, %s)
             ON CONFLICT DO NOTHING
+            RETURNING 1
         """, (user_id, topic, milestone))
+        return cur.fetchone() is not None
+
+def mark_topic_streak_award(user_id: int, topic: str, milestone: int):
+    return award_topic_streak_milestone(user_id, topic, milestone)
+
+def apply_topic_streak_answers(answers, award_bonus=True):
+    """
+    Пакетне застосування відповідей до стріків у темах (напр. офлайн-імпорт).
+
+    answers: [(user_id, topic, is_correct)] у хронологічному порядку.
+    Результат той самий, що й послідовні inc_topic_streak/reset_topic_streak
+    (і бонус за рубіж, як у record_answer), але однією транзакцією на весь пакет.
+    Повертає {(user_id, topic): (streak, [досягнуті рубежі])}.
+    """
+    if not answers:
+        return {}
+    keys = sorted({(user_id, topic) for user_id, topic, _ in answers})
+    with connect() as con:
+        cur = con.cursor()
+        extras.execute_values(cur, """
+            INSERT INTO user_topic_streaks (user_id, topic, streak) VALUES %s
+            ON CONFLICT (user_id, topic) DO NOTHING
+        """, [(u, t, 0) for u, t in keys], page_size=1000)
+        # Блокуємо рядки в стабільному порядку, щоб паралельні пакети не взаємоблокувались
+        rows = extras.execute_values(cur, """
+            SELECT s.user_id, s.topic, s.streak
+              FROM user_topic_streaks s
+              JOIN (VALUES %s) AS k (user_id, topic) ON s.user_id = k.user_id AND s.topic = k.topic
+             ORDER BY s.user_id, s.topic
+               FOR UPDATE OF s
+        """, keys, template="(%s::bigint, %s::text)", page_size=len(keys), fetch=True)
+        streaks = {(u, t): streak for u, t, streak in rows}
+
+        reached = {key: [] for key in keys}
+        bonus = {}
+        for user_id, topic, is_correct in answers:
+            key = (user_id, topic)
+            if is_correct:
+                streaks[key] += 1
+                if streaks[key] in TOPIC_STREAK_MILESTONES:
+                    reached[key].append(streaks[key])
+                    bonus[user_id] = bonus.get(user_id, 0) + streaks[key]
+            else:
+                streaks[key] = 0
+
+        extras.execute_values(cur, """
+            UPDATE user_topic_streaks AS s SET streak = v.streak
+              FROM (VALUES %s) AS v (user_id, topic, streak)
+             WHERE s.user_id = v.user_id AND s.topic = v.topic
+        """, [(u, t, streaks[(u, t)]) for u, t in keys],
+            template="(%s::bigint, %s::text, %s::int)", page_size=1000)
+
+        if award_bonus and bonus:
+            updated = extras.execute_values(cur, """
+                UPDATE users AS u SET score = u.score + v.bonus
+                  FROM (VALUES %s) AS v (id, bonus)
+                 WHERE u.id = v.id
+             RETURNING u.id, u.score, u.display_name
+            """, sorted(bonus.items()), template="(%s::bigint, %s::int)", page_size=len(bonus), fetch=True)
+            for user_id, score, display_name in updated:
+                _emit("score_changed", user_id=user_id, score=score, display_name=display_name)
+
+    return {key: (streaks[key], reached[key]) for key in keys}
 
 # -----------------------------
 # Aggregates for fast progress
 # -----------------------------
+def get_user_level_done(user_id: int):
+    """{(topic, level): скільки задач виконав користувач} з лічильників user_level_progress."""
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("""
+            SELECT topic, level, done
+            FROM user_level_progress
+            WHERE user_id = %s AND done > 0 AND topic != '' AND level != ''
+        """, (user_id,))
+        return {(t, l): n for (t, l, n) in cur.fetchall()}
+
 def get_progress_aggregates(user_id: int):
-    totals = {}
-    done = {}
     try:
-        with connect() as con:
-            cur = con.cursor()
-            cur.execute("""
-                SELECT topic, level, COUNT(*)
-                FROM tasks
-                WHERE is_daily = FALSE AND topic IS NOT NULL AND level IS NOT NULL AND topic != '' AND level != ''
-                GROUP BY topic, level
-            """)
-            totals = {(t, l): n for (t, l, n) in cur.fetchall()}
-
-            cur.execute("""
-                SELECT t.topic, t.level, COUNT(c.task_id)
-                FROM completed_tasks c
-                JOIN tasks t ON t.id = c.task_id
-                WHERE c.user_id = %s AND t.is_daily = FALSE 
-                      AND t.topic IS NOT NULL AND t.level IS NOT NULL AND t.topic != '' AND t.level != ''
-                GROUP BY t.topic, t.level
-            """, (user_id,))
-            done = {(t, l): n for (t, l, n) in cur.fetchall()}
-            
+        return get_task_level_totals(), get_user_level_done(user_id)
     except Exception as e:
        logger.error(f"Помилка при отриманні агрегатів прогресу для user {user_id}: {e}", exc_info=True)
        return {}, {}
-       
-    return totals, done
 
 def get_users_for_reengagement(days_ago: int):
     target_date = date.today() - timedelta(days=days_ago)
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute(
             "SELECT id FROM users WHERE last_activity = %s",
@@ -728,7 +1310,7 @@ def get_users_for_reengagement(days_ago: int):
         return cur.fetchall()
 
 def get_all_users_for_export():
-    with connect() as con:
+    with connect(readonly=True) as con:
         cur = con.cursor()
         cur.execute("""
             SELECT id, display_name, username, score, city, phone_number, last_activity
@@ -741,4 +1323,188 @@ def get_all_users_for_export():
             if isinstance(row_list[-1], date):
                 row_list[-1] = row_list[-1].isoformat()
             results.append(tuple(row_list))
-        return results
\ No newline at end of file
+        return results
+
+EXPORT_ITERSIZE = int(os.getenv("EXPORT_ITERSIZE", "2000"))
+
+def iter_users_for_export(active_since=None, min_score=None, itersize=EXPORT_ITERSIZE):
+    """
+    Ті ж стовпці, що get_all_users_for_export, але потоком: серверний (named) курсор
+    віддає рядки пачками по itersize, у пам'яті одночасно лише одна пачка.
+    Генератор тримає з'єднання з пулу, доки його не дочитали або не закрили.
+    """
+    query = """
+        SELECT id, display_name, username, score, city, phone_number, last_activity
+        FROM users
+        WHERE TRUE
+    """
+    params = []
+    if active_since is not None:
+        query += " AND last_activity >= %s"; params.append(active_since)
+    if min_score is not None:
+        query += " AND score >= %s"; params.append(min_score)
+    # Named-курсор потребує транзакції, тому не readonly (autocommit)
+    with connect() as con:
+        cur = con.cursor(name="users_export")
+        cur.itersize = itersize
+        cur.execute(query + " ORDER BY score DESC, id", params)
+        try:
+            yield from cur
+        finally:
+            cur.close()
+
+
+# -----------------------------
+# Answer pipeline (one transaction)
+# -----------------------------
+
+def record_answer(user_id, task, *, is_correct, points=0, topic=None, is_daily=False,
+                  already_done=False, update_daily_streak=True):
+    """
+    Записує результат відповіді однією транзакцією: бали, виконання задачі,
+    агрегати прогресу, стрік у темі (+бонус за рубіж) та щоденний стрік.
+    Якщо щось падає — не застосовується нічого.
+    """
+    result = {
+        "newly_completed": False,
+        "topic_streak": None,
+        "topic_bonus": 0,
+        "daily_streak": None,
+        "daily_reward": 0,
+    }
+    with unit_of_work():
+        if points > 0:
+            add_score(user_id, points)
+
+        result["newly_completed"] = mark_task_completed(
+            user_id, task["id"], is_daily=bool(task.get("is_daily"))
+        )
+
+        if not already_done and not is_daily:
+            if is_correct:
+                streak = inc_topic_streak(user_id, topic)
+                result["topic_streak"] = streak
+                if streak in TOPIC_STREAK_MILESTONES:
+                    add_score(user_id, streak)
+                    result["topic_bonus"] = streak
+            else:
+                reset_topic_streak(user_id, topic)
+
+        if update_daily_streak:
+            result["daily_streak"], result["daily_reward"] = update_streak_and_reward(user_id)
+
+    return result
+
+
+# -----------------------------
+# Conversation state (persistence.py)
+# -----------------------------
+def load_conversation_state(user_id):
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("SELECT data FROM conversation_state WHERE user_id = %s", (user_id,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+def save_conversation_states(rows, deleted_ids=()):
+    """rows: [(user_id, json_text)] — один батч замість запису на кожне повідомлення."""
+    with connect() as con:
+        cur = con.cursor()
+        if rows:
+            extras.execute_values(cur, """
+                INSERT INTO conversation_state (user_id, data, updated_at) VALUES %s
+                ON CONFLICT (user_id) DO UPDATE SET data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+            """, rows, template="(%s, %s::jsonb, CURRENT_TIMESTAMP)")
+        if deleted_ids:
+            cur.execute("DELETE FROM conversation_state WHERE user_id = ANY(%s)", (list(deleted_ids),))
+
+
+# -----------------------------
+# Broadcasts (broadcast.py)
+# -----------------------------
+def create_broadcast_campaign(key, message, user_ids):
+    """
+    Створює кампанію з отримувачами. Якщо кампанія з таким key вже є (повторний
+    запуск після рестарту) — повертає її id, нічого не дублюючи.
+    """
+    with connect() as con:
+        cur = con.cursor()
+        cur.execute("""
+            INSERT INTO broadcast_campaigns (key, message) VALUES (%s, %s)
+            ON CONFLICT (key) DO NOTHING
+            RETURNING id
+        """, (key, message))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("SELECT id FROM broadcast_campaigns WHERE key = %s", (key,))
+            return cur.fetchone()[0]
+        campaign_id = row[0]
+        if user_ids:
+            extras.execute_values(cur, """
+                INSERT INTO broadcast_deliveries (campaign_id, user_id) VALUES %s
+                ON CONFLICT DO NOTHING
+            """, [(campaign_id, uid) for uid in user_ids], page_size=1000)
+        return campaign_id
+
+def get_broadcast_campaign(campaign_id):
+    with connect(readonly=True) as con:
+        cur = con.cursor(cursor_factory=extras.DictCursor)
+        cur.execute("SELECT * FROM broadcast_campaigns WHERE id = %s", (campaign_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+def get_unfinished_broadcasts():
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("SELECT id FROM broadcast_campaigns WHERE status <> 'done' ORDER BY id")
+        return [r[0] for r in cur.fetchall()]
+
+def set_broadcast_status(campaign_id, status):
+    with connect() as con:
+        cur = con.cursor()
+        cur.execute("""
+            UPDATE broadcast_campaigns
+               SET status = %s,
+                   started_at  = CASE WHEN %s = 'running' THEN COALESCE(started_at, CURRENT_TIMESTAMP) ELSE started_at END,
+                   finished_at = CASE WHEN %s = 'done' THEN CURRENT_TIMESTAMP ELSE finished_at END
+             WHERE id = %s
+        """, (status, status, status, campaign_id))
+
+def get_pending_deliveries(campaign_id, after_user_id=None, limit=500):
+    """Наступна порція отримувачів (keyset по user_id)."""
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("""
+            SELECT user_id FROM broadcast_deliveries
+             WHERE campaign_id = %s AND status = 'pending' AND user_id > %s
+             ORDER BY user_id
+             LIMIT %s
+        """, (campaign_id, after_user_id if after_user_id is not None else -2**63, limit))
+        return [r[0] for r in cur.fetchall()]
+
+def record_broadcast_results(campaign_id, results):
+    """results: [(user_id, status, attempts, error)] — одним UPDATE на порцію."""
+    if not results:
+        return
+    with connect() as con:
+        cur = con.cursor()
+        extras.execute_values(cur, """
+            UPDATE broadcast_deliveries AS d
+               SET status = v.status, attempts = d.attempts + v.attempts,
+                   error = v.error, updated_at = CURRENT_TIMESTAMP
+              FROM (VALUES %s) AS v (campaign_id, user_id, status, attempts, error)
+             WHERE d.campaign_id = v.campaign_id AND d.user_id = v.user_id
+        """, [(campaign_id, *r) for r in results],
+            template="(%s::int, %s::bigint, %s, %s::int, %s)", page_size=1000)
+
+def get_broadcast_stats(campaign_id):
+    with connect(readonly=True) as con:
+        cur = con.cursor()
+        cur.execute("""
+            SELECT status, COUNT(*) FROM broadcast_deliveries
+             WHERE campaign_id = %s GROUP BY status
+        """, (campaign_id,))
+        stats = {"pending": 0, "sent": 0, "blocked": 0, "failed": 0}
+        stats.update({status: count for status, count in cur.fetchall()})
+        stats["total"] = sum(stats.values())
+        return stats
@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+import functools
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import metrics
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+# DB_ASYNC=1 -> кожен виклик БД виконується в окремому пулі потоків,
+# тож повільний запит не блокує event loop python-telegram-bot.
+# Без прапорця функції виконуються як раніше — прямо в event loop.
+USE_DB_EXECUTOR = os.getenv("DB_ASYNC") == "1"
+# Не більше потоків, ніж з'єднань у пулі: зайві потоки все одно чекали б на з'єднання.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "10"))
+
+_executor = None
+
+
+def configure(use_executor=USE_DB_EXECUTOR, max_workers=DB_EXECUTOR_WORKERS):
+    """Вмикає/вимикає виконання запитів у пулі потоків. Викликається один раз при старті."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    if use_executor:
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        logger.info(f"✅ Асинхронний доступ до БД увімкнено ({max_workers} потоків).")
+    else:
+        logger.info("Доступ до БД працює в синхронному режимі.")
+
+
+def shutdown():
+    configure(use_executor=False)
+
+
+async def run_sync(fn, *args, **kwargs):
+    """Виконує синхронну функцію БД, не блокуючи event loop (якщо увімкнено executor)."""
+    started = time.perf_counter()
+    try:
+        if _executor is None:
+            return fn(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        # Копія контексту: запити в потоці зараховуються апдейту, що їх викликав (metrics.timed)
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(_executor, functools.partial(ctx.run, _in_thread, started, fn, *args, **kwargs))
+    finally:
+        metrics.db_call_seconds.observe(time.perf_counter() - started, getattr(fn, "__name__", "?"))
+
+
+def _in_thread(submitted, fn, *args, **kwargs):
+    metrics.db_executor_wait_seconds.observe(time.perf_counter() - submitted)
+    return fn(*args, **kwargs)
+
+
+def _wrap(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_sync(fn, *args, **kwargs)
+    return wrapper
+
+
+# -----------------------------
+# Та сама поверхня, що й у db.py
+# -----------------------------
+get_level_by_score = db.get_level_by_score  # чиста функція, без БД
+
+# Users
+get_user = _wrap(db.get_user)
+create_or_get_user = _wrap(db.create_or_get_user)
+update_user = _wrap(db.update_user)
+add_score = _wrap(db.add_score)
+get_user_field = _wrap(db.get_user_field)
+get_user_snapshot = _wrap(db.get_user_snapshot)
+get_user_snapshots = _wrap(db.get_user_snapshots)
+
+# Tasks
+get_random_task = _wrap(db.get_random_task)
+add_task = _wrap(db.add_task)
+import_tasks = _wrap(db.import_tasks)
+get_all_tasks_by_topic = _wrap(db.get_all_tasks_by_topic)
+get_tasks_page = _wrap(db.get_tasks_page)
+all_tasks_completed = _wrap(db.all_tasks_completed)
+get_task_by_id = _wrap(db.get_task_by_id)
+delete_task = _wrap(db.delete_task)
+update_task_field = _wrap(db.update_task_field)
+get_all_topics = _wrap(db.get_all_topics)
+
+# Feedback / rating / badges
+get_all_feedback = _wrap(db.get_all_feedback)
+get_feedback_page = _wrap(db.get_feedback_page)
+get_user_completed_count = _wrap(db.get_user_completed_count)
+get_top_users = _wrap(db.get_top_users)
+get_user_rank = _wrap(db.get_user_rank)
+get_ranked_users = _wrap(db.get_ranked_users)
+unlock_badge = _wrap(db.unlock_badge)
+unlock_badges = _wrap(db.unlock_badges)
+get_user_badges = _wrap(db.get_user_badges)
+count_user_tasks = _wrap(db.count_user_tasks)
+add_feedback = _wrap(db.add_feedback)
+
+# Progress flags / aggregates
+update_all_tasks_completed_flag = _wrap(db.update_all_tasks_completed_flag)
+update_topics_progress = _wrap(db.update_topics_progress)
+mark_task_completed = _wrap(db.mark_task_completed)
+get_available_levels_for_topic = _wrap(db.get_available_levels_for_topic)
+get_all_topics_by_category = _wrap(db.get_all_topics_by_category)
+get_completed_task_ids = _wrap(db.get_completed_task_ids)
+get_progress_aggregates = _wrap(db.get_progress_aggregates)
+get_task_level_totals = _wrap(db.get_task_level_totals)
+get_user_level_done = _wrap(db.get_user_level_done)
+catalogue_version = db.catalogue_version  # лише читає атрибут кешу
+
+# Streaks
+update_streak_and_reward = _wrap(db.update_streak_and_reward)
+flush_activity = _wrap(db.flush_activity)
+get_topic_streak = _wrap(db.get_topic_streak)
+set_topic_streak = _wrap(db.set_topic_streak)
+inc_topic_streak = _wrap(db.inc_topic_streak)
+reset_topic_streak = _wrap(db.reset_topic_streak)
+has_topic_streak_award = _wrap(db.has_topic_streak_award)
+mark_topic_streak_award = _wrap(db.mark_topic_streak_award)
+award_topic_streak_milestone = _wrap(db.award_topic_streak_milestone)
+apply_topic_streak_answers = _wrap(db.apply_topic_streak_answers)
+
+# Answer pipeline
+record_answer = _wrap(db.record_answer)
+
+# Re-engagement / export
+get_users_for_reengagement = _wrap(db.get_users_for_reengagement)
+get_all_users_for_export = _wrap(db.get_all_users_for_export)
+
+# Conversation state
+load_conversation_state = _wrap(db.load_conversation_state)
+save_conversation_states = _wrap(db.save_conversation_states)
+
+# Broadcasts
+create_broadcast_campaign = _wrap(db.create_broadcast_campaign)
+get_broadcast_campaign = _wrap(db.get_broadcast_campaign)
+get_unfinished_broadcasts = _wrap(db.get_unfinished_broadcasts)
+set_broadcast_status = _wrap(db.set_broadcast_status)
+get_pending_deliveries = _wrap(db.get_pending_deliveries)
+record_broadcast_results = _wrap(db.record_broadcast_results)
+get_broadcast_stats = _wrap(db.get_broadcast_stats)
@@ -0,0 +1,168 @@
+import os
+import io
+import csv
+import gzip
+import logging
+import tempfile
+from datetime import date, timedelta
+
+import db
+import db_async
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+# Bot API приймає документи до 50 МБ; запас — на буфери CSV/gzip, ще не скинуті у файл
+EXPORT_PART_LIMIT = int(os.getenv("EXPORT_PART_LIMIT", str(45 * 1024 * 1024)))
+# До цього розміру частина лежить у пам'яті, далі SpooledTemporaryFile переходить на диск
+EXPORT_SPOOL_SIZE = int(os.getenv("EXPORT_SPOOL_SIZE", str(8 * 1024 * 1024)))
+
+USER_EXPORT_HEADER = ["Telegram ID", "Ім'я", "Username", "Бали", "Місто", "Телефон", "Остання активність"]
+
+
+class ExportPart:
+    """Одна частина експорту: бінарний файл (на початку), ім'я файлу та кількість рядків."""
+
+    def __init__(self, file, filename, rows):
+        self.file = file
+        self.filename = filename
+        self.rows = rows
+
+
+class _PartWriter:
+    """CSV -> (gzip) -> SpooledTemporaryFile; рядки кодуються одразу, без копії всієї таблиці."""
+
+    def __init__(self, header, compress):
+        self.spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+        self.gzip = gzip.GzipFile(fileobj=self.spool, mode="wb") if compress else None
+        self.text = io.TextIOWrapper(self.gzip or self.spool, encoding="utf-8", newline="")
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(header)
+        self.rows = 0
+
+    def size(self):
+        # Байти, що вже дійшли до файлу (без буферів TextIOWrapper/gzip)
+        return self.spool.tell()
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.rows += 1
+
+    def finish(self):
+        self.text.flush()
+        self.text.detach()      # інакше close() закрив би і gzip, і сам файл
+        if self.gzip:
+            self.gzip.close()   # GzipFile з fileobj не закриває spool
+        self.spool.seek(0)
+        return self.spool
+
+    def discard(self):
+        self.spool.close()
+
+
+def write_export(rows, header, basename, compress=False, part_limit=EXPORT_PART_LIMIT):
+    """
+    Синхронно пише рядки в частини не більші за part_limit (кожна — зі своїм заголовком).
+    Повертає список ExportPart; файли закриває той, хто їх відправив (close_parts).
+    """
+    ext = ".csv.gz" if compress else ".csv"
+    parts = []
+    current = None
+    try:
+        for row in rows:
+            if current is None:
+                current = _PartWriter(header, compress)
+            current.write(row)
+            if current.size() >= part_limit:
+                parts.append(ExportPart(current.finish(), None, current.rows))
+                current = None
+        if current is None and not parts:
+            current = _PartWriter(header, compress)   # порожній експорт — лише заголовок
+        if current is not None:
+            parts.append(ExportPart(current.finish(), None, current.rows))
+            current = None
+    except Exception:
+        if current is not None:
+            current.discard()
+        close_parts(parts)
+        raise
+
+    for n, part in enumerate(parts, start=1):
+        suffix = f"_part{n}" if len(parts) > 1 else ""
+        part.filename = f"{basename}{suffix}{ext}"
+    return parts
+
+
+def close_parts(parts):
+    for part in parts:
+        try:
+            part.file.close()
+        except Exception:
+            pass
+
+
+def write_user_export(active_since=None, min_score=None, compress=False, part_limit=EXPORT_PART_LIMIT):
+    """Експорт користувачів потоком з db.iter_users_for_export (викликати в потоці БД)."""
+    return write_export(
+        db.iter_users_for_export(active_since=active_since, min_score=min_score),
+        USER_EXPORT_HEADER, "users_export", compress=compress, part_limit=part_limit,
+    )
+
+
+# -----------------------------
+# Фільтри з аргументів команди
+# -----------------------------
+def parse_export_args(args, today=None):
+    """
+    /export [since=YYYY-MM-DD | days=N] [min_score=N] [gzip]
+    Повертає kwargs для write_user_export; ValueError — з текстом для адміна.
+    """
+    options = {"active_since": None, "min_score": None, "compress": False}
+    for arg in args:
+        key, _, value = arg.partition("=")
+        key = key.lower()
+        try:
+            if key in ("gzip", "gz") and not value:
+                options["compress"] = True
+            elif key == "since":
+                options["active_since"] = date.fromisoformat(value)
+            elif key == "days":
+                options["active_since"] = (today or date.today()) - timedelta(days=int(value))
+            elif key in ("min_score", "score"):
+                options["min_score"] = int(value)
+            else:
+                raise ValueError(arg)
+        except ValueError:
+            raise ValueError(f"Невідомий або некоректний параметр: {arg}")
+    return options
+
+
+def describe_filters(active_since=None, min_score=None, **_):
+    parts = []
+    if active_since is not None:
+        parts.append(f"активні з {active_since.isoformat()}")
+    if min_score is not None:
+        parts.append(f"бали ≥ {min_score}")
+    return ", ".join(parts)
+
+
+async def send_user_export(bot, chat_id, **options):
+    """Будує експорт у потоці БД і відправляє частини по черзі. Повертає кількість рядків."""
+    parts = await db_async.run_sync(write_user_export, **options)
+    total = sum(part.rows for part in parts)
+    filters_text = describe_filters(**options)
+    logger.info(f"Експорт користувачів: {total} рядків, {len(parts)} частин ({filters_text or 'без фільтрів'}).")
+    try:
+        for n, part in enumerate(parts, start=1):
+            caption = f"✅ Ось експорт {total} користувачів"
+            if filters_text:
+                caption += f" ({filters_text})"
+            if len(parts) > 1:
+                caption += f", частина {n}/{len(parts)}"
+            await bot.send_document(chat_id=chat_id, document=part.file, filename=part.filename, caption=caption + ".")
+    finally:
+        close_parts(parts)
+    return total
@@ -1,9 +1,8 @@
 import json
-import csv
-import io
 import logging
-from telegram import Update, ReplyKeyboardRemove, ReplyKeyboardMarkup, KeyboardButton
+from telegram import Update, ReplyKeyboardRemove, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from metrics import timed
 
 from handlers.utils import (
     build_admin_menu,
@@ -20,18 +19,22 @@ from handlers.utils import (
     admin_ids,
     build_type_keyboard,         
     TYPE_BUTTONS,                  
+    parse_pagination_data,
 )
 
-from db import (
-    get_all_feedback,
+from export import send_user_export, parse_export_args
+from task_import import run_import, download_document, TaskImportError, TASK_IMPORT_MAX_BYTES
+import metrics
+import db
+from db_async import (
+    get_feedback_page,
     get_all_topics_by_category,
     get_all_topics,
-    get_all_tasks_by_topic,
+    get_tasks_page,
     get_task_by_id,
     delete_task,
     update_task_field,
     add_task,
-    get_all_users_for_export,
 )
 
 TASKS_PER_PAGE = 5
@@ -42,6 +45,7 @@ logger = logging.getLogger(__name__)
 if not logger.hasHandlers():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+@timed
 async def admin_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
 
@@ -54,10 +58,12 @@ async def admin_message_handler(update: Update, context: ContextTypes.DEFAULT_TY
     if await handle_edit_task(update, context, text):
         return
 
+@timed
 async def addtask_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = "➕ Додати задачу"
     await handle_admin_menu(update, context, text) 
 
+@timed
 async def handle_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, text):
     user_id = update.effective_user.id 
 
@@ -77,27 +83,18 @@ async def handle_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE,
         try:
             await context.bot.send_chat_action(chat_id=user_id, action="typing")
             
-            logger.info(f"Admin {user_id}: Calling get_all_feedback...")
-            feedbacks = get_all_feedback()
-            logger.info(f"Admin {user_id}: get_all_feedback returned {len(feedbacks)} items.")
+            logger.info(f"Admin {user_id}: Loading the first feedback page...")
+            msg, markup = await show_feedback_page_msg(0)
             
-            if not feedbacks:
+            if msg is None:
                 await update.message.reply_text("Немає звернень.", reply_markup=build_admin_menu())
                 logger.info(f"Admin {user_id}: No feedbacks found, replied.")
                 return True
                 
             context.user_data['feedback_state'] = {"page": 0, "step": "pagination"}
-            
-            logger.info(f"Admin {user_id}: Generating feedback page message...")
-            msg, total = show_feedback_page_msg(feedbacks, 0)
-            has_prev = False
-            has_next = FEEDBACKS_PER_PAGE < total
             logger.info(f"Admin {user_id}: Feedback message generated. Sending...")
             
-            await update.message.reply_text(
-                msg,
-                reply_markup=build_feedback_pagination_inline_keyboard(0, has_prev, has_next)
-            )
+            await update.message.reply_text(msg, reply_markup=markup)
             logger.info(f"Admin {user_id}: Feedback message sent successfully.")
             return True
             
@@ -194,7 +191,7 @@ async def handle_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE,
         if state.get("step") == "choose_category" and text in CATEGORIES:
             await context.bot.send_chat_action(chat_id=user_id, action="typing")
             state["category"] = text
-            topics = get_all_topics_by_category(text)
+            topics = await get_all_topics_by_category(text)
             if not topics:
                 await update.message.reply_text("У цій категорії немає тем.", reply_markup=build_admin_menu())
                 context.user_data['admin_menu_state'] = True
@@ -209,27 +206,15 @@ async def handle_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE,
     if text == "📥 Експорт користувачів (CSV)" and context.user_data.get('admin_menu_state'):
         await context.bot.send_chat_action(chat_id=user_id, action="upload_document")
         try:
-            users_data = get_all_users_for_export()
-            f = io.StringIO()
-            writer = csv.writer(f)
-            writer.writerow(["Telegram ID", "Ім'я", "Username", "Бали", "Місто", "Телефон", "Остання активність"])
-            for user in users_data:
-                writer.writerow(user)
-            f.seek(0)
-            bytes_io = io.BytesIO(f.getvalue().encode('utf-8'))
-            await context.bot.send_document(
-                chat_id=user_id,
-                document=bytes_io,
-                filename="users_export.csv",
-                caption=f"✅ Ось експорт {len(users_data)} користувачів."
-            )
+            # Streamed from a server-side cursor into spooled files; see export.py
+            await send_user_export(context.bot, user_id)
         except Exception as e:
             await update.message.reply_text(f"❌ Не вдалося створити експорт: {e}")
         return True    
 
     if text == "📋 Переглянути щоденні задачі" and context.user_data.get('admin_menu_state'):
         # 🔄 ВИПРАВЛЕНО: is_daily=1 -> is_daily=True
-        topics = get_all_topics(is_daily=True)
+        topics = await get_all_topics(is_daily=True)
         if not topics:
             await update.message.reply_text("У базі ще немає жодної теми.", reply_markup=build_admin_menu())
             return True
@@ -249,7 +234,7 @@ async def handle_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE,
         is_daily_check = (state.get("step") == "choose_topic_daily")
         
         # 🔄 ВИПРАВЛЕНО: Передаємо boolean у функцію
-        topics = get_all_topics(is_daily=is_daily_check)
+        topics = await get_all_topics(is_daily=is_daily_check)
         
         if state.get("step") in ["choose_topic", "choose_topic_daily"] and text in topics:
             state["topic"] = text
@@ -259,7 +244,7 @@ async def handle_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE,
             logger.info(f"[DEBUG] Вибрана тема: {text}, state: {state}")
             
             # 🔄 ВИПРАВЛЕНО: Передаємо boolean у функцію
-            await show_tasks_page(update, state["topic"], 0, is_daily=state["is_daily"])
+            await show_tasks_page(update, state["topic"], 0, is_daily=state["is_daily"], state=state)
             return True
 
         # Повернення на вибір дії адмінки
@@ -278,26 +263,36 @@ async def handle_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE,
             is_daily = state.get("is_daily", False) # Отримуємо boolean (default False)
             
             if text == "⬅️ Попередня":
-                state["page"] = max(0, page - 1)
-                await show_tasks_page(update, topic, state["page"], is_daily=is_daily)
+                await show_tasks_page(update, topic, max(0, page - 1), is_daily=is_daily, state=state,
+                                      before_id=state.get("first_id"))
                 return True
             if text == "Наступна ➡️":
-                state["page"] = page + 1
-                await show_tasks_page(update, topic, state["page"], is_daily=is_daily)
+                if state.get("last_id") is None:
+                    await show_tasks_page(update, topic, 0, is_daily=is_daily, state=state)
+                else:
+                    await show_tasks_page(update, topic, page + 1, is_daily=is_daily, state=state,
+                                          after_id=state["last_id"])
                 return True
 
     return False
 
-def show_tasks_page_msg(topic, page, is_daily=False): # 🔄 Default False
-    all_tasks = get_all_tasks_by_topic(topic, is_daily)
-    print(f"DEBUG show_tasks_page_msg: all_tasks count={len(all_tasks)}")
-
-    total = len(all_tasks)
-    start = page * TASKS_PER_PAGE
-    end = start + TASKS_PER_PAGE
-    tasks_on_page = all_tasks[start:end]
-    msg = f"Список задач з теми «{topic}» (сторінка {page+1}/{(total-1)//TASKS_PER_PAGE+1}):\n\n"
-    for t in tasks_on_page:
+async def show_tasks_page_msg(topic, page, is_daily=False, after_id=None, before_id=None): # 🔄 Default False
+    """
+    Renders one keyset page of the topic's tasks (TASKS_PER_PAGE rows + a lookahead row are read).
+    Returns (msg, inline keyboard, (page, first_id, last_id)); the ids go into the buttons' callback data.
+    """
+    tasks, has_prev, has_next, total = await get_tasks_page(topic, is_daily, after_id, before_id, TASKS_PER_PAGE)
+    if not tasks and (after_id is not None or before_id is not None):
+        # Everything past the cursor was deleted meanwhile — start over from the first page
+        return await show_tasks_page_msg(topic, 0, is_daily)
+
+    total_pages = (total - 1) // TASKS_PER_PAGE + 1 if total else 1
+    if not has_prev:
+        page = 0
+    elif not has_next:
+        page = max(page, total_pages - 1)
+    msg = f"Список задач з теми «{topic}» (сторінка {page+1}/{max(total_pages, page+1)}):\n\n"
+    for t in tasks:
         tt = t.get('task_type') or '—'
         msg += (
             f"ID: {t['id']}\n"
@@ -306,33 +301,46 @@ def show_tasks_page_msg(topic, page, is_daily=False): # 🔄 Default False
             f"Тип: {tt}\n"
             f"Питання: {t['question'][:30]}...\n\n"
         )
-    return msg, len(all_tasks)
-
-def show_feedback_page_msg(feedbacks, page):
-    total = len(feedbacks)
-    start = page * FEEDBACKS_PER_PAGE
-    end = start + FEEDBACKS_PER_PAGE
-    page_feedbacks = feedbacks[start:end]
-    msg = f"Список звернень користувачів (сторінка {page+1}/{(total-1)//FEEDBACKS_PER_PAGE+1}):\n\n"
-    for fb in page_feedbacks:
+    first_id = tasks[0]['id'] if tasks else None
+    last_id = tasks[-1]['id'] if tasks else None
+    markup = build_tasks_pagination_inline_keyboard(page, has_prev, has_next, first_id=first_id, last_id=last_id)
+    return msg, markup, (page, first_id, last_id)
+
+async def show_feedback_page_msg(page, after_id=None, before_id=None):
+    """
+    Renders one keyset page of feedback, newest first: (msg, inline keyboard), or (None, None) if there is none.
+    Only FEEDBACKS_PER_PAGE rows + a lookahead row are read; the total is estimated for a large table.
+    """
+    feedbacks, has_prev, has_next, total, exact = await get_feedback_page(after_id, before_id, FEEDBACKS_PER_PAGE)
+    if not feedbacks:
+        if after_id is None and before_id is None:
+            return None, None
+        return await show_feedback_page_msg(0)
+
+    if not has_prev:
+        page = 0
+    total_pages = max((total - 1) // FEEDBACKS_PER_PAGE + 1, page + 1)
+    shown_total = f"{total_pages}" if exact else f"~{total_pages}"
+    msg = f"Список звернень користувачів (сторінка {page+1}/{shown_total}):\n\n"
+    for fb in feedbacks:
         # fb: (id, user_id, username, message, date)
         msg += f"ID: {fb[0]}\nКористувач: @{fb[2]} (id:{fb[1]})\n{fb[3]}\n{fb[4]}\n\n"
-    return msg, total
-
-async def show_tasks_page(update, topic, page, is_daily=False): # 🔄 Default False
-    msg, total = show_tasks_page_msg(topic, page, is_daily)
-    has_prev = page > 0
-    has_next = (page + 1) * TASKS_PER_PAGE < total
-    # print(f"[DEBUG] show_tasks_page: topic={topic}, page={page}, has_prev={has_prev}, has_next={has_next}, total={total}")
-    await update.message.reply_text(
-        msg,
-        reply_markup=build_tasks_pagination_inline_keyboard(page, has_prev, has_next)
+    markup = build_feedback_pagination_inline_keyboard(
+        page, has_prev, has_next, first_id=feedbacks[0][0], last_id=feedbacks[-1][0],
     )
+    return msg, markup
+
+async def show_tasks_page(update, topic, page, is_daily=False, state=None, after_id=None, before_id=None): # 🔄 Default False
+    msg, markup, cursor = await show_tasks_page_msg(topic, page, is_daily, after_id, before_id)
+    if state is not None:
+        state["page"], state["first_id"], state["last_id"] = cursor
+    await update.message.reply_text(msg, reply_markup=markup)
     await update.message.reply_text(
         "Оберіть дію з задачами:",
-        reply_markup=build_tasks_pagination_keyboard(page, has_prev, has_next)
+        reply_markup=build_tasks_pagination_keyboard(cursor[0])
     )
 
+@timed
 async def handle_add_task(update: Update, context: ContextTypes.DEFAULT_TYPE, text):
     user_id = update.effective_user.id 
     
@@ -417,7 +425,7 @@ async def handle_add_task(update: Update, context: ContextTypes.DEFAULT_TYPE, te
             return True
         state["step"] = "answer"
         state["data"] = data
-        await update.message.reply_text("🔷 Введи правильні відповіді через кому (наприклад: 2, -2):", reply_markup=build_cancel_keyboard())
+        await update.message.reply_text("🔷 Введи правильні відповіді через кому (наприклад: 2, -2; округлену відповідь познач ≈, наприклад ≈1.41):", reply_markup=build_cancel_keyboard())
         return True
 
     elif state["step"] == "answer":
@@ -436,7 +444,7 @@ async def handle_add_task(update: Update, context: ContextTypes.DEFAULT_TYPE, te
             data["category"] = "Щоденні"   
         
         try:
-            add_task(data)
+            await add_task(data)
             await update.message.reply_text("✅ Задачу додано успішно!", reply_markup=build_admin_menu() if context.user_data.get('admin_menu_state') else build_main_menu(user_id))
         except Exception as e:
             logger.error(f"Error adding task: {e}")
@@ -448,6 +456,7 @@ async def handle_add_task(update: Update, context: ContextTypes.DEFAULT_TYPE, te
     return False
 
 
+@timed
 async def handle_delete_task(update: Update, context: ContextTypes.DEFAULT_TYPE, text):
     if 'delete_task_state' not in context.user_data:
         return False
@@ -460,12 +469,12 @@ async def handle_delete_task(update: Update, context: ContextTypes.DEFAULT_TYPE,
     if state["step"] == "ask_id":
         try:
             task_id = int(text)
-            task = get_task_by_id(task_id)
+            task = await get_task_by_id(task_id)
             if not task:
                 await update.message.reply_text("Задача з таким ID не знайдена. Введіть ще раз або ❌ Скасувати.")
                 return True
             state['is_daily'] = task.get('is_daily', False)
-            delete_task(task_id)
+            await delete_task(task_id)
             await update.message.reply_text(f"✅ Задача {task_id} видалена.", reply_markup=build_admin_menu())
             context.user_data.pop('delete_task_state', None)
             context.user_data['admin_menu_state'] = True
@@ -475,6 +484,7 @@ async def handle_delete_task(update: Update, context: ContextTypes.DEFAULT_TYPE,
             return True
     return False
 
+@timed
 async def handle_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE, text):
     if 'edit_task_state' not in context.user_data:
         return False
@@ -490,7 +500,7 @@ async def handle_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE, t
     if state.get("step") == "ask_id":
         try:
             task_id = int(text)
-            task = get_task_by_id(task_id)
+            task = await get_task_by_id(task_id)
             if not task:
                 await update.message.reply_text("Задача з таким ID не знайдена. Введіть ще раз або ❌ Скасувати.")
                 return True
@@ -523,10 +533,10 @@ async def handle_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE, t
             if len(text.strip()) == 0:
                 await update.message.reply_text("Тема не може бути порожньою. Введіть нову тему або натисніть 'Пропустити':", reply_markup=skip_cancel_keyboard())
                 return True
-            update_task_field(task_id, "topic", text.strip())
+            await update_task_field(task_id, "topic", text.strip())
 
         state["step"] = "edit_question"
-        task = get_task_by_id(task_id)
+        task = await get_task_by_id(task_id)
         await update.message.reply_text(
             f"Поточне питання: {task['question']}\nВведіть новий текст задачі або натисніть 'Пропустити':",
             reply_markup=skip_cancel_keyboard()
@@ -537,11 +547,11 @@ async def handle_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE, t
     if state.get("step") == "edit_question":
         task_id = state["task_id"]
         if text != "Пропустити" and text.strip():
-            update_task_field(task_id, "question", text.strip())
+            await update_task_field(task_id, "question", text.strip())
         
         if state.get("is_daily"):
             state["step"] = "edit_answer"
-            task = get_task_by_id(task_id)
+            task = await get_task_by_id(task_id)
             ans_str = ', '.join(task['answer']) if isinstance(task['answer'], list) else str(task['answer'])
             await update.message.reply_text(
                 f"Поточна відповідь: {ans_str}\nВведіть нову відповідь через кому або натисніть 'Пропустити':",
@@ -549,7 +559,7 @@ async def handle_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE, t
             )
         else:
             state["step"] = "edit_level"
-            task = get_task_by_id(task_id)
+            task = await get_task_by_id(task_id)
             await update.message.reply_text(
                 f"Поточний рівень: {task['level']}\nВведіть новий рівень (легкий/середній/важкий) або натисніть 'Пропустити':",
                 reply_markup=skip_cancel_keyboard()
@@ -566,10 +576,10 @@ async def handle_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE, t
             await update.message.reply_text("❌ Невірний рівень. Можливі: легкий / середній / важкий / Пропустити.")
             return True
         if level and norm != "пропустити":
-            update_task_field(task_id, "level", allowed[norm])
+            await update_task_field(task_id, "level", allowed[norm])
 
         state["step"] = "edit_type"
-        task = get_task_by_id(task_id)
+        task = await get_task_by_id(task_id)
         current_type = task.get("task_type") or "—"
         await update.message.reply_text(
             f"Поточний тип: {current_type}\n"
@@ -586,9 +596,9 @@ async def handle_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE, t
             if btn not in TYPE_BUTTONS:
                 await update.message.reply_text("❌ Оберіть тип із кнопок, або натисніть 'Пропустити'.", reply_markup=build_type_keyboard())
                 return True
-            update_task_field(task_id, "task_type", TYPE_BUTTONS[btn])
+            await update_task_field(task_id, "task_type", TYPE_BUTTONS[btn])
         state["step"] = "edit_answer"
-        task = get_task_by_id(task_id)
+        task = await get_task_by_id(task_id)
         ans_str = ', '.join(task['answer']) if isinstance(task['answer'], list) else str(task['answer'])
         await update.message.reply_text(
             f"Поточна відповідь: {ans_str}\nВведіть нову відповідь через кому або натисніть 'Пропустити':",
@@ -603,9 +613,9 @@ async def handle_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE, t
         if text != "Пропустити" and text.strip():
             ans_list = [a.strip() for a in text.split(",")]
             # update_task_field сама перетворить на JSONB
-            update_task_field(task_id, "answer", ans_list)
+            await update_task_field(task_id, "answer", ans_list)
         state["step"] = "edit_explanation"
-        task = get_task_by_id(task_id)
+        task = await get_task_by_id(task_id)
         await update.message.reply_text(
             f"Поточне пояснення: {task['explanation']}\nВведіть нове пояснення або натисніть 'Пропустити':",
             reply_markup=skip_cancel_keyboard()
@@ -616,7 +626,7 @@ async def handle_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE, t
     if state.get("step") == "edit_explanation":
         task_id = state["task_id"]
         if text != "Пропустити" and text.strip():
-            update_task_field(task_id, "explanation", text.strip())
+            await update_task_field(task_id, "explanation", text.strip())
         
         state["step"] = "edit_photo"
         await update.message.reply_text(
@@ -641,40 +651,46 @@ async def handle_edit_task(update: Update, context: ContextTypes.DEFAULT_TYPE, t
 
     return False
 
+@timed
 async def handle_task_pagination_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    
+
+    # Page indicator (task and feedback keyboards): nothing to re-render
+    if query.data == "noop":
+        await query.answer()
+        return
+
     if not context.user_data.get('admin_menu_state') or not isinstance(context.user_data['admin_menu_state'], dict):
         await query.answer()
         return
 
     state = context.user_data['admin_menu_state']
     topic = state["topic"]
-    page = state["page"]
     is_daily = state.get("is_daily", False) # 🔄 ВИПРАВЛЕНО: Default False
 
-    if query.data.startswith("prev_"):
-        page = max(0, page - 1)
-        state["page"] = page
-    elif query.data.startswith("next_"):
-        page = page + 1
-        state["page"] = page
-    elif query.data == "back":
+    # The page and its keyset cursor come from the button itself, not from user_data
+    page, cursor_id = parse_pagination_data(query.data)
+    after_id = before_id = None
+    if query.data == "back":
         context.user_data['admin_menu_state'] = True
         await query.edit_message_text("Виберіть дію:", reply_markup=build_admin_menu())
         await query.answer()
         return
+    elif cursor_id is None:
+        # Legacy prev_N/next_N buttons carry no cursor: start over from the first page
+        page = 0
+    elif query.data.startswith("prev_"):
+        page, before_id = max(0, page - 1), cursor_id
+    elif query.data.startswith("next_"):
+        page, after_id = page + 1, cursor_id
 
-    msg, total = show_tasks_page_msg(topic, page, is_daily)
-    has_prev = page > 0
-    has_next = (page + 1) * TASKS_PER_PAGE < total
+    msg, markup, cursor = await show_tasks_page_msg(topic, page, is_daily, after_id, before_id)
+    state["page"], state["first_id"], state["last_id"] = cursor
 
-    await query.edit_message_text(
-        msg,
-        reply_markup=build_tasks_pagination_inline_keyboard(page, has_prev, has_next)
-    )
+    await query.edit_message_text(msg, reply_markup=markup)
     await query.answer()
 
+@timed
 async def handle_feedback_pagination_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     
@@ -682,26 +698,27 @@ async def handle_feedback_pagination_callback(update: Update, context: ContextTy
         await query.answer()
         return
 
-    feedbacks = get_all_feedback()
     state = context.user_data['feedback_state']
-    page = state["page"]
+    page, cursor_id = parse_pagination_data(query.data)
+    after_id = before_id = None
 
-    if query.data.startswith("feedback_prev_"):
-        page = max(0, page - 1)
-        state["page"] = page
+    if cursor_id is None:
+        page = 0
+    elif query.data.startswith("feedback_prev_"):
+        page, before_id = max(0, page - 1), cursor_id
     elif query.data.startswith("feedback_next_"):
-        page = page + 1
-        state["page"] = page
-
-    msg, total = show_feedback_page_msg(feedbacks, page)
-    has_prev = page > 0
-    has_next = (page + 1) * FEEDBACKS_PER_PAGE < total
-    await query.edit_message_text(
-        msg,
-        reply_markup=build_feedback_pagination_inline_keyboard(page, has_prev, has_next)
-    )
+        page, after_id = page + 1, cursor_id
+
+    msg, markup = await show_feedback_page_msg(page, after_id, before_id)
+    if msg is None:
+        await query.edit_message_text("Немає звернень.")
+        await query.answer()
+        return
+    state["page"] = page
+    await query.edit_message_text(msg, reply_markup=markup)
     await query.answer()
 
+@timed
 async def handle_add_task_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('add_task_state'):
         state = context.user_data['add_task_state']
@@ -712,19 +729,20 @@ async def handle_add_task_photo(update: Update, context: ContextTypes.DEFAULT_TY
             state["data"] = data
             state["step"] = "answer"
             await update.message.reply_text(
-                "🔷 Введи правильні відповіді через кому (наприклад: 2, -2):",
+                "🔷 Введи правильні відповіді через кому (наприклад: 2, -2; округлену відповідь познач ≈, наприклад ≈1.41):",
                 reply_markup=build_cancel_keyboard()
             )
             return True
     return False
 
+@timed
 async def handle_edit_task_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('edit_task_state'):
         state = context.user_data['edit_task_state']
         if state.get("step") == "edit_photo":
             task_id = state["task_id"]
             file_id = update.message.photo[-1].file_id
-            update_task_field(task_id, "photo", file_id)
+            await update_task_field(task_id, "photo", file_id)
             await update.message.reply_text(
                 "✅ Фото задачі оновлено.",
                 reply_markup=build_admin_menu()
@@ -734,6 +752,7 @@ async def handle_edit_task_photo(update: Update, context: ContextTypes.DEFAULT_T
             return True
     return False
 
+@timed
 async def handle_admin_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('add_task_state') and context.user_data['add_task_state'].get("step") == "photo":
         await handle_add_task_photo(update, context)
@@ -748,6 +767,7 @@ async def handle_admin_photo(update: Update, context: ContextTypes.DEFAULT_TYPE)
 from telegram.constants import ParseMode # Переконайся, що це імпортовано
 from handlers.utils import admin_ids
 
+@timed
 async def notify_admin_promotion(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Команда: /promote <user_id>
@@ -782,4 +802,132 @@ async def notify_admin_promotion(update: Update, context: ContextTypes.DEFAULT_T
         await context.bot.send_message(chat_id=target_id, text=message_text, parse_mode=ParseMode.HTML)
         await update.message.reply_text(f"✅ Користувача <code>{target_id}</code> успішно повідомлено!", parse_mode=ParseMode.HTML)
     except Exception as e:
-        await update.message.reply_text(f"❌ Не вдалося надіслати повідомлення (можливо, користувач не заблокував бота):\n{e}")
\ No newline at end of file
+        await update.message.reply_text(f"❌ Не вдалося надіслати повідомлення (можливо, користувач не заблокував бота):\n{e}")
+
+@timed
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Command: /export [since=YYYY-MM-DD | days=N] [min_score=N] [gzip]
+    Filtered user export; same pipeline as the "📥 Експорт користувачів (CSV)" button.
+    """
+    user_id = update.effective_user.id
+    if user_id not in admin_ids:
+        return
+
+    try:
+        options = parse_export_args(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❌ {e}\nПриклад: <code>/export days=30 min_score=10 gzip</code>", parse_mode=ParseMode.HTML
+        )
+        return
+
+    await context.bot.send_chat_action(chat_id=user_id, action="upload_document")
+    try:
+        total = await send_user_export(context.bot, user_id, **options)
+        if total == 0:
+            await update.message.reply_text("За цими фільтрами користувачів не знайдено.")
+    except Exception as e:
+        logger.error(f"Admin {user_id}: export failed: {e}", exc_info=True)
+        await update.message.reply_text(f"❌ Не вдалося створити експорт: {e}")
+
+
+@timed
+async def handle_import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    An admin sends a .csv/.json/.zip with tasks: validate it and reply with a dry-run report.
+    The file itself is not kept — "✅ Імпортувати" downloads it again by file_id (see task_import.py).
+    """
+    user_id = update.effective_user.id
+    if user_id not in admin_ids:
+        return
+    document = update.message.document
+    if document.file_size and document.file_size > TASK_IMPORT_MAX_BYTES:
+        await update.message.reply_text("❌ Файл завеликий: боти можуть завантажувати документи до 20 МБ.")
+        return
+
+    await context.bot.send_chat_action(chat_id=user_id, action="typing")
+    try:
+        binary = await download_document(context.bot, document.file_id)
+        try:
+            report, can_apply = await run_import(binary, document.file_name, dry_run=True)
+        finally:
+            binary.close()
+    except TaskImportError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    except Exception as e:
+        logger.error(f"Admin {user_id}: task import check failed: {e}", exc_info=True)
+        await update.message.reply_text(f"❌ Не вдалося перевірити файл: {e}")
+        return
+
+    markup = None
+    if can_apply:
+        context.user_data['task_import'] = {"file_id": document.file_id, "file_name": document.file_name}
+        markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton("✅ Імпортувати", callback_data="import_apply"),
+            InlineKeyboardButton("❌ Скасувати", callback_data="import_cancel"),
+        ]])
+    await update.message.reply_text(report, parse_mode=ParseMode.HTML, reply_markup=markup)
+
+@timed
+async def handle_import_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    user_id = update.effective_user.id
+    pending = context.user_data.pop('task_import', None)
+    if user_id not in admin_ids or pending is None:
+        await query.answer("Немає імпорту, що очікує підтвердження.")
+        return
+    if query.data == "import_cancel":
+        await query.edit_message_reply_markup(reply_markup=None)
+        await query.answer("Імпорт скасовано.")
+        return
+
+    await query.answer("Імпортую…")
+    await query.edit_message_reply_markup(reply_markup=None)
+    try:
+        binary = await download_document(context.bot, pending["file_id"])
+        try:
+            report, _ = await run_import(binary, pending["file_name"], dry_run=False, bot=context.bot, chat_id=user_id)
+        finally:
+            binary.close()
+    except Exception as e:
+        logger.error(f"Admin {user_id}: task import failed: {e}", exc_info=True)
+        await context.bot.send_message(chat_id=user_id, text=f"❌ Імпорт не вдався, зміни не збережено: {e}")
+        return
+    await context.bot.send_message(chat_id=user_id, text=report, parse_mode=ParseMode.HTML)
+
+
+def _stats_table(title, metric, top=8, unit="ms"):
+    rows = metrics.summary(metric, top=top)
+    if not rows:
+        return f"<b>{title}</b>\n  —\n"
+    scale = 1000 if unit == "ms" else 1
+    lines = [f"<b>{title}</b> (count · mean · p50 · p95, {unit})"]
+    for label, count, mean, p50, p95 in rows:
+        lines.append(f"<code>{label[:28]:<28} {count:>7} {mean * scale:>8.1f} {p50 * scale:>8.1f} {p95 * scale:>8.1f}</code>")
+    return "\n".join(lines) + "\n"
+
+@timed
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Command: /stats — slowest handlers, SQL statements per handler, db calls, Bot API calls and pool state.
+    The same data is exported in Prometheus format on METRICS_PORT (see metrics.py).
+    """
+    user_id = update.effective_user.id
+    if user_id not in admin_ids:
+        return
+
+    pool = db.pool_stats()
+    parts = [
+        _stats_table("⏱ Хендлери", metrics.handler_seconds),
+        _stats_table("🧮 SQL-запитів на виклик хендлера", metrics.handler_db_queries, unit="шт"),
+        _stats_table("🗄 Функції БД", metrics.db_call_seconds),
+        _stats_table("📡 Bot API", metrics.telegram_api_seconds),
+        _stats_table("⏳ Очікування з'єднання з пулу", metrics.db_pool_wait_seconds, top=1),
+        (
+            f"<b>Пул БД:</b> відкрито {pool.get('open', 0)}/{pool.get('maxconn', 0)}, "
+            f"зайнято {pool.get('in_use', 0)}, таймаутів {pool.get('timeouts_total', 0)}"
+        ),
+    ]
+    await update.message.reply_text("\n".join(parts), parse_mode=ParseMode.HTML)
@@ -0,0 +1,117 @@
+import os
+import types
+import logging
+import threading
+import collections
+
+import db
+
+# --- Logging Setup ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- End Logging Setup ---
+
+# How many users keep their unlocked badge set in memory (LRU)
+BADGE_CACHE_SIZE = int(os.getenv("BADGE_CACHE_SIZE", "50000"))
+
+# Users-row fields carried by each domain event (see db.subscribe)
+EVENT_FIELDS = {
+    "score_changed": ("score",),
+    "streak_changed": ("streak_days",),
+    "feedback_added": ("feedbacks",),
+    "task_completed": ("all_tasks_completed", "topics_total", "topics_completed"),
+}
+
+
+class BadgeEngine:
+    """
+    Unlocks badges in reaction to domain events.
+
+    Rules are BADGES_LIST entries: (name, emoji, description, condition, reward, fields).
+    A rule is evaluated only for events that carry all of its `fields`, against the
+    values in the event itself, so no users-row query is needed. Badges a user already
+    has are remembered, and the rest are unlocked with one db.unlock_badges() call.
+    Badges unlocked in the background are kept until show_badges announces them.
+    """
+
+    def __init__(self, rules, max_users=BADGE_CACHE_SIZE):
+        self.rules = rules
+        self.max_users = max_users
+        self._by_event = {
+            event: [rule for rule in rules if set(rule[5]) <= set(fields)]
+            for event, fields in EVENT_FIELDS.items()
+        }
+        self._lock = threading.Lock()
+        self._known = collections.OrderedDict()   # user_id -> set of unlocked badge names
+        self._unseen = {}                         # user_id -> [badge names not yet shown]
+
+    # -----------------------------
+    # Known badges
+    # -----------------------------
+    def badges_of(self, user_id):
+        """Set of the user's unlocked badges (loaded from the DB once, then kept in sync)."""
+        with self._lock:
+            known = self._known.get(user_id)
+            if known is not None:
+                self._known.move_to_end(user_id)
+                return set(known)
+        loaded = set(db.get_user_badges(user_id))
+        with self._lock:
+            known = self._known.setdefault(user_id, loaded)
+            known.update(loaded)
+            while len(self._known) > self.max_users:
+                self._known.popitem(last=False)
+            return set(known)
+
+    def _remember(self, user_id, badges):
+        with self._lock:
+            known = self._known.get(user_id)
+            if known is not None:
+                known.update(badges)
+
+    # -----------------------------
+    # Evaluation
+    # -----------------------------
+    def _unlock_matching(self, user_id, rules, values):
+        known = self.badges_of(user_id)
+        candidates = []
+        for name, _emoji, _descr, condition, reward, _fields in rules:
+            if name in known:
+                continue
+            try:
+                if condition(values):
+                    candidates.append((name, reward))
+            except Exception as e:
+                logger.error(f"Error checking condition for badge '{name}' for user {user_id}: {e}", exc_info=True)
+        if not candidates:
+            return []
+
+        unlocked = db.unlock_badges(user_id, candidates)
+        # Candidates that were not inserted were already unlocked elsewhere
+        self._remember(user_id, [name for name, _ in candidates])
+        if unlocked:
+            logger.info(f"User {user_id}: Unlocked badges {unlocked}.")
+            with self._lock:
+                self._unseen.setdefault(user_id, []).extend(unlocked)
+                while len(self._unseen) > self.max_users:
+                    self._unseen.pop(next(iter(self._unseen)))
+        return unlocked
+
+    def on_event(self, event, payload):
+        user_id = payload.get("user_id")
+        if event == "badge_unlocked":
+            self._remember(user_id, [payload["badge"]])
+            return
+        rules = self._by_event.get(event)
+        if not rules or any(field not in payload for field in EVENT_FIELDS[event]):
+            return
+        self._unlock_matching(user_id, rules, types.SimpleNamespace(**payload))
+
+    def evaluate(self, user_id, snapshot):
+        """Checks every rule against a full UserSnapshot (users who earned badges before the engine existed)."""
+        return self._unlock_matching(user_id, self.rules, snapshot)
+
+    def pop_unseen(self, user_id):
+        with self._lock:
+            return self._unseen.pop(user_id, [])
@@ -1,13 +1,15 @@
 import logging
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import ContextTypes
+from metrics import timed
 
+import db
 # Import database functions
-from db import (
-    get_user_field, unlock_badge, get_user_badges, count_user_tasks
-)
+from db_async import run_sync
+from handlers.badge_engine import BadgeEngine
 # Import utility functions if needed (e.g., build_main_menu for error handling)
 from handlers.utils import build_main_menu
+from handlers.snapshot import load_user_snapshot, invalidate_user_snapshot
 
 # --- Logging Setup ---
 logger = logging.getLogger(__name__)
@@ -17,54 +19,60 @@ if not logger.hasHandlers():
 
 # Define the list of badges and their unlock conditions/rewards
 # (Ensure rewards match the balanced values discussed)
+# Conditions receive a db.UserSnapshot or the values carried by a domain event;
+# the last element lists the users fields a condition reads, which decides the events it reacts to.
 BADGES_LIST = [
     ("Сотий крок", "💯",
      "Досягни 100 балів та стань майстром математики! (+50 балів)",
-     lambda user_id: (get_user_field(user_id, "score") or 0) >= 100,
-     50),
+     lambda u: (u.score or 0) >= 100,
+     50, ("score",)),
 
     ("Всі теми!", "📚",
      "Виріши задачі хоча б з кожної теми. (+150 балів)",
      # Check if topics_completed >= topics_total (and total > 0)
-     lambda user_id: (tt := get_user_field(user_id, "topics_total") or 0) > 0 and \
-                     (get_user_field(user_id, "topics_completed") or 0) >= tt,
-     150),
+     lambda u: (u.topics_total or 0) > 0 and (u.topics_completed or 0) >= u.topics_total,
+     150, ("topics_total", "topics_completed")),
 
     ("Фідбекер", "📨",
      "Надішли відгук або питання розробнику. (+5 балів)",
-     lambda user_id: (get_user_field(user_id, "feedbacks") or 0) >= 1,
-     5),
+     lambda u: (u.feedbacks or 0) >= 1,
+     5, ("feedbacks",)),
 
     ("Гуру", "🧙‍♂️",
      "Пройди всі задачі у боті. (+500 балів)",
      # Checks the all_tasks_completed flag which is updated by db functions
-     lambda user_id: bool(get_user_field(user_id, "all_tasks_completed")),
-     500),
+     lambda u: bool(u.all_tasks_completed),
+     500, ("all_tasks_completed",)),
 
     # --- Daily Streaks ---
     ("3 дні підряд", "🔥",
      "Виконуй завдання 3 дні поспіль. (+5 балів)",
-     lambda user_id: (get_user_field(user_id, "streak_days") or 0) >= 3,
-     5),
+     lambda u: (u.streak_days or 0) >= 3,
+     5, ("streak_days",)),
 
     ("7 днів підряд", "⚡",
      "Виконуй завдання 7 днів поспіль. (+10 балів)",
-     lambda user_id: (get_user_field(user_id, "streak_days") or 0) >= 7,
-     10),
+     lambda u: (u.streak_days or 0) >= 7,
+     10, ("streak_days",)),
 
     ("14 днів підряд", "🚀",
      "Виконуй завдання 14 днів поспіль. (+20 балів)",
-     lambda user_id: (get_user_field(user_id, "streak_days") or 0) >= 14,
-     20),
+     lambda u: (u.streak_days or 0) >= 14,
+     20, ("streak_days",)),
 
     ("1 місяць підряд", "🏅",
      "Виконуй завдання щодня протягом 30 днів. (+50 балів)",
-     lambda user_id: (get_user_field(user_id, "streak_days") or 0) >= 30,
-     50),
+     lambda u: (u.streak_days or 0) >= 30,
+     50, ("streak_days",)),
     # Add potential secret badges here without clear descriptions if desired
 ]
 
+# Unlocks badges as soon as the relevant score/streak/feedback/completion event is committed
+badge_engine = BadgeEngine(BADGES_LIST)
+db.subscribe(badge_engine.on_event)
 
+
+@timed
 async def show_badges(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Checks for new badges, unlocks them, and displays all user badges."""
     user_id = update.effective_user.id
@@ -76,26 +84,19 @@ async def show_badges(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['user_last_menu'] = "badges" # For 'Back' button logic
 
         logger.info(f"User {user_id}: Checking for new badges...")
-        current_badges = set(get_user_badges(user_id))
-        got_new = False
-        new_badges_msgs = []
-
-        # --- Check and Unlock New Badges ---
-        for name, emoji, descr, condition, reward in BADGES_LIST:
-            # Check condition only if the badge isn't already unlocked
-            if name not in current_badges:
-                try:
-                    if condition(user_id):
-                        # Attempt to unlock the badge
-                        if unlock_badge(user_id, name, reward):
-                            got_new = True
-                            # Format message for newly unlocked badge
-                            new_badges_msgs.append(f"{emoji} <b>{name}</b> — відкрито! (+{reward} балів)")
-                            current_badges.add(name) # Update current set immediately
-                            logger.info(f"User {user_id}: Unlocked badge '{name}'.")
-                except Exception as cond_err:
-                    # Log error if condition check fails for some reason
-                    logger.error(f"Error checking condition for badge '{name}' for user {user_id}: {cond_err}", exc_info=True)
+        snapshot = await load_user_snapshot(update, context)
+        # Events unlock badges in the background; this only catches progress made before the engine ran
+        if snapshot:
+            await run_sync(badge_engine.evaluate, user_id, snapshot)
+        rewards = {name: (emoji, reward) for name, emoji, _descr, _cond, reward, _fields in BADGES_LIST}
+        new_badges_msgs = [
+            f"{rewards[name][0]} <b>{name}</b> — відкрито! (+{rewards[name][1]} балів)"
+            for name in badge_engine.pop_unseen(user_id) if name in rewards
+        ]
+        got_new = bool(new_badges_msgs)
+        if got_new:
+            invalidate_user_snapshot(context) # Rewards changed the score
+        current_badges = await run_sync(badge_engine.badges_of, user_id)
         # --- End Badge Check ---
 
         logger.info(f"User {user_id}: Formatting badge display message...")
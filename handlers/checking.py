@@ -0,0 +1,260 @@
+import os
+import re
+import logging
+import functools
+from fractions import Fraction
+
+# --- Logging Setup ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- End Logging Setup ---
+
+# How many distinct (task_type, answer) matchers stay compiled
+CHECK_CACHE_SIZE = int(os.getenv("CHECK_CACHE_SIZE", "20000"))
+# A user's decimal needs at least this many digits after the point to count as rounded ("0.33" for 1/3)
+CHECK_MIN_ROUNDED_DIGITS = int(os.getenv("CHECK_MIN_ROUNDED_DIGITS", "2"))
+
+# Latin letters that look like Cyrillic ones ("B" typed instead of "В" for test options)
+_LOOKALIKES = str.maketrans("abcehkmoptxyi", "авсенкмортхуі")
+_DASHES = str.maketrans({"−": "-", "–": "-", "—": "-", "＋": "+", "·": "*", "×": "*", "÷": "/"})
+_SPACES = re.compile(r"\s+")
+# Separators between several answers. A comma between two digits is a decimal comma ("0,5").
+_SMART_SPLIT = re.compile(r";|,(?!\d)|(?<!\d),")
+_PLAIN_SPLIT = re.compile(r"[;,]")
+_NUMBER = re.compile(r"[+-]?(\d+([.,]\d*)?|[.,]\d+)(/[+-]?\d+([.,]\d*)?)?")
+# "1-А", "1А", "1:А", "1)А" in matching tasks
+_PAIR = re.compile(r"^(\d+)\s*[-:).=]?\s*(\D.*)$")
+# Marks an expected answer the task author rounded ("≈1.41"): anything that rounds to it is accepted
+APPROX_MARK = "≈"
+
+
+class CheckResult:
+    __slots__ = ("is_correct", "match_correct")
+
+    def __init__(self, is_correct, match_correct=0):
+        self.is_correct = is_correct
+        self.match_correct = match_correct
+
+    def __repr__(self):
+        return f"CheckResult(is_correct={self.is_correct}, match_correct={self.match_correct})"
+
+
+# -----------------------------
+# Normalisation
+# -----------------------------
+class Token:
+    """One normalised answer: text for comparison; the numeric value is parsed only when needed."""
+    __slots__ = ("raw", "text", "approx", "_value", "_decimals")
+
+    _UNPARSED = object()
+
+    def __init__(self, raw):
+        raw = _SPACES.sub("", str(raw).translate(_DASHES))
+        self.approx = raw.startswith(APPROX_MARK)
+        self.raw = raw[len(APPROX_MARK):] if self.approx else raw
+        self.text = self.raw.casefold().translate(_LOOKALIKES)
+        self._value = Token._UNPARSED
+        self._decimals = 0
+
+    def _parse(self):
+        self._value = None
+        if not _NUMBER.fullmatch(self.raw):
+            return
+        number = self.raw.replace(",", ".")
+        try:
+            self._value = Fraction(number)
+        except (ValueError, ZeroDivisionError):
+            return
+        if "/" not in number and "." in number:
+            self._decimals = len(number.split(".", 1)[1])
+
+    @property
+    def value(self):
+        """Exact value as a Fraction, or None if the answer is not a number."""
+        if self._value is Token._UNPARSED:
+            self._parse()
+        return self._value
+
+    @property
+    def decimals(self):
+        """Digits written after the decimal point (0 for integers and fractions)."""
+        if self._value is Token._UNPARSED:
+            self._parse()
+        return self._decimals
+
+    def __repr__(self):
+        return f"Token({self.text!r}, value={self.value}, decimals={self.decimals})"
+
+
+def _terminates(value):
+    """True if the fraction has a finite decimal expansion (denominator 2^a * 5^b)."""
+    d = value.denominator
+    for p in (2, 5):
+        while d % p == 0:
+            d //= p
+    return d == 1
+
+
+def _rounding_tolerance(decimals):
+    return Fraction(1, 2 * 10 ** decimals)
+
+
+def tokens_equal(expected, given):
+    if expected.text == given.text:
+        return True
+    if expected.value is not None and given.value is not None:
+        if expected.value == given.value:
+            return True
+        # The task author marked the answer as rounded: accept any value that rounds to it
+        if expected.approx:
+            return abs(expected.value - given.value) <= _rounding_tolerance(expected.decimals)
+        # The user rounded a value that has no finite decimal form (1/3 -> 0.33)
+        if not _terminates(expected.value) and given.decimals >= CHECK_MIN_ROUNDED_DIGITS:
+            return abs(expected.value - given.value) <= _rounding_tolerance(given.decimals)
+    return False
+
+
+def split_answers(text):
+    """Candidate tokenisations of the user's text: decimal-comma aware first, then a plain split."""
+    text = text or ""
+    if "," not in text and ";" not in text:
+        yield [text.strip()] if text.strip() else []
+        return
+    smart = [p for p in (s.strip() for s in _SMART_SPLIT.split(text)) if p]
+    yield smart
+    plain = [p for p in (s.strip() for s in _PLAIN_SPLIT.split(text)) if p]
+    if plain != smart:
+        yield plain
+
+
+# -----------------------------
+# Matchers
+# -----------------------------
+_CHECKERS = {}
+
+def register_checker(*task_types):
+    """Class decorator: the matcher class used for these task types."""
+    def decorator(cls):
+        for task_type in task_types:
+            _CHECKERS[task_type] = cls
+        return cls
+    return decorator
+
+
+class Matcher:
+    """Compiled expected answer of one task. Subclasses implement _check(list of Tokens)."""
+
+    def __init__(self, answers):
+        self.expected = [Token(a) for a in answers]
+        for token in self.expected:
+            token.value     # parse once, at compile time
+
+    def check(self, text):
+        best = None
+        for parts in split_answers(text):
+            result = self._check([Token(p) for p in parts])
+            if result.is_correct:
+                return result
+            if best is None or result.match_correct > best.match_correct:
+                best = result
+        return best or CheckResult(False)
+
+    def _check(self, given):
+        raise NotImplementedError
+
+
+@register_checker("single", "open", "boss", "light", None)
+class UnorderedMatcher(Matcher):
+    """All expected answers, in any order, each matched by exactly one given answer, nothing extra."""
+
+    def __init__(self, answers):
+        super().__init__(answers)
+        self._texts = sorted(t.text for t in self.expected)
+
+    def _check(self, given):
+        if len(given) != len(self.expected):
+            return CheckResult(False)
+        # Fast path: the same normalised texts, no number parsing
+        if sorted(t.text for t in given) == self._texts:
+            return CheckResult(True)
+        left = list(given)
+        for expected in self.expected:
+            for i, candidate in enumerate(left):
+                if tokens_equal(expected, candidate):
+                    del left[i]
+                    break
+            else:
+                return CheckResult(False)
+        return CheckResult(True)
+
+
+@register_checker("match")
+class MatchMatcher(Matcher):
+    """
+    Matching tasks ("1-Б, 2-А, 3-Г"), scored per correct pair.
+    Pairs written with their number are compared by number in any order,
+    bare answers ("Б, А, Г" or "БАГ") by position.
+    """
+
+    def __init__(self, answers):
+        super().__init__(answers)
+        pairs = [_PAIR.match(t.text) for t in self.expected]
+        self.labelled = bool(pairs) and all(pairs)
+        self.by_label = {m.group(1): Token(m.group(2)) for m in pairs} if self.labelled else {}
+
+    def _values(self, given):
+        """Given tokens as {label: Token} when labelled, else as a positional list."""
+        if (len(given) == 1 and len(self.expected) > 1 and len(given[0].text) == len(self.expected)
+                and not _PAIR.match(given[0].text)):
+            # "БАГ" typed without separators (a single labelled pair like "1-Б" is not split)
+            given = [Token(ch) for ch in given[0].text]
+        if not self.labelled:
+            return given
+        values = {}
+        for position, token in enumerate(given, start=1):
+            m = _PAIR.match(token.text)
+            values[m.group(1) if m else str(position)] = Token(m.group(2)) if m else token
+        return values
+
+    def _check(self, given):
+        values = self._values(given)
+        if self.labelled:
+            correct = sum(
+                1 for label, expected in self.by_label.items()
+                if label in values and tokens_equal(expected, values[label])
+            )
+            extra = len(values) - len(self.by_label)
+        else:
+            correct = sum(1 for e, g in zip(self.expected, values) if tokens_equal(e, g))
+            extra = len(values) - len(self.expected)
+        return CheckResult(correct == len(self.expected) and extra <= 0, correct)
+
+
+@functools.lru_cache(maxsize=CHECK_CACHE_SIZE)
+def _compile(task_type, answers):
+    return _CHECKERS.get(task_type, UnorderedMatcher)(answers)
+
+
+def matcher_for(task):
+    """The task's compiled matcher; cached by (task_type, answers), so an edited answer gets a new one."""
+    answers = task.get("answer") or []
+    if not isinstance(answers, (list, tuple)):
+        answers = [answers]
+    try:
+        return _compile(task.get("task_type"), tuple(answers))
+    except TypeError:
+        # Unhashable answer items (nested JSON): compile without caching
+        return _CHECKERS.get(task.get("task_type"), UnorderedMatcher)([str(a) for a in answers])
+
+
+def check_answer(task, text):
+    try:
+        return matcher_for(task).check(text)
+    except Exception as e:
+        logger.error(f"Task {task.get('id')}: answer check failed: {e}", exc_info=True)
+        return CheckResult(False)
+
+
+def cache_info():
+    return _compile.cache_info()
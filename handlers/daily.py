@@ -2,15 +2,18 @@ import datetime
 import logging # <-- Додаємо logging
 from telegram import ReplyKeyboardMarkup, KeyboardButton, Update
 from telegram.ext import ContextTypes
+from metrics import timed
 
 # Імпорти з db
-from db import get_user_field, update_user, get_random_task
+from db_async import update_user, get_random_task
+from handlers.snapshot import load_user_snapshot
 
 # Налаштування логера
 logger = logging.getLogger(__name__)
 if not logger.hasHandlers():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+@timed
 async def handle_daily_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the '/daily' command or 'Щоденна задача' button."""
     user_id = update.effective_user.id
@@ -18,7 +21,8 @@ async def handle_daily_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         today_str = str(datetime.date.today())
-        last_daily_str = get_user_field(user_id, "last_daily")
+        snapshot = await load_user_snapshot(update, context)
+        last_daily_str = snapshot.last_daily if snapshot else None
 
         # --- Check if already received today ---
         if last_daily_str == today_str:
@@ -32,12 +36,12 @@ async def handle_daily_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # --- Get a random daily task ---
         logger.info(f"User {user_id}: Fetching a new daily task...")
         # Make sure user_id is passed if you want to exclude completed tasks
-        task = get_random_task(user_id=None, is_daily=1) # Or pass user_id if needed
+        task = await get_random_task(user_id=None, is_daily=1) # Or pass user_id if needed
 
         if task:
             logger.info(f"User {user_id}: Daily task ID {task.get('id')} found.")
             # Update last_daily date in DB
-            update_user(user_id, "last_daily", today_str)
+            await update_user(user_id, "last_daily", today_str)
 
             # --- Set up solving state for the daily task ---
             context.user_data['solving_state'] = {
@@ -0,0 +1,204 @@
+import os
+import time
+import logging
+import threading
+import collections
+
+import db
+from db_async import (
+    get_level_by_score,
+    get_user_snapshot,
+    get_user_badges,
+    get_task_level_totals,
+    get_user_level_done,
+    get_all_topics_by_category,
+    catalogue_version,
+)
+from handlers.utils import CATEGORIES, LEVELS, create_progress_bar
+from handlers.badges import BADGES_LIST
+
+# --- Logging Setup ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- End Logging Setup ---
+
+# How many users keep a rendered progress report in memory (LRU)
+PROGRESS_CACHE_SIZE = int(os.getenv("PROGRESS_CACHE_SIZE", "10000"))
+# Events only come from this process; with several replicas an entry is reloaded after this many seconds
+PROGRESS_CACHE_TTL = float(os.getenv("PROGRESS_CACHE_TTL", "300"))
+
+LEVEL_EMOJI = {"легкий": "🟢", "середній": "🟡", "важкий": "🔴"}
+BADGE_EMOJI = {name: emoji for name, emoji, *_ in BADGES_LIST}
+
+
+class _Entry:
+    __slots__ = ("version", "loaded_at", "done", "text", "stamp")
+
+    def __init__(self, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.done = None      # {(topic, level): n} — loaded once, then kept up to date by task_completed events
+        self.text = None      # rendered report; None when something shown in it changed
+        self.stamp = 0        # bumped by every event, so a render racing with an event is not cached
+
+
+class ProgressViews:
+    """
+    Renders the "📊 Мій прогрес" report from cached structures.
+
+    - The layout (categories -> topics -> levels with totals) is built once per catalogue version.
+    - Per-user done counts are loaded once and then incremented by task_completed events.
+    - The rendered text is reused until the user's completions, score, badges or streak change.
+    Events arrive from db threads, hence the lock.
+    """
+
+    def __init__(self, max_users=PROGRESS_CACHE_SIZE, ttl=PROGRESS_CACHE_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._layout = None   # (catalogue version, layout, any topics at all)
+        self.hits = 0
+        self.misses = 0
+
+    # -----------------------------
+    # Events
+    # -----------------------------
+    def on_event(self, event, payload):
+        user_id = payload.get("user_id")
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            entry.stamp += 1
+            entry.text = None
+            if event == "task_completed" and entry.done is not None and payload.get("topic") is not None:
+                key = (payload["topic"], payload["level"])
+                entry.done[key] = entry.done.get(key, 0) + 1
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    # -----------------------------
+    # Layout
+    # -----------------------------
+    async def _get_layout(self):
+        totals = await get_task_level_totals()
+        version = catalogue_version()
+        cached = self._layout
+        if cached is not None and cached[0] == version:
+            return cached
+
+        layout = []
+        any_topics = False
+        for category in CATEGORIES:
+            topics = []
+            category_topics = await get_all_topics_by_category(category)
+            any_topics = any_topics or bool(category_topics)
+            for topic in sorted(category_topics):
+                levels = [(lvl, totals[(topic, lvl)]) for lvl in sorted(LEVELS) if totals.get((topic, lvl), 0) > 0]
+                if levels:
+                    topics.append((topic, levels))
+            layout.append((category, topics))
+        self._layout = (version, layout, any_topics)
+        return self._layout
+
+    # -----------------------------
+    # Rendering
+    # -----------------------------
+    @staticmethod
+    def _render(layout, any_topics, done, snapshot, badges):
+        score = (snapshot.score if snapshot else 0) or 0
+        streak = (snapshot.streak_days if snapshot else 0) or 0
+        parts = [
+            "📊 <b>Мій Прогрес та Статистика</b>\n\n"
+            f"⭐ <b>Загальний рахунок:</b> <code>{score}</code> балів\n"
+            f"🏅 <b>Твій рівень:</b> {get_level_by_score(score)}\n\n"
+            f"🔥 <b>Серія днів підряд:</b> <code>{streak}</code>\n"
+            f"🏆 <b>Відкрито бейджів:</b> <code>{len(badges)}</code>\n\n"
+            "📚 <b>Прогрес по Темах:</b>\n"
+            "--------------------\n"
+        ]
+
+        has_progress_data = False
+        for category, topics in layout:
+            if not topics:
+                parts.append(f"\n📁 <b>{category}:</b>\n  <i>(Поки що немає прогресу)</i>\n")
+                continue
+            has_progress_data = True
+            parts.append(f"\n📁 <b>{category}:</b>\n")
+            for topic, levels in topics:
+                lines = [
+                    f"   {LEVEL_EMOJI.get(lvl, '❓')} {lvl.capitalize()}: "
+                    f"{create_progress_bar(done.get((topic, lvl), 0), total, length=8)}"
+                    for lvl, total in levels
+                ]
+                parts.append(f"  📖 <i>{topic}:</i>\n" + "\n".join(lines) + "\n")
+
+        if not has_progress_data and not any_topics:
+            parts.append("\n<i>Розпочни розв'язувати задачі, щоб побачити свій прогрес тут!</i>\n")
+        elif not has_progress_data:
+            parts.append("\n<i>Поки що немає прогресу по жодній темі. Вперед до знань!</i> 💪\n")
+
+        parts.append("\n--------------------\n🏅 <b>Твої Досягнення (Бейджі):</b>\n")
+        if badges:
+            parts.append("\n".join(f"  {BADGE_EMOJI.get(b, '🏆')} {b}" for b in badges) + "\n")
+        else:
+            parts.append("<i>Поки що немає відкритих бейджів. Виконуй завдання, щоб їх отримати!</i>\n")
+        return "".join(parts)
+
+    async def render(self, user_id, load_snapshot=None):
+        """
+        Returns the progress report HTML for user_id.
+        load_snapshot: coroutine function returning the user's UserSnapshot; only awaited on a cache miss.
+        """
+        version, layout, any_topics = await self._get_layout()
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and (entry.version != version or time.monotonic() - entry.loaded_at > self.ttl):
+                # Catalogue changed (deleted/moved tasks change done counts too) or the entry is too old
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                if entry.text is not None:
+                    self.hits += 1
+                    return entry.text
+            else:
+                entry = self._entries[user_id] = _Entry(version)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+            self.misses += 1
+            stamp = entry.stamp
+            done = dict(entry.done) if entry.done is not None else None
+
+        loaded = done is None
+        if loaded:
+            done = await get_user_level_done(user_id)
+        snapshot = await load_snapshot() if load_snapshot else await get_user_snapshot(user_id)
+        badges = await get_user_badges(user_id)
+        text = self._render(layout, any_topics, done, snapshot, badges)
+
+        with self._lock:
+            if self._entries.get(user_id) is entry:
+                if entry.stamp == stamp:
+                    if loaded:
+                        entry.done = done
+                    entry.text = text
+                elif loaded:
+                    # A completion landed while loading: the counts may or may not include it
+                    del self._entries[user_id]
+        return text
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+progress_views = ProgressViews()
+db.subscribe(progress_views.on_event)
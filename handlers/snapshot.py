@@ -0,0 +1,21 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from db_async import get_user_snapshot
+
+
+async def load_user_snapshot(update: Update, context: ContextTypes.DEFAULT_TYPE, refresh=False):
+    """
+    Returns the UserSnapshot of the current user, loaded at most once per update.
+    The CallbackContext lives for exactly one update, so it is used as the memo.
+    """
+    snapshot = getattr(context, "_user_snapshot", None)
+    if snapshot is None or refresh:
+        snapshot = await get_user_snapshot(update.effective_user.id)
+        context._user_snapshot = snapshot
+    return snapshot
+
+
+def invalidate_user_snapshot(context: ContextTypes.DEFAULT_TYPE):
+    """Call after writing to the users row within the same update."""
+    context._user_snapshot = None
@@ -1,14 +1,16 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from db import create_or_get_user
+from metrics import timed
+from db_async import create_or_get_user
 from handlers.utils import build_main_menu
 
 
+@timed
 async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробник команди /start — створює користувача і показує головне меню."""
     user_id = update.effective_user.id
     # Переконайся, що користувач створений або отриманий перед показом меню
-    user = create_or_get_user(user_id) 
+    user = await create_or_get_user(user_id) 
 
     greeting_text = (
         "👋 <b>Привіт! Вітаю у «МехМатику»!</b> 🤖\n"
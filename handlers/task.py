@@ -2,6 +2,7 @@ import random
 import logging
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from metrics import timed
 from telegram.constants import ParseMode
 
 # --- Imports from other handlers ---
@@ -10,6 +11,9 @@ from handlers.daily import handle_daily_task
 from handlers.badges import show_badges, BADGES_LIST
 from handlers.materials import MATERIALS
 from handlers.scoring import calc_points
+from handlers.checking import check_answer
+from handlers.snapshot import load_user_snapshot, invalidate_user_snapshot
+from activity import activity_tracker
 from handlers.utils import (
     build_main_menu,
     build_category_keyboard,
@@ -20,24 +24,21 @@ from handlers.utils import (
 )
 
 # --- Database Imports ---
-from db import (
+from db_async import (
     get_all_topics,
     get_all_tasks_by_topic,
-    get_user_field,
     get_random_task,
     update_user,
     all_tasks_completed,
-    mark_task_completed,
-    add_score,
     add_feedback,
     get_available_levels_for_topic,
     get_all_topics_by_category,
     get_completed_task_ids,
-    update_streak_and_reward,
     get_user_completed_count,
-    get_topic_streak, set_topic_streak, inc_topic_streak, reset_topic_streak,
+    get_topic_streak, set_topic_streak,
     has_topic_streak_award, mark_topic_streak_award,
-    get_task_by_id
+    get_task_by_id,
+    record_answer,
 )
 
 logger = logging.getLogger(__name__)
@@ -68,6 +69,7 @@ def build_level_keyboard(levels):
 
 # --- Helper Functions (Defined FIRST) ---
 
+@timed
 async def handle_registration_step(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text
@@ -82,7 +84,7 @@ async def handle_registration_step(update: Update, context: ContextTypes.DEFAULT
         if not (2 <= len(text.strip()) <= 20):
             await update.message.reply_text("Імʼя повинно бути від 2 до 20 символів.")
             return
-        update_user(user_id, "display_name", text.strip())
+        await update_user(user_id, "display_name", text.strip())
         state["step"] = "city"
         await update.message.reply_text("✅ Чудово! Тепер вкажіть ваше місто:", reply_markup=ReplyKeyboardMarkup([[KeyboardButton("❌ Скасувати")]], resize_keyboard=True))
 
@@ -90,7 +92,7 @@ async def handle_registration_step(update: Update, context: ContextTypes.DEFAULT
         if not (2 <= len(text.strip()) <= 30):
              await update.message.reply_text("Назва міста має бути від 2 до 30 символів.")
              return
-        update_user(user_id, "city", text.strip())
+        await update_user(user_id, "city", text.strip())
         state["step"] = "phone"
         kb = ReplyKeyboardMarkup([[KeyboardButton("📱 Поділитись контактом", request_contact=True)], [KeyboardButton("❌ Скасувати")]], resize_keyboard=True, one_time_keyboard=True)
         await update.message.reply_text("✅ Майже готово! Поділіться контактом або введіть номер:", reply_markup=kb)
@@ -99,11 +101,13 @@ async def handle_registration_step(update: Update, context: ContextTypes.DEFAULT
         if not (text.strip().startswith('+') and len(text.strip()) >= 10 and text.strip()[1:].isdigit()):
              await update.message.reply_text("Некоректний формат (+380...).")
              return
-        update_user(user_id, "phone_number", text.strip())
+        await update_user(user_id, "phone_number", text.strip())
+        invalidate_user_snapshot(context)
         context.user_data.pop('registration_state', None)
         await update.message.reply_text("🎉 <b>Дякуємо за реєстрацію!</b>", parse_mode=ParseMode.HTML, reply_markup=ReplyKeyboardRemove())
         await show_rating(update, context)
 
+@timed
 async def handle_change_name_step(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text
@@ -114,11 +118,13 @@ async def handle_change_name_step(update: Update, context: ContextTypes.DEFAULT_
     if not (2 <= len(text.strip()) <= 20):
         await update.message.reply_text("Імʼя: 2-20 символів.")
         return
-    update_user(user_id, "display_name", text.strip())
+    await update_user(user_id, "display_name", text.strip())
+    invalidate_user_snapshot(context)
     context.user_data.pop('change_name_state', None)
     await update.message.reply_text(f"✅ Імʼя оновлено: <b>{text.strip()}</b>", parse_mode=ParseMode.HTML)
     await show_rating(update, context)
 
+@timed
 async def handle_feedback_step(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text
@@ -126,16 +132,18 @@ async def handle_feedback_step(update: Update, context: ContextTypes.DEFAULT_TYP
         context.user_data.pop('feedback_state', None)
         await update.message.reply_text("Скасовано.", reply_markup=build_main_menu(user_id))
         return
-    add_feedback(user_id, update.effective_user.username or f"id_{user_id}", text)
+    await add_feedback(user_id, update.effective_user.username or f"id_{user_id}", text)
     context.user_data.pop('feedback_state', None)
     await update.message.reply_text("✅ Дякуємо! Ваше повідомлення відправлено.", reply_markup=build_main_menu(user_id))
 
+@timed
 async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     if context.user_data.get('registration_state') and context.user_data['registration_state'].get("step") == "phone":
         phone = update.message.contact.phone_number
         if not phone.startswith('+'): phone = '+' + phone
-        update_user(user_id, "phone_number", phone)
+        await update_user(user_id, "phone_number", phone)
+        invalidate_user_snapshot(context)
         context.user_data.pop('registration_state', None)
         await update.message.reply_text("🎉 <b>Дякуємо за реєстрацію!</b>", parse_mode=ParseMode.HTML, reply_markup=ReplyKeyboardRemove())
         await show_rating(update, context)
@@ -144,10 +152,12 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # --- Task Logic ---
 
+@timed
 async def task_entrypoint(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("📁 Оберіть категорію (Алгебра чи Геометрія):", reply_markup=build_category_keyboard())
     context.user_data['start_task_state'] = {"step": "category"}
 
+@timed
 async def handle_task_step(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text
@@ -164,7 +174,7 @@ async def handle_task_step(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         if state["step"] == "category" and text in CATEGORIES:
             state["category"] = text
-            topics = get_all_topics_by_category(text)
+            topics = await get_all_topics_by_category(text)
             if not topics:
                 await update.message.reply_text(f"📂 У категорії '{text}' поки що немає тем.", reply_markup=build_back_to_menu_keyboard())
                 return
@@ -177,34 +187,36 @@ async def handle_task_step(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("📁 Оберіть категорію:", reply_markup=build_category_keyboard())
             return
 
-        current_topics = get_all_topics_by_category(category) if category else get_all_topics()
+        current_topics = await get_all_topics_by_category(category) if category else await get_all_topics()
         if state["step"] == "topic" and text in current_topics:
-            tasks_in_topic = get_all_tasks_by_topic(text)
+            tasks_in_topic = await get_all_tasks_by_topic(text)
             available_levels = {t["level"] for t in tasks_in_topic if t.get("level")}
             state["available_levels"] = sorted(list(available_levels))
             if not available_levels:
                 await update.message.reply_text("❌ Немає задач у цій темі.", reply_markup=build_topics_keyboard(current_topics + ["↩️ Назад"]))
                 return
-            update_user(user_id, "topic", text)
+            await update_user(user_id, "topic", text)
+            invalidate_user_snapshot(context)
             state["step"] = "level"
             await update.message.reply_text(f"✅ Тема <b>{text}</b>! Оберіть рівень:", reply_markup=build_level_keyboard(state["available_levels"]), parse_mode=ParseMode.HTML)
             return
 
         if state["step"] == "level" and text == "↩️ Назад до тем":
             state["step"] = "topic"
-            topics = get_all_topics_by_category(category) if category else get_all_topics()
+            topics = await get_all_topics_by_category(category) if category else await get_all_topics()
             await update.message.reply_text("📖 Оберіть тему:", reply_markup=build_topics_keyboard(topics + ["↩️ Назад"]))
             return
 
         elif state["step"] == "level" and text in LEVELS:
-            topic = get_user_field(user_id, "topic")
-            all_tasks = get_all_tasks_by_topic(topic)
+            snapshot = await load_user_snapshot(update, context)
+            topic = snapshot.topic if snapshot else None
+            all_tasks = await get_all_tasks_by_topic(topic)
             level_tasks = [t for t in all_tasks if t.get("level") == text]
             if not level_tasks:
                 await update.message.reply_text("🤷‍♂️ Задач цього рівня немає.", reply_markup=build_level_keyboard(state["available_levels"]))
                 return
             
-            completed_ids = set(get_completed_task_ids(user_id, topic, text))
+            completed_ids = set(await get_completed_task_ids(user_id, topic, text))
             uncompleted = [t for t in level_tasks if t["id"] not in completed_ids]
             to_solve = uncompleted if uncompleted else level_tasks
             is_repeat = not uncompleted
@@ -220,6 +232,7 @@ async def handle_task_step(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await send_next_task(update, context, user_id)
             return
 
+@timed
 async def send_next_task(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id):
     if 'solving_state' not in context.user_data: return
     state = context.user_data['solving_state']
@@ -231,7 +244,7 @@ async def send_next_task(update: Update, context: ContextTypes.DEFAULT_TYPE, use
         return
 
     try:
-        task = get_task_by_id(state["task_ids"][idx])
+        task = await get_task_by_id(state["task_ids"][idx])
     except Exception:
         await update.message.reply_text("Помилка БД.", reply_markup=build_main_menu(user_id))
         context.user_data.pop('solving_state', None)
@@ -251,7 +264,7 @@ async def send_next_task(update: Update, context: ContextTypes.DEFAULT_TYPE, use
     streak_info = ""
     
     if not state.get("is_daily") and not already_done:
-        s = get_topic_streak(user_id, state.get("topic"))
+        s = await get_topic_streak(user_id, state.get("topic"))
         if s > 0: streak_info = f"🔥 Стрік: {s}"
     if already_done: streak_info = "🔁 Повтор (без балів)"
 
@@ -267,6 +280,7 @@ async def send_next_task(update: Update, context: ContextTypes.DEFAULT_TYPE, use
         await update.message.reply_text("Помилка відправки.", reply_markup=build_main_menu(user_id))
         context.user_data.pop('solving_state', None)
 
+@timed
 async def handle_task_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text
@@ -282,18 +296,11 @@ async def handle_task_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     explanation = task.get("explanation", "Пояснення відсутнє.")
-    user_ans = [a.strip() for a in text.replace(';', ',').split(',') if a.strip()]
     correct_ans = [str(a).strip() for a in task.get("answer", [])]
-    
-    is_correct = False
-    match_correct = 0
-    try:
-        if task.get("task_type") == "match":
-            match_correct = len(set(user_ans) & set(correct_ans))
-            is_correct = (match_correct == len(correct_ans) and len(user_ans) == len(correct_ans))
-        else:
-            is_correct = (set(user_ans) == set(correct_ans))
-    except Exception: pass
+
+    # Normalised comparison with a matcher compiled once per task answer (handlers/checking.py)
+    result = check_answer(task, text)
+    is_correct, match_correct = result.is_correct, result.match_correct
 
     already = task["id"] in state.get("completed_ids", set())
     is_daily = state.get("is_daily", False)
@@ -301,7 +308,14 @@ async def handle_task_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     if not already:
         delta = calc_points(task, is_correct=is_correct, match_correct=match_correct)
-        if delta > 0: add_score(user_id, delta)
+
+    # Score, completion, topic streak and daily streak — one transaction
+    outcome = await record_answer(
+        user_id, task, is_correct=is_correct, points=delta,
+        topic=state.get("topic"), is_daily=is_daily, already_done=already,
+    )
+    if outcome["newly_completed"]:
+        state.setdefault("completed_ids", set()).add(task["id"])
 
     msg = "✅ <b>Правильно!</b>" if is_correct else "❌ <b>Неправильно.</b>"
     if not is_correct: msg += f"\nПравильна: <code>{', '.join(correct_ans)}</code>"
@@ -315,21 +329,13 @@ async def handle_task_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
     try: await context.bot.send_sticker(user_id, sticker)
     except: pass
 
-    if mark_task_completed(user_id, task["id"]):
-        state.get("completed_ids", set()).add(task["id"])
-
     # Topic Streaks
-    if is_correct and not already and not is_daily:
-        topic = state.get("topic")
-        s = inc_topic_streak(user_id, topic)
-        if s in [5, 10, 15, 20]:
-             add_score(user_id, s)
-             await update.message.reply_text(f"🏅 Стрік {s} у темі «{topic}»! +{s} балів")
-    elif not is_correct and not already and not is_daily:
-        reset_topic_streak(user_id, state.get("topic"))
+    if outcome["topic_bonus"]:
+        s = outcome["topic_streak"]
+        await update.message.reply_text(f"🏅 Стрік {s} у темі «{state.get('topic')}»! +{s} балів")
 
     # Daily Streak
-    s, b = update_streak_and_reward(user_id)
+    s, b = outcome["daily_streak"], outcome["daily_reward"]
     if b > 0: await update.message.reply_text(f"🔥 Щоденний стрік: {s}! +{b} балів.")
 
     state["current"] += 1
@@ -348,13 +354,14 @@ async def handle_task_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("🎉 Щоденна задача завершена!", reply_markup=ReplyKeyboardMarkup([[KeyboardButton("↩️ Меню")]], resize_keyboard=True))
         else:
             kb = []
-            avl = get_available_levels_for_topic(topic, exclude_level=lvl)
+            avl = await get_available_levels_for_topic(topic, exclude_level=lvl)
             if avl: kb.append([KeyboardButton(l) for l in avl])
             kb.append([KeyboardButton("Змінити тему"), KeyboardButton("↩️ Меню")])
             
             txt = f"👍 Повтор завершено." if is_rep else f"🎉 Рівень «{lvl}» завершено!"
             await update.message.reply_text(txt, reply_markup=ReplyKeyboardMarkup(kb, resize_keyboard=True))
 
+@timed
 async def handle_dont_know(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     if 'solving_state' not in context.user_data: return
@@ -367,11 +374,13 @@ async def handle_dont_know(update: Update, context: ContextTypes.DEFAULT_TYPE):
     expl = task.get("explanation", "")
     await update.message.reply_text(f"🤔 Правильна: <code>{ans}</code>\n\n📖 {expl}", parse_mode=ParseMode.HTML)
 
-    if mark_task_completed(user_id, task["id"]):
-        state.get("completed_ids", set()).add(task["id"])
-
-    if not state.get("is_daily"):
-        reset_topic_streak(user_id, state.get("topic"))
+    # Completion + topic streak reset in one transaction
+    outcome = await record_answer(
+        user_id, task, is_correct=False, topic=state.get("topic"),
+        is_daily=state.get("is_daily", False), update_daily_streak=False,
+    )
+    if outcome["newly_completed"]:
+        state.setdefault("completed_ids", set()).add(task["id"])
 
     state["current"] += 1
     if state["current"] < state.get("total_tasks"):
@@ -386,15 +395,22 @@ async def handle_dont_know(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # --- Main Handler (Router) ---
+@timed
 async def main_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text or ""
 
     try:
-        update_streak_and_reward(user_id)
-        if update.effective_user.username:
-            update_user(user_id, "username", update.effective_user.username)
-    except: pass
+        # Write-behind: username/last_activity/streak are batched by activity.py
+        if activity_tracker.touch(user_id, update.effective_user.username):
+            # This message completes a daily-streak milestone: write it now to show the reward
+            await activity_tracker.flush_user(user_id)
+        streak, reward = activity_tracker.pop_reward(user_id)
+        if reward:
+            invalidate_user_snapshot(context)
+            await update.message.reply_text(f"🔥 Щоденний стрік: {streak}! +{reward} балів.")
+    except Exception as e:
+        logger.error(f"User {user_id}: activity tracking failed: {e}", exc_info=True)
 
     # State Dispatch
     if 'registration_state' in context.user_data: await handle_registration_step(update, context); return
@@ -436,7 +452,8 @@ async def main_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         btns = [[InlineKeyboardButton(m.get("title","Link"), url=m.get("url", "#"))] for m in MATERIALS]
         await update.message.reply_text("Матеріали:", reply_markup=InlineKeyboardMarkup(btns))
     elif text in LEVELS:
-         topic = get_user_field(user_id, "topic")
+         snapshot = await load_user_snapshot(update, context)
+         topic = snapshot.topic if snapshot else None
          if topic:
              context.user_data['start_task_state'] = {"step": "level", "topic": topic}
              await handle_task_step(update, context)
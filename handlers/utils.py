@@ -104,29 +104,40 @@ def build_back_to_menu_keyboard():
 
 # ---------- inline paginations ----------
 
-def build_tasks_pagination_inline_keyboard(page, has_prev, has_next, total_pages=None):
-    """Builds inline keyboard for task pagination (prev/next)."""
+def _cursor_data(prefix, page, cursor_id):
+    """Callback data carrying the keyset cursor: '<prefix>_<page>_<id>' (or '<prefix>_<page>')."""
+    return f"{prefix}_{page}" if cursor_id is None else f"{prefix}_{page}_{cursor_id}"
+
+def parse_pagination_data(data):
+    """'<action>_<page>[_<id>]' -> (page, cursor_id); cursor_id is None for buttons sent before keyset paging."""
+    fields = data.split("_")
+    if len(fields) >= 3 and fields[-2].isdigit() and fields[-1].isdigit():
+        return int(fields[-2]), int(fields[-1])
+    return (int(fields[-1]) if fields[-1].isdigit() else 0), None
+
+def build_tasks_pagination_inline_keyboard(page, has_prev, has_next, total_pages=None, first_id=None, last_id=None):
+    """Builds inline keyboard for task pagination (prev/next); first_id/last_id are the page's keyset cursors."""
     indicator = f"• {page + 1}" + (f"/{total_pages} •" if total_pages else " •")
     row = []
     if has_prev:
-        row.append(InlineKeyboardButton("⬅️", callback_data=f"prev_{page}"))
+        row.append(InlineKeyboardButton("⬅️", callback_data=_cursor_data("prev", page, first_id)))
     # Add a non-clickable indicator
     row.append(InlineKeyboardButton(indicator, callback_data="noop")) # "noop" = no operation
     if has_next:
-        row.append(InlineKeyboardButton("➡️", callback_data=f"next_{page}"))
+        row.append(InlineKeyboardButton("➡️", callback_data=_cursor_data("next", page, last_id)))
     # Add a "Back to Admin Menu" button maybe?
     # row.append(InlineKeyboardButton("↩️ Адмінка", callback_data="admin_menu"))
     return InlineKeyboardMarkup([row])
 
-def build_feedback_pagination_inline_keyboard(page, has_prev, has_next, total_pages=None):
-    """Builds inline keyboard for feedback pagination."""
+def build_feedback_pagination_inline_keyboard(page, has_prev, has_next, total_pages=None, first_id=None, last_id=None):
+    """Builds inline keyboard for feedback pagination; first_id/last_id are the page's keyset cursors."""
     indicator = f"• {page + 1}" + (f"/{total_pages} •" if total_pages else " •")
     row = []
     if has_prev:
-        row.append(InlineKeyboardButton("⬅️", callback_data=f"feedback_prev_{page}"))
+        row.append(InlineKeyboardButton("⬅️", callback_data=_cursor_data("feedback_prev", page, first_id)))
     row.append(InlineKeyboardButton(indicator, callback_data="noop"))
     if has_next:
-        row.append(InlineKeyboardButton("➡️", callback_data=f"feedback_next_{page}"))
+        row.append(InlineKeyboardButton("➡️", callback_data=_cursor_data("feedback_next", page, last_id)))
     return InlineKeyboardMarkup([row])
 
 # ---------- NEW HELPER FUNCTION ----------
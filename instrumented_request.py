@@ -0,0 +1,36 @@
+import time
+
+from telegram.request import BaseRequest
+
+import metrics
+
+
+class InstrumentedRequest(BaseRequest):
+    """Обгортка над будь-яким BaseRequest (HTTPXRequest, фейковий у bench/): час кожного методу Bot API."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    @property
+    def read_timeout(self):
+        return self.inner.read_timeout
+
+    async def initialize(self):
+        await self.inner.initialize()
+
+    async def shutdown(self):
+        await self.inner.shutdown()
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            status, payload = await self.inner.do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            metrics.telegram_api_errors.inc(endpoint)
+            raise
+        finally:
+            metrics.telegram_api_seconds.observe(time.perf_counter() - started, endpoint)
+        if status >= 400:
+            metrics.telegram_api_errors.inc(endpoint)
+        return status, payload
@@ -0,0 +1,275 @@
+import os
+import random
+import asyncio
+import threading
+import logging
+
+import db
+import db_async
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+# Як часто leaderboard повністю перечитується з БД (сек.). Події приходять лише
+# з цього процесу, тож при кількох репліках періодична перебудова підтягує чужі зміни.
+LEADERBOARD_REBUILD_INTERVAL = float(os.getenv("LEADERBOARD_REBUILD_INTERVAL", "3600"))
+
+
+# -----------------------------
+# Indexable skip list
+# -----------------------------
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # width[i] — на скільки позицій нижнього рівня «перестрибує» посилання next[i]
+        self.width = [1] * level
+
+
+class IndexableSkipList:
+    """
+    Відсортований набір унікальних ключів з доступом за позицією:
+    insert/remove/count_less/[i] — O(log n) в середньому.
+    """
+
+    MAX_LEVEL = 32
+
+    def __init__(self, rng=None):
+        self._rng = rng or random.Random()
+        self._head = _Node(None, self.MAX_LEVEL)
+        self._size = 0
+
+    @classmethod
+    def from_sorted(cls, keys, rng=None):
+        """Побудова з уже відсортованих унікальних ключів за O(n) — без пошуку місця для кожного."""
+        skiplist = cls(rng)
+        last = [skiplist._head] * cls.MAX_LEVEL
+        last_position = [0] * cls.MAX_LEVEL
+        position = 0
+        for key in keys:
+            position += 1
+            node = _Node(key, skiplist._random_level())
+            for lvl in range(len(node.next)):
+                last[lvl].next[lvl] = node
+                last[lvl].width[lvl] = position - last_position[lvl]
+                last[lvl] = node
+                last_position[lvl] = position
+        # Останній вузол кожного рівня «перестрибує» до позиції за кінцем списку
+        for lvl in range(cls.MAX_LEVEL):
+            last[lvl].width[lvl] = position + 1 - last_position[lvl]
+        skiplist._size = position
+        return skiplist
+
+    def __len__(self):
+        return self._size
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and self._rng.random() < 0.5:
+            level += 1
+        return level
+
+    def _find(self, key):
+        """Останній вузол з ключем < key на кожному рівні і позиції цих вузлів."""
+        chain = [None] * self.MAX_LEVEL
+        steps = [0] * self.MAX_LEVEL
+        node = self._head
+        position = 0
+        for lvl in reversed(range(self.MAX_LEVEL)):
+            while node.next[lvl] is not None and node.next[lvl].key < key:
+                position += node.width[lvl]
+                node = node.next[lvl]
+            chain[lvl] = node
+            steps[lvl] = position
+        return chain, steps
+
+    def insert(self, key):
+        chain, steps = self._find(key)
+        level = self._random_level()
+        new = _Node(key, level)
+        position = steps[0] + 1   # позиція нового вузла (1-based)
+        for lvl in range(level):
+            prev = chain[lvl]
+            new.next[lvl] = prev.next[lvl]
+            prev.next[lvl] = new
+            skipped = position - steps[lvl]   # від prev до new
+            new.width[lvl] = prev.width[lvl] - skipped + 1
+            prev.width[lvl] = skipped
+        for lvl in range(level, self.MAX_LEVEL):
+            chain[lvl].width[lvl] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._find(key)
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for lvl in range(len(target.next)):
+            prev = chain[lvl]
+            prev.width[lvl] += target.width[lvl] - 1
+            prev.next[lvl] = target.next[lvl]
+        for lvl in range(len(target.next), self.MAX_LEVEL):
+            chain[lvl].width[lvl] -= 1
+        self._size -= 1
+
+    def count_less(self, key):
+        """Кількість ключів, строго менших за key."""
+        _, steps = self._find(key)
+        return steps[0]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        node = self._head
+        remaining = index + 1
+        for lvl in reversed(range(self.MAX_LEVEL)):
+            while node.next[lvl] is not None and node.width[lvl] <= remaining:
+                remaining -= node.width[lvl]
+                node = node.next[lvl]
+        return node.key
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not None:
+            yield node.key
+            node = node.next[0]
+
+
+# -----------------------------
+# Leaderboard
+# -----------------------------
+class Leaderboard:
+    """
+    Рейтинг користувачів з балами (score > 0) у пам'яті.
+
+    Ключ у skip list — (-score, user_id): ітерація дає порядок «бали за спаданням».
+    Ранг рахується як у RANK() OVER (ORDER BY score DESC): 1 + кількість користувачів
+    зі строго більшими балами. Синхронізується подіями db.subscribe().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._list = IndexableSkipList()
+        self._scores = {}
+        self._names = {}
+        # Під час перебудови: зміни, що прийшли після читання з БД (повторюються на новому списку)
+        self._pending = None
+        self.ready = False
+
+    def rebuild(self, load):
+        """
+        load() -> [(user_id, score, display_name)]. Виконується в окремому потоці:
+        під _lock лише повтор змін, що надійшли під час читання, і заміна посилань.
+        Повертає False, якщо інша перебудова ще триває.
+        """
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                self._pending = []
+            try:
+                rows = load()
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            scores, names = {}, {}
+            for user_id, score, name in rows:
+                if score and score > 0:
+                    scores[user_id] = score
+                    names[user_id] = name
+            # Рядки вже йдуть у порядку ORDER BY score DESC, id — sort() на них лінійний
+            keys = [(-score, user_id) for user_id, score in scores.items()]
+            keys.sort()
+            fresh = IndexableSkipList.from_sorted(keys)
+            with self._lock:
+                for user_id, score, name in self._pending:
+                    self._apply(fresh, scores, names, user_id, score, name)
+                self._list, self._scores, self._names = fresh, scores, names
+                self._pending = None
+                self.ready = True
+        finally:
+            self._rebuild_lock.release()
+        logger.info(f"Leaderboard перебудовано: {len(scores)} користувачів з балами.")
+        return True
+
+    @staticmethod
+    def _apply(skiplist, scores, names, user_id, score, display_name):
+        old = scores.get(user_id)
+        if old != score:
+            if old is not None:
+                skiplist.remove((-old, user_id))
+                del scores[user_id]
+            if score and score > 0:
+                skiplist.insert((-score, user_id))
+                scores[user_id] = score
+        if user_id in scores:
+            names[user_id] = display_name
+        else:
+            names.pop(user_id, None)
+
+    def set_user(self, user_id, score, display_name):
+        with self._lock:
+            self._apply(self._list, self._scores, self._names, user_id, score, display_name)
+            if self._pending is not None:
+                self._pending.append((user_id, score, display_name))
+
+    def on_event(self, event, payload):
+        if event in ("score_changed", "name_changed"):
+            self.set_user(payload["user_id"], payload["score"], payload["display_name"])
+
+    def top(self, limit=10):
+        """[(user_id, score, display_name)] — як db.get_top_users."""
+        with self._lock:
+            result = []
+            for neg_score, user_id in self._list:
+                if len(result) >= limit:
+                    break
+                result.append((user_id, -neg_score, self._names.get(user_id)))
+            return result
+
+    def rank(self, user_id):
+        """(rank, score, total) — як db.get_user_rank; rank=None для користувачів без балів."""
+        with self._lock:
+            total = len(self._list)
+            score = self._scores.get(user_id)
+            if score is None:
+                return None, 0, total
+            # (-score, -1) менше за будь-який ключ з тими самими балами
+            return self._list.count_less((-score, -1)) + 1, score, total
+
+
+leaderboard = Leaderboard()
+db.subscribe(leaderboard.on_event)
+
+
+def rebuild_from_db():
+    return leaderboard.rebuild(db.get_ranked_users)
+
+
+async def rebuild_job(context):
+    # Читання і побудова списку — в окремому потоці, щоб не зупиняти обробку апдейтів
+    try:
+        await asyncio.to_thread(rebuild_from_db)
+    except Exception as e:
+        logger.error(f"Не вдалося перебудувати leaderboard: {e}", exc_info=True)
+
+
+async def get_top_users(limit=10):
+    if leaderboard.ready:
+        return leaderboard.top(limit)
+    return await db_async.get_top_users(limit)
+
+
+async def get_user_rank(user_id):
+    if leaderboard.ready:
+        return leaderboard.rank(user_id)
+    return await db_async.get_user_rank(user_id)
@@ -0,0 +1,292 @@
+import os
+import time
+import bisect
+import logging
+import functools
+import contextlib
+import threading
+import contextvars
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+# METRICS=0 вимикає збір (декоратори стають майже безкоштовними)
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+# Порт для Prometheus (/metrics); 0 — не запускати HTTP-сервер
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+# -----------------------------
+# Примітиви
+# -----------------------------
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size    # останній — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Гістограма з фіксованими бакетами і мітками; спостереження йдуть з event loop і з потоків БД."""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = _HistogramSeries(len(self.buckets) + 1)
+            series.counts[i] += 1
+            series.sum += value
+            series.count += 1
+
+    def snapshot(self):
+        """{label_values: (count, sum, [кумулятивні лічильники по бакетах, +Inf])}"""
+        with self._lock:
+            items = [(k, s.count, s.sum, list(s.counts)) for k, s in self._series.items()]
+        result = {}
+        for key, count, total, counts in items:
+            cumulative, acc = [], 0
+            for c in counts:
+                acc += c
+                cumulative.append(acc)
+            result[key] = (count, total, cumulative)
+        return result
+
+    def quantile(self, q, cumulative):
+        """Оцінка квантиля за бакетами (лінійна інтерполяція, як histogram_quantile у Prometheus)."""
+        total = cumulative[-1]
+        if not total:
+            return 0.0
+        rank = q * total
+        i = bisect.bisect_left(cumulative, rank)
+        if i >= len(self.buckets):
+            return self.buckets[-1]
+        lower = self.buckets[i - 1] if i else 0.0
+        below = cumulative[i - 1] if i else 0
+        in_bucket = cumulative[i] - below
+        return lower + (self.buckets[i] - lower) * ((rank - below) / in_bucket if in_bucket else 0)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (count, total, cumulative) in sorted(self.snapshot().items()):
+            labels = _labels(self.labels, key)
+            for bound, c in zip(self.buckets + ("+Inf",), cumulative):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{{{labels + ',' if labels else ''}{le}}} {c}")
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total:.6f}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.snapshot().items()):
+            labels = _labels(self.labels, key)
+            lines.append(f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+# -----------------------------
+# Метрики бота
+# -----------------------------
+handler_seconds = Histogram("bot_handler_seconds", "Handler latency", ("handler",))
+handler_db_queries = Histogram("bot_handler_db_queries", "SQL statements per handler call", ("handler",), COUNT_BUCKETS)
+handler_errors = Counter("bot_handler_errors_total", "Handler calls that raised", ("handler",))
+update_seconds = Histogram("bot_update_seconds", "Whole update latency by entry handler", ("handler",))
+update_db_queries = Histogram("bot_update_db_queries", "SQL statements per update", ("handler",), COUNT_BUCKETS)
+db_call_seconds = Histogram("bot_db_call_seconds", "db.py function latency via db_async (incl. executor wait)", ("function",))
+db_executor_wait_seconds = Histogram("bot_db_executor_wait_seconds", "Time a db call waited for a free executor thread")
+db_query_seconds = Histogram("bot_db_query_seconds", "Single SQL statement latency", ("statement",))
+db_pool_wait_seconds = Histogram("bot_db_pool_wait_seconds", "Time to get a connection from the pool")
+telegram_api_seconds = Histogram("bot_telegram_api_seconds", "Bot API call latency", ("method",))
+telegram_api_errors = Counter("bot_telegram_api_errors_total", "Bot API calls that failed or returned HTTP >= 400", ("method",))
+
+REGISTRY = [
+    handler_seconds, handler_db_queries, handler_errors, update_seconds, update_db_queries,
+    db_call_seconds, db_executor_wait_seconds, db_query_seconds, db_pool_wait_seconds,
+    telegram_api_seconds, telegram_api_errors,
+]
+# Додаткові gauge-значення: name -> (help, функція без аргументів, що повертає число)
+_gauges = {}
+
+def register_gauge(name, help, fn):
+    _gauges[name] = (help, fn)
+
+
+# -----------------------------
+# Облік поточного апдейту
+# -----------------------------
+class UpdateStats:
+    """Лічильники одного апдейту; db_async копіює контекст у потік БД, тож запити рахуються і там."""
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current = contextvars.ContextVar("metrics_update_stats", default=None)
+
+
+def timed(fn):
+    """
+    Декоратор для async-хендлерів: латентність і кількість SQL-запитів на виклик.
+    Найзовнішній хендлер апдейту також пише bot_update_* з власним ім'ям.
+    """
+    if not METRICS_ENABLED:
+        return fn
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        stats = _current.get()
+        token = None
+        if stats is None:
+            stats = UpdateStats()
+            token = _current.set(stats)
+        queries_before = stats.queries
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            handler_seconds.observe(elapsed, name)
+            handler_db_queries.observe(stats.queries - queries_before, name)
+            if token is not None:
+                update_seconds.observe(elapsed, name)
+                update_db_queries.observe(stats.queries, name)
+                _current.reset(token)
+    return wrapper
+
+
+@contextlib.contextmanager
+def collect():
+    """Окремий UpdateStats для блоку коду (bench/): запити всередині рахуються в нього, а не в апдейт."""
+    stats = UpdateStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def observe_query(sql, elapsed):
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    db_query_seconds.observe(elapsed, _statement_kind(sql))
+
+
+def _statement_kind(sql):
+    """Перше ключове слово запиту (SELECT/INSERT/…) — обмежена кількість міток."""
+    if isinstance(sql, bytes):
+        sql = sql[:32].decode("utf-8", "replace")
+    elif not isinstance(sql, str):
+        return "OTHER"
+    words = sql.lstrip().split(None, 1)
+    kind = words[0].upper() if words else ""
+    return kind if kind in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "COPY", "CREATE") else "OTHER"
+
+
+# -----------------------------
+# Експорт
+# -----------------------------
+def render_prometheus():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    for name, (help, fn) in sorted(_gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            continue
+        lines.extend([f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Запускає /metrics у фоновому потоці; повертає сервер або None, якщо порт не задано."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"✅ Метрики Prometheus: http://{host}:{port}/metrics")
+    return server
+
+
+def summary(metric, top=10, sort_by="p95"):
+    """Рядки (мітка, count, mean, p50, p95) для /stats, найповільніші першими."""
+    rows = []
+    for key, (count, total, cumulative) in metric.snapshot().items():
+        if not count:
+            continue
+        rows.append((
+            "/".join(map(str, key)) or "—", count, total / count,
+            metric.quantile(0.5, cumulative), metric.quantile(0.95, cumulative),
+        ))
+    index = {"p95": 4, "mean": 2, "count": 1}[sort_by]
+    rows.sort(key=lambda r: r[index], reverse=True)
+    return rows[:top]
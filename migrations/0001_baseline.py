@@ -0,0 +1,173 @@
+"""
+Базова схема — те, що раніше створював init_db() при кожному запуску.
+Усе через IF NOT EXISTS, тож на вже наявній базі міграція лише записує версію 1.
+"""
+
+
+def upgrade(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGINT PRIMARY KEY,
+            username TEXT,
+            display_name TEXT,
+            score INTEGER DEFAULT 0,
+            topic TEXT,
+            last_daily DATE,
+            feedbacks INTEGER DEFAULT 0,
+            all_tasks_completed INTEGER DEFAULT 0,
+            topics_total INTEGER DEFAULT 0,
+            topics_completed INTEGER DEFAULT 0,
+            last_activity DATE,
+            streak_days INTEGER DEFAULT 0,
+            city TEXT,
+            phone_number TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            id SERIAL PRIMARY KEY,
+            category TEXT,
+            topic TEXT NOT NULL,
+            level TEXT NOT NULL,
+            task_type TEXT,
+            question TEXT NOT NULL,
+            answer JSONB NOT NULL,
+            explanation TEXT,
+            photo TEXT,
+            is_daily BOOLEAN DEFAULT FALSE
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS completed_tasks (
+            user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            task_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+            PRIMARY KEY (user_id, task_id)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS feedback (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(id) ON DELETE SET NULL,
+            username TEXT,
+            message TEXT,
+            timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS badges (
+            user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            badge TEXT NOT NULL,
+            PRIMARY KEY (user_id, badge)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_topic_streaks (
+            user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            topic   TEXT    NOT NULL,
+            streak  INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, topic)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_topic_streak_awards (
+            user_id   BIGINT  NOT NULL,
+            topic     TEXT    NOT NULL,
+            milestone INTEGER NOT NULL,
+            PRIMARY KEY (user_id, topic, milestone),
+            FOREIGN KEY (user_id, topic) REFERENCES user_topic_streaks(user_id, topic) ON DELETE CASCADE
+        )
+    """)
+
+    # Версія каталогу задач: інкрементується при кожній зміні tasks,
+    # щоб інші процеси бота скинули свій CatalogueCache
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS catalogue_version (
+            id      SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            version BIGINT   NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("INSERT INTO catalogue_version (id, version) VALUES (1, 0) ON CONFLICT DO NOTHING")
+
+    # Стан діалогів (context.user_data), див. persistence.py
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            user_id    BIGINT PRIMARY KEY,
+            data       JSONB NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Лічильники прогресу: скільки задач у (topic, level) і скільки з них виконав користувач.
+    # Оновлюються інкрементально, тож вартість виконання задачі не залежить від розміру каталогу.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS task_level_totals (
+            topic TEXT    NOT NULL,
+            level TEXT    NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (topic, level)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_level_progress (
+            user_id BIGINT  NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            topic   TEXT    NOT NULL,
+            level   TEXT    NOT NULL,
+            done    INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, topic, level)
+        )
+    """)
+
+    # Розсилки (broadcast.py): кампанія + стан доставки кожному отримувачу,
+    # щоб після рестарту продовжити з місця зупинки
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_campaigns (
+            id          SERIAL PRIMARY KEY,
+            key         TEXT UNIQUE,
+            message     TEXT NOT NULL,
+            status      TEXT NOT NULL DEFAULT 'pending',
+            created_at  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            started_at  TIMESTAMP WITH TIME ZONE,
+            finished_at TIMESTAMP WITH TIME ZONE
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            campaign_id INTEGER NOT NULL REFERENCES broadcast_campaigns(id) ON DELETE CASCADE,
+            user_id     BIGINT  NOT NULL,
+            status      TEXT    NOT NULL DEFAULT 'pending',
+            attempts    INTEGER NOT NULL DEFAULT 0,
+            error       TEXT,
+            updated_at  TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (campaign_id, user_id)
+        )
+    """)
+
+    # Indexes
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_topic_daily ON tasks (topic, is_daily)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_topic_daily_id ON tasks (topic, is_daily, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_topic_level ON tasks (topic, level)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_category ON tasks (category)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_feedback_user_time ON feedback (user_id, timestamp DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_completed_task ON completed_tasks (task_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_is_daily ON tasks (is_daily)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_streak_awards_user_topic ON user_topic_streak_awards (user_id, topic)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_answer_gin ON tasks USING GIN (answer)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_pending ON broadcast_deliveries (campaign_id, user_id) WHERE status = 'pending'")
+
+    # Перший запуск з лічильниками на вже наповненій базі — заповнюємо їх
+    cur.execute("""
+        SELECT NOT EXISTS (SELECT 1 FROM task_level_totals)
+           AND EXISTS (SELECT 1 FROM tasks WHERE is_daily = FALSE)
+    """)
+    if cur.fetchone()[0]:
+        cur.execute("""
+            INSERT INTO task_level_totals (topic, level, total)
+            SELECT topic, level, COUNT(*) FROM tasks WHERE is_daily = FALSE GROUP BY topic, level
+        """)
+        cur.execute("""
+            INSERT INTO user_level_progress (user_id, topic, level, done)
+            SELECT c.user_id, t.topic, t.level, COUNT(*)
+            FROM completed_tasks c JOIN tasks t ON t.id = c.task_id
+            WHERE t.is_daily = FALSE
+            GROUP BY c.user_id, t.topic, t.level
+        """)
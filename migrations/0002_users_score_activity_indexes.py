@@ -0,0 +1,18 @@
+"""
+Індекси для рейтингу і вибірок за активністю, без блокування запису (CONCURRENTLY):
+
+  users (score DESC, id)  — get_top_users, get_user_rank, експорт у порядку рейтингу;
+  users (last_activity)   — get_users_for_reengagement, експорт з фільтром активності.
+
+Для з'єднань completed_tasks з users/tasks за user_id окремий індекс не потрібен:
+первинний ключ (user_id, task_id) вже починається з user_id.
+"""
+from migrations import create_index_concurrently
+
+atomic = False
+
+
+def upgrade(cur):
+    create_index_concurrently(cur, "idx_users_score", "users (score DESC, id)")
+    create_index_concurrently(cur, "idx_users_last_activity", "users (last_activity)")
+    cur.execute("ANALYZE users")
@@ -0,0 +1,49 @@
+"""
+Перерахунок users.all_tasks_completed / topics_total / topics_completed з лічильників прогресу.
+
+Прапорці оновлюються лише під час виконання задачі, тож у неактивних користувачів
+вони застаріли після змін каталогу. Онлайн, пачками за users.id; рядки, де
+нічого не змінилось, не переписуються.
+"""
+from migrations import backfill
+
+atomic = False
+
+BATCH_SQL = """
+    WITH batch AS (
+        SELECT id FROM users WHERE id > %(after)s ORDER BY id LIMIT %(limit)s
+    ), t AS (
+        SELECT COALESCE(SUM(total), 0) AS total_tasks,
+               COUNT(DISTINCT topic) FILTER (WHERE total > 0 AND topic != '') AS topics_total
+        FROM task_level_totals
+    ), u AS (
+        SELECT p.user_id,
+               SUM(p.done) AS done_tasks,
+               COUNT(DISTINCT p.topic) FILTER (WHERE p.done > 0 AND p.topic != '') AS topics_done
+        FROM user_level_progress p
+        JOIN task_level_totals tt ON tt.topic = p.topic AND tt.level = p.level AND tt.total > 0
+        WHERE p.user_id IN (SELECT id FROM batch)
+        GROUP BY p.user_id
+    ), fresh AS (
+        SELECT b.id,
+               CASE WHEN t.total_tasks > 0 AND COALESCE(u.done_tasks, 0) >= t.total_tasks THEN 1 ELSE 0 END AS all_done,
+               t.topics_total,
+               COALESCE(u.topics_done, 0) AS topics_done
+        FROM batch b CROSS JOIN t LEFT JOIN u ON u.user_id = b.id
+    ), changed AS (
+        UPDATE users SET
+            all_tasks_completed = f.all_done,
+            topics_total = f.topics_total,
+            topics_completed = f.topics_done
+        FROM fresh f
+        WHERE users.id = f.id
+          AND (users.all_tasks_completed, users.topics_total, users.topics_completed)
+              IS DISTINCT FROM (f.all_done, f.topics_total, f.topics_done)
+        RETURNING 1
+    )
+    SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM changed)
+"""
+
+
+def upgrade(cur):
+    backfill(cur, BATCH_SQL, start=-(2 ** 63 - 1))
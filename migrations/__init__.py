@@ -0,0 +1,233 @@
+"""
+Версійні міграції схеми.
+
+Кожна міграція — модуль NNNN_назва.py у цьому пакеті з функцією upgrade(cur)
+і прапорцем atomic (за замовчуванням True):
+
+  atomic = True  — уся міграція в одній транзакції (BEGIN … COMMIT);
+  atomic = False — кожен оператор комітиться окремо: CREATE INDEX CONCURRENTLY
+                   і backfill() пачками не можуть виконуватись у транзакції.
+                   Такі міграції мають бути ідемпотентними — після збою
+                   вони перезапускаються з початку.
+
+Застосовані версії записуються в schema_migrations. migrate() спершу читає
+поточну версію одним запитом і, якщо схема актуальна, нічого більше не робить;
+інакше бере pg_advisory_lock, щоб кілька реплік не мігрували одночасно.
+
+    python -m migrations            # застосувати нові міграції
+    python -m migrations status     # що застосовано і що ні
+"""
+import os
+import re
+import time
+import pkgutil
+import importlib
+import logging
+
+import psycopg2
+from psycopg2 import errors, extensions
+
+import db
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+# Ключ pg_advisory_lock, спільний для всіх реплік бота
+MIGRATIONS_LOCK_KEY = 720_451_001
+# Рядків на одну пачку backfill() і пауза між пачками (щоб не забивати WAL і репліки)
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+MIGRATION_BATCH_PAUSE = float(os.getenv("MIGRATION_BATCH_PAUSE", "0.05"))
+
+_MODULE_NAME = re.compile(r"^(\d{4})_(\w+)$")
+
+
+class Migration:
+    """Модуль міграції імпортується лише перед застосуванням: перевірка версії читає тільки імена файлів."""
+
+    def __init__(self, version, name):
+        self.version = version
+        self.name = name
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            self._module = importlib.import_module(f"{__name__}.{self.version:04d}_{self.name}")
+        return self._module
+
+    @property
+    def atomic(self):
+        return getattr(self.module, "atomic", True)
+
+    def __repr__(self):
+        return f"Migration({self.version:04d}_{self.name})"
+
+
+def discover():
+    """Усі міграції пакета, впорядковані за номером."""
+    found = {}
+    for info in pkgutil.iter_modules(__path__):
+        m = _MODULE_NAME.match(info.name)
+        if not m:
+            continue
+        version = int(m.group(1))
+        if version in found:
+            raise RuntimeError(f"Дві міграції з номером {version:04d}: {found[version].name} і {m.group(2)}")
+        found[version] = Migration(version, m.group(2))
+    return [found[v] for v in sorted(found)]
+
+
+# -----------------------------
+# Версія схеми
+# -----------------------------
+def current_version(cur):
+    """Остання застосована версія; 0 — база ще без schema_migrations. Один SELECT."""
+    try:
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    except errors.UndefinedTable:
+        return 0
+    return cur.fetchone()[0]
+
+
+def _create_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version     INTEGER PRIMARY KEY,
+            name        TEXT    NOT NULL,
+            applied_at  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INTEGER NOT NULL
+        )
+    """)
+
+
+def _record(cur, migration, started):
+    cur.execute(
+        "INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%s, %s, %s)",
+        (migration.version, migration.name, int((time.perf_counter() - started) * 1000)),
+    )
+
+
+def _apply(cur, migration):
+    logger.info(f"Міграція {migration.version:04d}_{migration.name}...")
+    started = time.perf_counter()
+    if migration.atomic:
+        cur.execute("BEGIN")
+        try:
+            migration.module.upgrade(cur)
+            _record(cur, migration, started)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    else:
+        migration.module.upgrade(cur)
+        _record(cur, migration, started)
+    logger.info(f"✅ Міграція {migration.version:04d}_{migration.name}: {time.perf_counter() - started:.1f} с")
+
+
+def migrate(target=None):
+    """
+    Доводить схему до target (за замовчуванням — до останньої міграції).
+    Повертає версію схеми після виконання.
+    """
+    migrations = discover()
+    if target is None:
+        target = migrations[-1].version if migrations else 0
+
+    # autocommit: транзакціями керують _apply() і самі міграції
+    with db.connect(readonly=True) as con:
+        cur = con.cursor()
+        version = current_version(cur)
+        if version >= target:
+            logger.info(f"✅ Схема бази даних актуальна (версія {version}).")
+            return version
+
+        logger.info(f"Схема бази даних: версія {version}, потрібна {target}. Очікування блокування міграцій...")
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_KEY,))
+        try:
+            _create_version_table(cur)
+            # Поки чекали на блокування, інша репліка могла вже все застосувати
+            version = current_version(cur)
+            for migration in migrations:
+                if version < migration.version <= target:
+                    _apply(cur, migration)
+                    version = migration.version
+        finally:
+            try:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,))
+            except psycopg2.Error as e:
+                # Блокування сесійне: зламане з'єднання закриється і звільнить його
+                logger.warning(f"Не вдалося зняти блокування міграцій: {e}")
+    logger.info(f"✅ Схема бази даних оновлена до версії {version}.")
+    return version
+
+
+def status():
+    """[(версія, назва, applied_at або None)] для всіх відомих міграцій."""
+    with db.connect(readonly=True) as con:
+        cur = con.cursor()
+        applied = {}
+        if current_version(cur):
+            cur.execute("SELECT version, applied_at FROM schema_migrations")
+            applied = dict(cur.fetchall())
+    return [(m.version, m.name, applied.get(m.version)) for m in discover()]
+
+
+# -----------------------------
+# Помічники для неатомарних міграцій
+# -----------------------------
+def _require_autocommit(cur, what):
+    con = cur.connection
+    if not con.autocommit or con.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        raise RuntimeError(f"{what} не можна виконувати в транзакції — оголосіть у міграції atomic = False")
+
+
+def create_index_concurrently(cur, name, definition, unique=False):
+    """
+    CREATE INDEX CONCURRENTLY без блокування запису в таблицю.
+    Перервана побудова лишає індекс INVALID — такий видаляється і будується заново.
+    """
+    _require_autocommit(cur, "CREATE INDEX CONCURRENTLY")
+    cur.execute("""
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND pg_table_is_visible(c.oid)
+    """, (name,))
+    row = cur.fetchone()
+    if row and row[0]:
+        return
+    if row:
+        logger.warning(f"Індекс {name} лишився INVALID після перерваної побудови — перебудова.")
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    cur.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY {name} ON {definition}")
+
+
+def backfill(cur, sql, start, batch_size=None, pause=None):
+    """
+    Онлайн-заповнення пачками за ключем, кожна пачка — окрема коротка транзакція.
+
+    sql отримує параметри %(after)s і %(limit)s, обробляє наступні limit рядків
+    з ключем більшим за after і повертає один рядок (останній ключ пачки, змінено рядків);
+    останній ключ NULL — рядків більше немає. Повертає загальну кількість змінених рядків.
+    """
+    _require_autocommit(cur, "backfill()")
+    batch_size = batch_size or MIGRATION_BATCH_SIZE
+    pause = MIGRATION_BATCH_PAUSE if pause is None else pause
+    after, total, batches = start, 0, 0
+    started = time.perf_counter()
+    while True:
+        cur.execute(sql, {"after": after, "limit": batch_size})
+        last, changed = cur.fetchone()
+        if last is None:
+            break
+        after = last
+        total += changed
+        batches += 1
+        if batches % 100 == 0:
+            logger.info(f"  backfill: {batches} пачок, змінено {total} рядків, {time.perf_counter() - started:.0f} с")
+        if pause:
+            time.sleep(pause)
+    return total
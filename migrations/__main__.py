@@ -0,0 +1,19 @@
+import sys
+
+from migrations import migrate, status
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    if command == "migrate":
+        migrate()
+    elif command == "status":
+        for version, name, applied_at in status():
+            print(f"{version:04d}_{name:<40} {applied_at or '— не застосовано'}")
+    else:
+        print("Використання: python -m migrations [migrate|status]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import os
+import json
+import asyncio
+import logging
+import datetime
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from db_async import load_conversation_state, save_conversation_states, get_task_by_id
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+# PERSISTENCE=postgres — зберігати context.user_data у таблиці conversation_state
+USE_PG_PERSISTENCE = os.getenv("PERSISTENCE") == "postgres"
+# PERSISTENCE_SHARED=1 — кілька реплік: перед кожним апдейтом стан користувача перечитується з БД
+PERSISTENCE_SHARED = os.getenv("PERSISTENCE_SHARED") == "1"
+# Як часто Application скидає змінені user_data (сек.)
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "10"))
+
+
+# -----------------------------
+# Компактна серіалізація
+# -----------------------------
+def _encode_default(obj):
+    if isinstance(obj, (set, frozenset)):
+        try:
+            return {"$set": sorted(obj)}
+        except TypeError:
+            return {"$set": list(obj)}
+    if isinstance(obj, datetime.datetime):
+        return {"$dt": obj.isoformat()}
+    if isinstance(obj, datetime.date):
+        return {"$date": obj.isoformat()}
+    raise TypeError(f"Не вміємо серіалізувати {type(obj).__name__}")
+
+def _decode(obj):
+    if isinstance(obj, dict):
+        if len(obj) == 1:
+            if "$set" in obj:
+                return set(_decode(v) for v in obj["$set"])
+            if "$dt" in obj:
+                return datetime.datetime.fromisoformat(obj["$dt"])
+            if "$date" in obj:
+                return datetime.date.fromisoformat(obj["$date"])
+        return {k: _decode(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_decode(v) for v in obj]
+    return obj
+
+def pack_user_data(data):
+    """
+    user_data -> мінімізований JSON. Повний рядок задачі в solving_state['current_task']
+    замінюється на її id: задача відновлюється з кешу каталогу при завантаженні.
+    """
+    data = dict(data)
+    solving = data.get("solving_state")
+    if isinstance(solving, dict) and isinstance(solving.get("current_task"), dict):
+        solving = dict(solving)
+        solving["current_task"] = {"$task": solving["current_task"].get("id")}
+        data["solving_state"] = solving
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, sort_keys=True, default=_encode_default)
+
+async def unpack_user_data(raw):
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    data = _decode(raw or {})
+    solving = data.get("solving_state")
+    if isinstance(solving, dict) and isinstance(solving.get("current_task"), dict) and "$task" in solving["current_task"]:
+        task_id = solving["current_task"]["$task"]
+        solving["current_task"] = await get_task_by_id(task_id) if task_id is not None else None
+    return data
+
+
+class PostgresPersistence(BasePersistence):
+    """
+    Зберігає лише user_data (увесь багатокроковий стан бота) у conversation_state.
+
+    - user_data завантажується ліниво, при першому апдейті користувача, а не весь при старті;
+    - запис лише для змінених користувачів (порівняння з останнім збереженим станом);
+    - усі зміни одного циклу update_persistence пишуться одним батчем.
+    """
+
+    def __init__(self, shared=PERSISTENCE_SHARED, update_interval=PERSISTENCE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.shared = shared
+        self._loaded = set()
+        self._persisted = {}   # user_id -> hash останнього збереженого JSON
+        self._dirty = {}       # user_id -> JSON, що чекає запису
+        self._write_task = None
+
+    # -----------------------------
+    # user_data
+    # -----------------------------
+    async def get_user_data(self):
+        # Порожньо: стан кожного користувача підтягується в refresh_user_data
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        if user_id in self._dirty:
+            return  # локальні незбережені зміни новіші за БД
+        if user_id in self._loaded and not self.shared:
+            return
+        try:
+            raw = await load_conversation_state(user_id)
+        except Exception as e:
+            logger.error(f"Не вдалося завантажити стан user {user_id}: {e}")
+            return
+        self._loaded.add(user_id)
+        data = await unpack_user_data(raw) if raw else {}
+        user_data.clear()
+        user_data.update(data)
+        self._persisted[user_id] = hash(pack_user_data(user_data))
+
+    async def update_user_data(self, user_id, data):
+        packed = pack_user_data(data)
+        if self._persisted.get(user_id) == hash(packed):
+            self._dirty.pop(user_id, None)
+            return
+        self._dirty[user_id] = packed
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._write_dirty())
+
+    async def drop_user_data(self, user_id):
+        self._dirty[user_id] = "{}"
+        self._loaded.discard(user_id)
+        await self._write_dirty()
+
+    async def _write_dirty(self):
+        # Дати решті update_user_data цього циклу потрапити в той самий батч
+        await asyncio.sleep(0)
+        batch, self._dirty = self._dirty, {}
+        if not batch:
+            return
+        rows = [(uid, packed) for uid, packed in batch.items() if packed != "{}"]
+        deleted = [uid for uid, packed in batch.items() if packed == "{}"]
+        try:
+            await save_conversation_states(rows, deleted)
+        except Exception as e:
+            logger.error(f"Не вдалося зберегти стан {len(batch)} користувачів: {e}", exc_info=True)
+            for uid, packed in batch.items():
+                self._dirty.setdefault(uid, packed)
+            return
+        for uid, packed in batch.items():
+            self._persisted[uid] = hash(packed)
+
+    async def flush(self):
+        if self._write_task is not None and not self._write_task.done():
+            await self._write_task
+        if self._dirty:
+            await self._write_dirty()
+
+    # -----------------------------
+    # Не використовується ботом
+    # -----------------------------
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,174 @@
+import time
+import threading
+import logging
+import collections
+
+import psycopg2
+from psycopg2 import extensions
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+
+class PoolTimeout(Exception):
+    """Не вдалося отримати з'єднання з пулу за відведений час."""
+
+
+class PoolClosed(Exception):
+    """Пул вже закрито."""
+
+
+class BoundedConnectionPool:
+    """
+    Потокобезпечний пул з'єднань psycopg2 з обмеженим розміром.
+
+    - getconn() чекає на вільне з'єднання до `timeout` секунд замість миттєвої помилки;
+    - перевірка `SELECT 1` виконується лише для з'єднань, що простоювали довше
+      `idle_check_after` секунд;
+    - stats() повертає метрики для підбору розміру пулу.
+    """
+
+    def __init__(self, minconn, maxconn, *, timeout=10.0, idle_check_after=30.0, **conn_kwargs):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Некоректний розмір пулу: minconn={minconn}, maxconn={maxconn}")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.idle_check_after = idle_check_after
+        self._conn_kwargs = conn_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = collections.deque()  # (con, last_used) — LIFO, щоб брати «теплі» з'єднання
+        self._opened = 0
+        self._in_use = 0
+        self._closed = False
+
+        # --- метрики ---
+        self._checkouts = 0
+        self._timeouts = 0
+        self._broken = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(minconn):
+            self._idle.append((self._new_conn(), time.monotonic()))
+            self._opened += 1
+
+    # -----------------------------
+    # Internal helpers
+    # -----------------------------
+    def _new_conn(self):
+        return psycopg2.connect(**self._conn_kwargs)
+
+    @staticmethod
+    def _close_quietly(con):
+        try:
+            con.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_alive(con):
+        if con.closed:
+            return False
+        try:
+            with con.cursor() as cur:
+                cur.execute("SELECT 1")
+            con.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        con, last_used = None, None
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolClosed("Пул з'єднань закрито.")
+                if self._idle:
+                    con, last_used = self._idle.pop()
+                    break
+                if self._opened < self.maxconn:
+                    # Резервуємо слот, саме з'єднання відкриваємо поза блокуванням
+                    self._opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"Немає вільних з'єднань протягом {timeout:.1f} с (maxconn={self.maxconn}).")
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - started
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._in_use += 1
+
+        try:
+            if con is not None and time.monotonic() - last_used > self.idle_check_after and not self._is_alive(con):
+                logger.info("Пул: з'єднання після простою неживе, відкриваємо нове.")
+                self._close_quietly(con)
+                with self._cond:
+                    self._broken += 1
+                con = None
+            if con is None:
+                con = self._new_conn()
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return con
+
+    def putconn(self, con, close=False):
+        if not close and not con.closed:
+            try:
+                if con.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    con.rollback()
+            except Exception:
+                close = True
+
+        with self._cond:
+            self._in_use -= 1
+            if close or con.closed or self._closed:
+                if close:
+                    self._broken += 1
+                self._opened -= 1
+                self._close_quietly(con)
+            else:
+                self._idle.append((con, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                con, _ = self._idle.pop()
+                self._close_quietly(con)
+                self._opened -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "maxconn": self.maxconn,
+                "open": self._opened,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "checkouts_total": self._checkouts,
+                "timeouts_total": self._timeouts,
+                "broken_total": self._broken,
+                "wait_seconds_total": self._wait_total,
+                "wait_seconds_max": self._wait_max,
+            }
@@ -0,0 +1,353 @@
+import os
+import io
+import csv
+import html
+import json
+import logging
+import zipfile
+import tempfile
+
+import db
+import db_async
+from handlers.utils import CATEGORIES, LEVELS, TYPE_BUTTONS
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+# Скільки задач максимум в одному файлі імпорту
+TASK_IMPORT_MAX_ROWS = int(os.getenv("TASK_IMPORT_MAX_ROWS", "20000"))
+# Скільки помилок перелічувати у звіті (решта — лише кількістю)
+TASK_IMPORT_MAX_ERRORS = 20
+# Файл для COPY: до цього розміру в пам'яті, далі на диску
+TASK_IMPORT_SPOOL_SIZE = 4 * 1024 * 1024
+
+TASK_TYPES = set(TYPE_BUTTONS.values())
+DAILY_CATEGORY = "Щоденні"
+_LEVELS = {level.lower(): level for level in LEVELS}
+_TRUE = {"1", "true", "yes", "так", "+", "y"}
+_FALSE = {"", "0", "false", "no", "ні", "-", "n"}
+# Зображення всередині ZIP, на які можна посилатися в стовпці photo
+_IMAGE_EXT = (".jpg", ".jpeg", ".png", ".webp")
+
+
+class TaskImportError(Exception):
+    """Файл не можна імпортувати взагалі (формат, розмір); текст — для адміна."""
+
+
+class ImportFile:
+    """
+    Прочитаний файл імпорту: задачі як dict-и (у порядку файлу) та, для ZIP, архів із фото.
+    Рядки читаються лише під час validate(), одним проходом.
+    """
+
+    def __init__(self, rows, archive=None):
+        self.rows = rows            # ітератор (line, dict)
+        self.archive = archive      # zipfile.ZipFile або None
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+
+# -----------------------------
+# Читання форматів
+# -----------------------------
+def _csv_rows(binary):
+    text = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    if not reader.fieldnames or "question" not in [f.strip().lower() for f in reader.fieldnames]:
+        raise TaskImportError("CSV має містити рядок заголовка зі стовпцями topic, level, question, answer …")
+    for n, row in enumerate(reader, start=2):
+        yield n, {(k or "").strip().lower(): v for k, v in row.items()}
+
+
+def _json_rows(binary):
+    try:
+        data = json.load(io.TextIOWrapper(binary, encoding="utf-8-sig"))
+    except ValueError as e:
+        raise TaskImportError(f"Некоректний JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get("tasks")
+    if not isinstance(data, list):
+        raise TaskImportError("JSON має бути списком задач або об'єктом {\"tasks\": [...]}.")
+    for n, item in enumerate(data, start=1):
+        yield n, item if isinstance(item, dict) else {"__invalid__": item}
+
+
+def open_import_file(binary, filename):
+    """binary — файл, відкритий на читання в байтах (seekable для ZIP)."""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return ImportFile(_csv_rows(binary))
+    if name.endswith(".json"):
+        return ImportFile(_json_rows(binary))
+    if name.endswith(".zip"):
+        try:
+            archive = zipfile.ZipFile(binary)
+        except zipfile.BadZipFile:
+            raise TaskImportError("Пошкоджений ZIP-архів.")
+        listed = [n for n in archive.namelist() if n.lower().endswith((".csv", ".json")) and not n.startswith("__MACOSX")]
+        if len(listed) != 1:
+            archive.close()
+            raise TaskImportError("ZIP має містити рівно один .csv або .json із задачами (і, за потреби, фото).")
+        inner = archive.open(listed[0])
+        rows = _csv_rows(inner) if listed[0].lower().endswith(".csv") else _json_rows(inner)
+        return ImportFile(rows, archive)
+    raise TaskImportError("Підтримуються файли .csv, .json або .zip.")
+
+
+# -----------------------------
+# Перевірка
+# -----------------------------
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _parse_answer(value):
+    if isinstance(value, list):
+        answers = [str(a).strip() for a in value]
+    elif isinstance(value, (int, float)):
+        answers = [str(value)]
+    elif value is None or isinstance(value, str):
+        value = (value or "").strip()
+        if value.startswith("["):
+            parsed = json.loads(value)
+            if not isinstance(parsed, list):
+                raise ValueError
+            answers = [str(a).strip() for a in parsed]
+        else:
+            # Як у діалозі додавання задачі: відповіді через кому
+            answers = [a.strip() for a in value.split(",")]
+    else:
+        # Об'єкт у JSON-файлі тощо — помилка цього рядка, а не всього файлу
+        raise ValueError
+    return [a for a in answers if a]
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value if value is not None else "").strip().lower()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    raise ValueError
+
+
+def _validate_row(raw, archive_names):
+    """Повертає (task dict, None) або (None, текст помилки)."""
+    if "__invalid__" in raw:
+        return None, "задача має бути об'єктом"
+    task = {
+        "category": _text(raw.get("category")),
+        "topic": _text(raw.get("topic")),
+        "level": _LEVELS.get((_text(raw.get("level")) or "").lower()),
+        "task_type": _text(raw.get("task_type") or raw.get("type")),
+        "question": _text(raw.get("question")),
+        "explanation": _text(raw.get("explanation")),
+        "photo": _text(raw.get("photo")),
+    }
+    if not task["topic"]:
+        return None, "порожня тема (topic)"
+    if not task["level"]:
+        return None, f"рівень має бути одним із: {', '.join(LEVELS)}"
+    if not task["question"]:
+        return None, "порожнє питання (question)"
+    if task["task_type"] is not None:
+        task["task_type"] = TYPE_BUTTONS.get(task["task_type"], task["task_type"])
+        if task["task_type"] not in TASK_TYPES:
+            return None, f"невідомий тип «{task['task_type']}» (можливі: {', '.join(sorted(TASK_TYPES))})"
+    try:
+        task["answer"] = _parse_answer(raw.get("answer"))
+    except ValueError:
+        return None, "answer — має бути рядком, числом або JSON-масивом"
+    if not task["answer"]:
+        return None, "порожня відповідь (answer)"
+    try:
+        task["is_daily"] = _parse_bool(raw.get("is_daily"))
+    except ValueError:
+        return None, "is_daily має бути true/false"
+    if task["is_daily"] and not task["category"]:
+        task["category"] = DAILY_CATEGORY
+    if task["category"] and task["category"] not in CATEGORIES and task["category"] != DAILY_CATEGORY:
+        return None, f"невідома категорія «{task['category']}»"
+    if task["photo"] and task["photo"].lower().endswith(_IMAGE_EXT) and "://" not in task["photo"]:
+        if task["photo"] not in archive_names:
+            return None, f"фото «{task['photo']}» не знайдено в архіві"
+        task["zip_photo"] = task["photo"]
+    return task, None
+
+
+class ValidationResult:
+    def __init__(self):
+        self.copy_file = tempfile.SpooledTemporaryFile(max_size=TASK_IMPORT_SPOOL_SIZE, mode="w+b")
+        self.rows = 0
+        self.errors = []            # (line, текст) — перші TASK_IMPORT_MAX_ERRORS
+        self.error_count = 0
+        self.zip_photos = {}        # ім'я в архіві -> [рядки файлу, що на нього посилаються]
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < TASK_IMPORT_MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def close(self):
+        self.copy_file.close()
+
+
+def validate(import_file, photo_ids=None):
+    """
+    Один прохід по рядках: перевірка і одразу запис у CSV-файл для COPY (db.TASK_IMPORT_COLUMNS).
+    photo_ids — {ім'я фото в ZIP: file_id}; без нього для фото з архіву пишеться "zip:<ім'я>".
+    """
+    result = ValidationResult()
+    archive_names = set(import_file.archive.namelist()) if import_file.archive else set()
+    text = io.TextIOWrapper(result.copy_file, encoding="utf-8", newline="", write_through=False)
+    writer = csv.writer(text)
+    seen = {}
+    try:
+        for line, raw in import_file.rows:
+            if result.rows + result.error_count >= TASK_IMPORT_MAX_ROWS:
+                raise TaskImportError(f"Забагато задач в одному файлі (більше {TASK_IMPORT_MAX_ROWS}).")
+            task, error = _validate_row(raw, archive_names)
+            if error:
+                result.error(line, error)
+                continue
+            key = (task["topic"], task["level"], task["is_daily"], task["question"])
+            if key in seen:
+                result.error(line, f"дублює задачу з рядка {seen[key]}")
+                continue
+            seen[key] = line
+
+            zip_photo = task.get("zip_photo")
+            if zip_photo:
+                result.zip_photos.setdefault(zip_photo, []).append(line)
+                task["photo"] = (photo_ids or {}).get(zip_photo, f"zip:{zip_photo}")
+            writer.writerow([
+                line, task["category"], task["topic"], task["level"], task["task_type"], task["question"],
+                json.dumps(task["answer"], ensure_ascii=False), task["explanation"], task["photo"],
+                "t" if task["is_daily"] else "f",
+            ])
+            result.rows += 1
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        text.detach()
+        result.close()
+        raise TaskImportError(f"Не вдалося прочитати файл: {e}")
+    except Exception:
+        text.detach()
+        result.close()
+        raise
+    text.flush()
+    text.detach()
+    result.copy_file.seek(0)
+    return result
+
+
+# -----------------------------
+# Telegram
+# -----------------------------
+# Bot API віддає ботам файли до 20 МБ
+TASK_IMPORT_MAX_BYTES = 20 * 1024 * 1024
+
+async def download_document(bot, file_id):
+    """Завантажує документ у SpooledTemporaryFile (великий — на диск), повертає його на початку."""
+    tg_file = await bot.get_file(file_id)
+    spool = tempfile.SpooledTemporaryFile(max_size=TASK_IMPORT_SPOOL_SIZE, mode="w+b")
+    try:
+        await tg_file.download_to_memory(out=spool)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+# -----------------------------
+# Фото з ZIP
+# -----------------------------
+async def upload_zip_photos(bot, chat_id, archive, names):
+    """
+    Фото з архіву треба один раз надіслати в Telegram, щоб отримати file_id
+    (у tasks.photo зберігаються file_id/URL). Надсилаються в чат адміна, який імпортує.
+    """
+    photo_ids = {}
+    for name in sorted(names):
+        with archive.open(name) as f:
+            message = await bot.send_photo(chat_id=chat_id, photo=f.read(), caption=f"📎 {name}",
+                                           disable_notification=True)
+        photo_ids[name] = message.photo[-1].file_id
+    return photo_ids
+
+
+# -----------------------------
+# Повний цикл
+# -----------------------------
+def format_report(result, report, dry_run):
+    lines = ["🔍 <b>Перевірка імпорту (нічого не змінено)</b>" if dry_run else "✅ <b>Імпорт завершено</b>", ""]
+    lines.append(f"Коректних задач: <b>{result.rows}</b>, з помилками: <b>{result.error_count}</b>")
+    if report is not None:
+        lines.append(f"➕ Нових: <b>{report['inserted']}</b>")
+        lines.append(f"✏️ Оновиться: <b>{report['updated']}</b>" if dry_run else f"✏️ Оновлено: <b>{report['updated']}</b>")
+        lines.append(f"⏸ Без змін: <b>{report['unchanged']}</b>")
+        for (topic, level, is_daily), n in sorted(report["by_level"].items()):
+            daily = " (щоденні)" if is_daily else ""
+            lines.append(f"   • {html.escape(topic)} / {level}{daily}: +{n}")
+    if result.zip_photos:
+        lines.append(f"🖼 Фото з архіву: {len(result.zip_photos)}" + (" (завантажаться під час імпорту)" if dry_run else ""))
+    if result.errors:
+        lines.append("")
+        lines.append("<b>Помилки</b> (рядок: опис):")
+        lines.extend(f"  {line}: {html.escape(message)}" for line, message in result.errors)
+        if result.error_count > len(result.errors):
+            lines.append(f"  … і ще {result.error_count - len(result.errors)}")
+    return "\n".join(lines)
+
+
+def _validate_file(binary, filename, photo_ids=None):
+    import_file = open_import_file(binary, filename)
+    try:
+        return validate(import_file, photo_ids)
+    finally:
+        import_file.close()
+
+
+def _load(result, dry_run):
+    if not result.rows:
+        return None
+    return db.import_tasks(result.copy_file, dry_run=dry_run)
+
+
+async def run_import(binary, filename, dry_run=True, bot=None, chat_id=None):
+    """
+    Перевіряє файл і зливає задачі з tasks (або лише рахує зміни при dry_run).
+    Повертає (текст звіту HTML, чи можна імпортувати). Файл з помилками не імпортується.
+    """
+    photo_ids = None
+    if not dry_run and filename.lower().endswith(".zip"):
+        # Перший прохід — лише щоб дізнатися, які фото з архіву використовуються
+        result = await db_async.run_sync(_validate_file, binary, filename)
+        result.close()
+        binary.seek(0)
+        if result.error_count:
+            return format_report(result, None, dry_run=True), False
+        archive = zipfile.ZipFile(binary)
+        try:
+            photo_ids = await upload_zip_photos(bot, chat_id, archive, result.zip_photos)
+        finally:
+            archive.close()
+        binary.seek(0)
+
+    result = await db_async.run_sync(_validate_file, binary, filename, photo_ids)
+    try:
+        if result.error_count:
+            return format_report(result, None, dry_run=True), False
+        report = await db_async.run_sync(_load, result, dry_run)
+        return format_report(result, report, dry_run), bool(report and (report["inserted"] or report["updated"]))
+    finally:
+        result.close()
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+# --- Налаштування логера ---
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# --- Кінець налаштування логера ---
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обробляє до `max_concurrent_updates` апдейтів одночасно, але апдейти одного
+    користувача — строго по черзі: стан у context.user_data не розходиться.
+
+    Спершу береться замок користувача, і лише потім загальний слот, тож
+    користувач, що шле багато повідомлень, не займає слоти інших.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._user_locks = {}   # key -> [asyncio.Lock, кількість очікувачів]
+
+    @staticmethod
+    def _ordering_key(update):
+        user = getattr(update, "effective_user", None)
+        if user is not None:
+            return user.id
+        chat = getattr(update, "effective_chat", None)
+        return chat.id if chat is not None else None
+
+    async def process_update(self, update, coroutine):
+        key = self._ordering_key(update)
+        if key is None:
+            async with self._slots:
+                await self.do_process_update(update, coroutine)
+            return
+
+        entry = self._user_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    await self.do_process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._user_locks.pop(key, None)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass